@@ -1,281 +1,699 @@
 #!/usr/bin/env python3
 
 
+import argparse
+import logging
+import math
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 import pandas as pd
-import json
-from lasso_auth import LassoTokenClient
-from urllib.parse import quote
+from lasso_auth import get_token_client
+from jira_search import JiraSearchClient, DEFAULT_PAGE_SIZE, DEFAULT_PREFETCH
+from query_executor import QueryExecutor, DEFAULT_MAX_WORKERS
+from query_cache import QueryCache
+from issue_mirror import IssueMirror, DEFAULT_MIRROR_PATH
+from changelog_store import (ChangelogStore, summarize_time_in_status, DEFAULT_CHANGELOG_PATH, DEFAULT_DONE_STATUSES,
+                             DEFAULT_CHANGELOG_WORKERS)
+from priority_classifier import PriorityClassifier
+from query_planner import QueryPlanner
+from metrics_cube import CellCube, PRIORITY_DIMENSION
+from age_aggregates import AgeAggregateStore, DEFAULT_AGGREGATE_PATH
+from report_export import WorkbookExporter, DRILL_DOWN_FIELDS
+from jql_filter import UnsupportedJQL
+from query_trace import get_default_tracer, configure_default_tracer, export_trace
+from search_snapshot import configure_snapshot_transport, release_snapshot_transport
+from defect_age_stats import AGE_STATISTICS, AgeColumns, age_days, summarize_ages, summarize_ages_by_bucket
+from report_config import (ConfigError, load_json_config, validate_date, validate_defect_age_config, split_defect_age_config,
+                           render_defect_age_queries, render_jql, require_prompt_free_args, resolve_config_path, CONFIG_SECTIONS,
+                           DEFECT_AGE_CONFIG_DIRECTORY)
 import warnings
 import os
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-
-def lasso_authenticate():
-    """
-    Authenticate using LassoTokenClient and return Jira options.
-
-    :return: Jira options dictionary
-    """
-    try:
-        lasso_client = LassoTokenClient(
-            lasso_token_url='https://api.lasso.instance.net/rest/user/token',
-            username='username',
-            password='pwd',
-            service='name'
+JIRA_SERVER = 'https://issues.labcollab.net'
+
+# Age statistics reported per bucket, "mean" fills the Resolved-Defect/Unresolved-Defect rows
+# and any of "median", "p90", "max" adds a row such as "Resolved-Defect (p90)"
+DEFAULT_REPORT_STATISTICS = ("mean",)
+
+# Directory the defect age and time in status workbooks are written to
+DEFAULT_REPORT_DIRECTORY = "defect"
+
+
+def get_lasso_token_client():
+    return get_token_client(
+        lasso_token_url='https://api.lasso.instance.net/rest/user/token',
+        username='username',
+        password='pwd',
+        service='name'
+    )
+
+
+def get_auth_headers():
+    return {'Authorization': f'Bearer {get_lasso_token_client().get_access_token()}'}
+
+
+def report_row_label(row, statistic):
+    return row if statistic == 'mean' else f"{row} ({statistic})"
+
+
+class DefectAgeReport:
+
+    # Initialize defect age report, no request is sent until the report is built,
+    # headers may be a callable returning fresh authorization headers
+    def __init__(self, queries, priority_classifier=None, query_cache=None, issue_mirror=None, page_size=DEFAULT_PAGE_SIZE,
+                 prefetch=DEFAULT_PREFETCH, max_workers=DEFAULT_MAX_WORKERS, report_statistics=DEFAULT_REPORT_STATISTICS,
+                 server=JIRA_SERVER, headers=get_auth_headers, planner_config=None, cube_config=None, age_aggregates=None,
+                 date_range=None):
+        self.queries = queries
+        # (start_date, end_date) the queries were rendered with, the age aggregates are read over it
+        self.date_range = date_range
+        self.planner_config = planner_config
+        self.cube_config = cube_config
+        self.age_aggregates = age_aggregates
+        self.report_directory = DEFAULT_REPORT_DIRECTORY
+        self.server = server
+        self.priority_classifier = priority_classifier or PriorityClassifier()
+        self.issue_mirror = issue_mirror
+        self.report_statistics = report_statistics
+        self.search_client = JiraSearchClient(
+            f'{server}/rest/api/latest/search',
+            headers=headers,
+            page_size=page_size,
+            prefetch=prefetch,
+            cache=query_cache,
+            mirror=issue_mirror
         )
+        self.query_executor = QueryExecutor(max_workers=max_workers)
 
-        jira_options = {'server': 'https://issues.labcollab.net', 'verify': True}
-        jira_access_token = lasso_client.get_access_token()
-        headers = {'Authorization': f'Bearer {jira_access_token}'}
-        jira_options['headers'] = headers
-
-        return jira_options
-    except Exception as e:
-        print(f"Lasso authentication failed: {e}")
-        return {}  
-
-jira_options = lasso_authenticate()
-
-
-# Specify the common path to the JSON files
-json_files_path = "/path/Report_Script/defect_age_json/"
-
-# Create a dictionary to map user input to JSON file names
-json_files = {
-    "Option1": "Option1.json",
-    "Option2": "Option2.json",
-}
-
-# Prompt the user for their choice of section
-while True:
-    section_choice = input("Enter the section (Option1, Option2): ").strip()
-    if section_choice in json_files:
-        json_file_name = json_files[section_choice]
-        json_file_path = f"{json_files_path}{json_file_name}"
-        break
-    print("Invalid section choice. Please choose from Option1 , Option2.")
-
-# Load the selected JSON file
-with open(json_file_path, "r") as json_file:
-    queries = json.load(json_file)
-
-
-# Prompt the user for start and end dates
-start_date = input("Enter the start date (YYYY-MM-DD): ")
-end_date = input("Enter the end date (YYYY-MM-DD): ")
-
-# Update the JQL queries in memory with the user-provided date range
-for key in queries:
-    queries[key] = [query.replace("{{start_date}}", start_date).replace("{{end_date}}", end_date)
-                    for query in queries[key]]
-    
-# Convert input dates to datetime objects
-start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
-
-# Use queries as needed in your script
-regression_resolved_queries = queries["regression_resolved_queries"]
-regression_unresolved_queries = queries["regression_unresolved_queries"]
-exploratory_resolved_queries = queries["exploratory_resolved_queries"]
-exploratory_unresolved_queries = queries["exploratory_unresolved_queries"]
+    def sync_issue_mirror(self):
+        if self.issue_mirror is None:
+            return 0
+        try:
+            return self.issue_mirror.sync(self.search_client)
+        except Exception as e:
+            logging.error("Issue mirror sync failed, querying Jira directly: %s", e)
+            self.search_client.mirror = None
+            return 0
 
+    def calculate_age_stats(self, jql_query, resolved=True):
+        """
+        Calculate age statistics of Jira issues based on the provided JQL query.
+
+        Issues are streamed into created/resolutiondate columns and aged in one vectorized pass.
+
+        :param jql_query: JQL query string
+        :param resolved: Flag indicating whether to consider resolved issues (default is True)
+        :return: Dictionary with count, mean, median, p90 and max age in days
+        """
+        return self.age_stats(self.fetch_age_issues(jql_query, ("created", "resolutiondate")), resolved)
+
+    def fetch_age_issues(self, jql_query, fields):
+        try:
+            return list(self.search_client.search(jql_query, fields=fields))
+        except requests.exceptions.RequestException as e:
+            # The failure is in the run trace, the cells are left empty so the other cells still render
+            logging.error("Jira API request failed for JQL query %s: %s", jql_query, e)
+            return None
+
+    def age_stats(self, issues, resolved=True):
+        if issues is None:
+            return dict.fromkeys(AGE_STATISTICS, float('nan'))
+        with get_default_tracer().span("age_stats"):
+            return summarize_ages(age_days(AgeColumns().extend(issues), resolved))
+
+    def age_stats_by_priority(self, issues, resolved=True):
+        priority_classifier = self.priority_classifier
+        if issues is None:
+            return {priority: dict.fromkeys(AGE_STATISTICS, float('nan')) for priority in priority_classifier.columns}
+        with get_default_tracer().span("age_stats"):
+            columns = AgeColumns(priority_classifier).extend(issues)
+            return summarize_ages_by_bucket(age_days(columns, resolved), columns.buckets, priority_classifier.columns)
+
+    def calculate_average_age(self, jql_query, resolved=True):
+        """
+        Calculate the average age of Jira issues based on the provided JQL query.
+
+        :param jql_query: JQL query string
+        :param resolved: Flag indicating whether to consider resolved issues (default is True)
+        :return: Average age in days, None when the Jira query failed
+        """
+        mean = self.calculate_age_stats(jql_query, resolved)['mean']
+        return None if math.isnan(mean) else int(mean)
+
+    def calculate_age_stats_by_priority(self, jql_query, resolved=True):
+        """
+        Calculate age statistics per priority column from a single JQL query covering every priority.
+
+        :param jql_query: JQL query string
+        :param resolved: Flag indicating whether to consider resolved issues (default is True)
+        :return: Dictionary of priority column to age statistics
+        """
+        fields = ("created", "resolutiondate", self.priority_classifier.field)
+        return self.age_stats_by_priority(self.fetch_age_issues(jql_query, fields), resolved)
+
+    def calculate_section_age_stats(self, section_queries, resolved=True):
+        """
+        Calculate age statistics per priority column for one section metric.
+
+        :param section_queries: Single JQL covering every priority, or list of per-priority JQLs
+        :param resolved: Flag indicating whether to consider resolved issues (default is True)
+        :return: Dictionary of priority column to age statistics
+        """
+        if isinstance(section_queries, str):
+            return self.calculate_age_stats_by_priority(section_queries, resolved)
+        return {priority: self.calculate_age_stats(query, resolved)
+                for priority, query in zip(self.priority_classifier.columns, section_queries)}
+
+    def create_report_layout(self):
+        columns = pd.MultiIndex.from_tuples(
+            [('Regression', priority) for priority in self.priority_classifier.columns] +
+            [('Exploratory', priority) for priority in self.priority_classifier.columns] +
+            [('Overall', '')],
+            names=['Metrics', 'Priority'])
+
+        index = [
+            report_row_label(row, statistic)
+            for row in ('Resolved-Defect', 'Unresolved-Defect')
+            for statistic in self.report_statistics
+        ]
+
+        # Float cells, statistics other than the whole-day means are fractional days
+        data = [[0.0] * len(columns) for _ in range(len(index))]
+
+        df = pd.DataFrame(data, columns=columns, index=index)
+
+        return df
+
+    def build_report(self):
+        """
+        Fill the report layout, all queries are dispatched at once.
+
+        Single-JQL metrics are fetched once and split into priority columns locally. The query
+        planner collapses identical JQL and answers narrower queries from a broader fetch.
+
+        :return: Numeric report frame
+        """
+        if self.age_aggregates is not None:
+            report_df = self.build_rolling_report()
+            if report_df is not None:
+                return report_df
+
+        if self.cube_config is not None:
+            report_df = self.build_cube_report()
+            if report_df is not None:
+                return report_df
+
+        report_df = self.create_report_layout()
+        tracer = get_default_tracer()
+
+        planner = QueryPlanner.from_config(self.planner_config)
+        resolved_rows = {}
+        for row, section_queries, resolved in self.report_rows():
+            resolved_rows[row] = resolved
+            for section, section_query in section_queries.items():
+                if isinstance(section_query, str):
+                    planner.add_search((row, section), section_query, ("created", "resolutiondate", self.priority_classifier.field))
+                else:
+                    for priority, query in zip(self.priority_classifier.columns, section_query):
+                        planner.add_search((row, section, priority), query, ("created", "resolutiondate"))
+        plan = planner.plan()
+
+        calls = {}
+        for query_key, (function, *args) in plan.calls(self.fetch_age_issues, None).items():
+            labels = dict(zip(('sub_query', 'section', 'priority'), plan.queries[query_key].job_keys[0]))
+            calls[query_key] = (tracer.bind(function, **labels), *args)
+        age_issues = plan.resolve(self.query_executor.run_calls(calls))
+
+        for job_key, issues in age_issues.items():
+            if len(job_key) == 2:
+                row, section = job_key
+                cell_stats = {(section, priority): stats
+                              for priority, stats in self.age_stats_by_priority(issues, resolved_rows[row]).items()}
+            else:
+                row, section, priority = job_key
+                cell_stats = {(section, priority): self.age_stats(issues, resolved_rows[row])}
+            for cell, stats in cell_stats.items():
+                for statistic in self.report_statistics:
+                    report_df.at[report_row_label(row, statistic), cell] = stats[statistic]
+
+        self.fill_overall(report_df)
+        return report_df
+
+    def report_rows(self, queries=None):
+        queries = self.queries if queries is None else queries
+        return [
+            ('Resolved-Defect', {'Regression': queries["regression_resolved_queries"], 'Exploratory': queries["exploratory_resolved_queries"]}, True),
+            ('Unresolved-Defect', {'Regression': queries["regression_unresolved_queries"], 'Exploratory': queries["exploratory_unresolved_queries"]}, False),
+        ]
+
+    def cell_queries(self, queries=None):
+        """
+        JQL of every report cell, a single JQL covers a whole section and is split by priority locally.
+
+        :param queries: Defect age JQL dictionary, e.g. the un-rendered templates (default is the report's queries)
+        :return: Dictionary of (row, section) or (row, section, priority) to (JQL, priority or None)
+        """
+        cell_queries = {}
+        for row, section_queries, _ in self.report_rows(queries):
+            for section, section_query in section_queries.items():
+                if isinstance(section_query, str):
+                    cell_queries[(row, section)] = (section_query, None)
+                else:
+                    for priority, query in zip(self.priority_classifier.columns, section_query):
+                        cell_queries[(row, section, priority)] = (query, priority)
+        return cell_queries
+
+    def build_cube_report(self):
+        """
+        Fill the mean rows of the report from one fetch aggregated into a metrics cube.
+
+        The cube holds age sums, not individual ages, so only the mean statistic is projected
+        from it. Unresolved ages are taken at the current time.
+
+        :return: Numeric report frame, None when the statistics or JQL need the planned queries
+        """
+        if set(self.report_statistics) != {'mean'}:
+            logging.warning("Metrics cube only holds age sums, %s need the planned queries", ", ".join(self.report_statistics))
+            return None
+
+        resolved_rows = {row: resolved for row, _, resolved in self.report_rows()}
+        cell_queries = {cell_key: (query, "created") for cell_key, (query, _) in self.cell_queries().items()}
+        try:
+            cell_cube = CellCube(cell_queries, self.priority_classifier)
+        except UnsupportedJQL as e:
+            logging.warning("Metrics cube not built: %s", e)
+            return None
+
+        tracer = get_default_tracer()
+        issues = self.fetch_age_issues(cell_cube.jql, cell_cube.fields())
+        if issues is None:
+            return None
+        with tracer.span("build_metrics_cube"):
+            cell_cube.build(issues)
+        logging.info("1 Jira query, metrics cube of %d cells", len(cell_cube.cube.facts))
+
+        report_df = self.create_report_layout()
+        for cell_key in cell_cube.cells:
+            row, section = cell_key[:2]
+            measure = 'mean_age' if resolved_rows[row] else 'mean_open_age'
+            if len(cell_key) == 2:
+                means = cell_cube.cell_slice(cell_key, by=(PRIORITY_DIMENSION,))[measure]
+                cell_means = {(section, priority): means.get(priority, 0.0) for priority in self.priority_classifier.columns}
+            else:
+                cell_means = {(section, cell_key[2]): cell_cube.cell_slice(cell_key)[measure].iloc[0]}
+            for cell, mean in cell_means.items():
+                report_df.at[row, cell] = mean
+
+        self.fill_overall(report_df)
+        return report_df
+
+    def sync_age_aggregates(self):
+        try:
+            return self.age_aggregates.sync(self.search_client)
+        except requests.exceptions.RequestException as e:
+            # The store still holds the sums of the previous sync, the report is built from those
+            logging.error("Age aggregate sync failed, using the stored aggregates: %s", e)
+            return None
+
+    def build_rolling_report(self, as_of=None):
+        """
+        Fill the mean rows of the report from the running age aggregates.
+
+        Only the issues updated since the previous run are fetched. The aggregates hold counts
+        and sums, not individual ages, so only the mean statistic is reported from them.
+
+        :param as_of: Epoch seconds unresolved ages are measured up to (default is the current time)
+        :return: Numeric report frame, None when the statistics need the planned queries or the
+                 aggregates were never synced
+        """
+        if set(self.report_statistics) != {'mean'}:
+            logging.warning("Age aggregates only hold age sums, %s need the planned queries", ", ".join(self.report_statistics))
+            return None
+
+        tracer = get_default_tracer()
+        with tracer.span("sync_age_aggregates"):
+            synced = self.sync_age_aggregates()
+        if synced is None and self.age_aggregates.watermark is None:
+            return None
+        if synced is not None:
+            logging.info("Age aggregates updated from %d changed issues", synced)
+
+        resolved_rows = {row: resolved for row, _, resolved in self.report_rows()}
+        report_df = self.create_report_layout()
+        for cell_key, buckets in self.age_aggregates.cell_means(*self.date_range, as_of=as_of).items():
+            row, section = cell_key[:2]
+            statistic = 'resolved_age' if resolved_rows[row] else 'age'
+            priorities = self.priority_classifier.columns if len(cell_key) == 2 else cell_key[2:]
+            for priority in priorities:
+                report_df.at[row, (section, priority)] = buckets[priority][statistic] if priority in buckets else 0.0
+
+        self.fill_overall(report_df)
+        return report_df
+
+    def fill_overall(self, report_df):
+        priority_cells = [(section, priority) for section in ('Regression', 'Exploratory') for priority in self.priority_classifier.columns]
+        # Mean ages are whole days, the floor of the mean like timedelta.days
+        for row in ('Resolved-Defect', 'Unresolved-Defect'):
+            report_df.loc[row, priority_cells] = report_df.loc[row, priority_cells] // 1
+
+        # Calculate and set overall averages, left empty when a cell could not be fetched
+        overall_resolved_avg = report_df.loc['Resolved-Defect', priority_cells].mean(skipna=False)
+        overall_unresolved_avg = report_df.loc['Unresolved-Defect', priority_cells].mean(skipna=False)
+
+        report_df.at['Resolved-Defect', ('Overall', '')] = overall_resolved_avg
+        report_df.at['Unresolved-Defect', ('Overall', '')] = overall_unresolved_avg
+
+        # The largest bucket maximum is the overall maximum, other statistics need the pooled ages
+        if 'max' in self.report_statistics:
+            for row in ('Resolved-Defect', 'Unresolved-Defect'):
+                report_df.at[report_row_label(row, 'max'), ('Overall', '')] = report_df.loc[report_row_label(row, 'max'), priority_cells].max(skipna=False)
+
+    def save_report(self, report_df, start_date):
+        report_df_rounded = report_df.round(2)
+
+        print(report_df_rounded)
+
+        # Extract month name from the start date
+        month_name = datetime.strptime(start_date, "%Y-%m-%d").strftime("%B")
+
+        # Specify the path for the Excel file
+        directory = self.report_directory
+        os.makedirs(directory, exist_ok=True)
+        excel_file_path = os.path.join(directory, f"defect_age_{month_name}.xlsx")
+        # Save the report to file
+        report_df_rounded.to_excel(excel_file_path, index=True)
+        print(f"Defect saved to {excel_file_path}")
+        return excel_file_path
+
+    def iter_drill_down(self):
+        """
+        Stream the issues behind every defect age cell, one JQL after the other.
+
+        :return: Generator of (drill-down name, month, row, issue), the month is YYYY-MM of the
+                 resolution date for resolved rows and of the creation date otherwise
+        """
+        fields = tuple(dict.fromkeys(DRILL_DOWN_FIELDS + (self.priority_classifier.field,)))
+        for row, section_queries, resolved in self.report_rows():
+            month_field = 'resolutiondate' if resolved else 'created'
+            name = row.split('-')[0]
+            for section, section_query in section_queries.items():
+                if isinstance(section_query, str):
+                    cell_queries = [(None, section_query)]
+                else:
+                    cell_queries = list(zip(self.priority_classifier.columns, section_query))
+                for priority, query in cell_queries:
+                    for issue in self.search_client.search(query, fields=fields):
+                        bucket = priority or self.priority_classifier.classify(issue)
+                        month_value = issue['fields'].get(month_field)
+                        yield f"{name} {section} {bucket}", (month_value[:7] if month_value else None), row, issue
+
+    def export_workbook(self, report_df, workbook_path, drill_down=True, time_in_status_df=None):
+        """
+        Write the defect age report, the optional time in status report and the issue drill-downs into one workbook.
+
+        Rows are streamed to disk as they are written, see WorkbookExporter.
+
+        :param report_df: Numeric defect age frame
+        :param workbook_path: Output .xlsx file
+        :param drill_down: Also list the issues behind every cell (default is True)
+        :param time_in_status_df: Optional time in status frame
+        :return: Path of the workbook
+        """
+        directory = os.path.dirname(workbook_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with get_default_tracer().span("export_workbook"), WorkbookExporter(workbook_path, f'{self.server}/browse/') as exporter:
+            exporter.write_frame("Defect Age", report_df)
+            if time_in_status_df is not None:
+                exporter.write_frame("Time In Status", time_in_status_df)
+            if drill_down:
+                for name, month, row, issue in self.iter_drill_down():
+                    exporter.write_issue(name, month, row, issue)
+        print(f"Workbook saved to {workbook_path}")
+        return workbook_path
+
+    def sync_changelog_store(self, changelog_store):
+        try:
+            return changelog_store.sync(self.search_client)
+        except requests.exceptions.RequestException as e:
+            # The store still holds the previous sync, the report is built from that
+            logging.error("Changelog sync failed, using the stored transitions: %s", e)
+            return 0
 
-def calculate_average_age(jql_query, resolved=True):
+    def fetch_section_issues(self, jql_query):
+        return list(self.search_client.search(jql_query, fields=(self.priority_classifier.field,)))
+
+    def build_time_in_status_report(self, changelog_store, section_queries, statuses=None):
+        """
+        Days spent in each status and reopen counts per section and priority column.
+
+        Only section membership is queried, the durations come from the changelog store.
+
+        :param changelog_store: Synced ChangelogStore
+        :param section_queries: Dictionary of section name to the JQL selecting its issues
+        :param statuses: Statuses to report, in order (default is every status seen)
+        :return: Report frame with a mean and p90 row per status plus the reopen rows
+        """
+        tracer = get_default_tracer()
+        section_jobs = {section: (tracer.bind(self.fetch_section_issues, section=section, sub_query='Time-In-Status'), query)
+                        for section, query in section_queries.items()}
+        section_issues = self.query_executor.run_calls(section_jobs)
+
+        with tracer.span("time_in_status"):
+            cells = summarize_time_in_status(changelog_store, section_issues, self.priority_classifier, statuses=statuses)
+
+        columns = pd.MultiIndex.from_tuples(list(cells), names=['Metrics', 'Priority'])
+        statuses = list(next(iter(cells.values()))['statuses'])
+        index = [f"{status} ({statistic})" for status in statuses for statistic in ('mean', 'p90')]
+        index += ['Reopens', 'Reopened issues', 'Issues']
+        report_df = pd.DataFrame(0.0, columns=columns, index=index)
+        for cell, stats in cells.items():
+            for status in statuses:
+                for statistic in ('mean', 'p90'):
+                    report_df.at[f"{status} ({statistic})", cell] = stats['statuses'][status][statistic]
+            report_df.at['Reopens', cell] = stats['reopens']
+            report_df.at['Reopened issues', cell] = stats['reopened']
+            report_df.at['Issues', cell] = stats['issues']
+        return report_df
+
+    def save_time_in_status_report(self, report_df, start_date):
+        report_df_rounded = report_df.round(2)
+        print(report_df_rounded)
+
+        month_name = datetime.strptime(start_date, "%Y-%m-%d").strftime("%B")
+        directory = self.report_directory
+        os.makedirs(directory, exist_ok=True)
+        excel_file_path = os.path.join(directory, f"time_in_status_{month_name}.xlsx")
+        report_df_rounded.to_excel(excel_file_path, index=True)
+        print(f"Time in status saved to {excel_file_path}")
+        return excel_file_path
+
+
+def run_defect_age(json_file_path, start_date, end_date, no_cache=False, refresh=False, no_mirror=False, rate_limit=None,
+                   max_workers=DEFAULT_MAX_WORKERS, report_statistics=DEFAULT_REPORT_STATISTICS, trace_path=None,
+                   prometheus_path=None, export_path=None, drill_down=True, capture_path=None, replay_path=None):
     """
-    Calculate the average age of Jira issues based on the provided JQL query.
-
-    :param jql_query: JQL query string
-    :param resolved: Flag indicating whether to consider resolved issues (default is True)
-    :return: Average age in days
+    Generate the defect age report for a config and date range without prompting.
+
+    :param json_file_path: Defect age config file
+    :param start_date: Start date, YYYY-MM-DD
+    :param end_date: End date, YYYY-MM-DD
+    :param trace_path: Optional JSON file for the per-query run trace
+    :param prometheus_path: Optional Prometheus textfile for the run metrics
+    :param export_path: Optional workbook holding the reports and the issue drill-downs
+    :param drill_down: Add the drill-down sheets to the exported workbook
+    :param capture_path: Optional snapshot directory every Jira response of the run is recorded into
+    :param replay_path: Optional snapshot directory the report is generated from without querying Jira
+    :return: Numeric report frame, None if the config is invalid
     """
+    tracer = configure_default_tracer("defect_age", config=os.path.basename(json_file_path), start_date=start_date, end_date=end_date)
     try:
-        jira_options = lasso_authenticate()
-
-        response = requests.get(
-            f'{jira_options["server"]}/rest/api/latest/search',
-            headers=jira_options['headers'],
-            params={"jql": jql_query},
-        )
-
-        response.raise_for_status()
-        issues = response.json()["issues"]
+        return _run_defect_age(json_file_path, start_date, end_date, no_cache, refresh, no_mirror, rate_limit, max_workers,
+                               report_statistics, export_path, drill_down, capture_path, replay_path)
+    finally:
+        release_snapshot_transport()
+        export_trace(tracer, trace_path, prometheus_path)
 
-        total_age = timedelta()
-        current_date = datetime.now()
 
-        for issue in issues:
-            created_date_str = issue["fields"]["created"]
-            created_date = parse_iso_date(created_date_str)
-
-            if resolved:
-                resolved_date_str = issue["fields"]["resolutiondate"]
-                resolved_date = parse_iso_date(resolved_date_str) if resolved_date_str else None
-                if resolved_date:
-                    age = resolved_date - created_date
-                    total_age += age
-            else:
-                age = current_date - created_date
-                total_age += age
-
-        if issues:
-            average_age = total_age / len(issues)
-            return average_age.days
-        else:
-            return 0
-    except Exception as e:
-        return 0 
-def parse_iso_date(date_str):
+def create_defect_age_report(queries, settings, start_date, end_date, query_cache=None, no_mirror=False,
+                             max_workers=DEFAULT_MAX_WORKERS, report_statistics=DEFAULT_REPORT_STATISTICS):
     """
-    Parse ISO 8601 date strings with a flexible approach.
-
-    :param date_str: ISO 8601 formatted date string
-    :return: Parsed datetime object
+    Build a defect age report for a validated config, with its optional mirror, priority buckets and planner settings.
+
+    :param queries: Defect age JQL dictionary
+    :param settings: Settings sections of the config
+    :param start_date: Value for {{start_date}}
+    :param end_date: Value for {{end_date}}
+    :param query_cache: Optional QueryCache
+    :param no_mirror: Ignore the "issue_mirror" section of the config
+    :return: DefectAgeReport instance, projected from a metrics cube when the config has a "metrics_cube" section
+             and from running aggregates when it has an "age_aggregates" section
     """
+    # Local issue store, configured by the optional "issue_mirror" section of the JSON file
+    issue_mirror = None
+    mirror_config = settings.get("issue_mirror")
+    if mirror_config and not no_mirror:
+        issue_mirror = IssueMirror(mirror_config["scope_jql"], path=mirror_config.get("path", DEFAULT_MIRROR_PATH))
+
+    # Optional "priority_buckets" section, maps priority values to report columns
+    priority_classifier = PriorityClassifier.from_config(settings.get("priority_buckets"))
+    rendered_queries = render_defect_age_queries(queries, start_date, end_date)
+
+    report = DefectAgeReport(rendered_queries, priority_classifier=priority_classifier,
+                             query_cache=query_cache, issue_mirror=issue_mirror, max_workers=max_workers,
+                             report_statistics=report_statistics, planner_config=settings.get("query_planner"),
+                             cube_config=settings.get("metrics_cube"), date_range=(start_date, end_date))
+
+    # Optional "age_aggregates" section, running age sums updated from the issues changed since the last run
+    aggregate_config = settings.get("age_aggregates")
+    if aggregate_config:
+        try:
+            # Keyed on the templates, so one store serves every date range
+            report.age_aggregates = AgeAggregateStore(aggregate_config["scope_jql"], report.cell_queries(queries), priority_classifier,
+                                                      path=aggregate_config.get("path", DEFAULT_AGGREGATE_PATH))
+        except UnsupportedJQL as e:
+            logging.warning("Age aggregates not used: %s", e)
+    return report
+
+
+def _run_defect_age(json_file_path, start_date, end_date, no_cache, refresh, no_mirror, rate_limit, max_workers, report_statistics,
+                    export_path, drill_down, capture_path=None, replay_path=None):
     try:
-        # Attempt to parse with fromisoformat
-        return datetime.fromisoformat(date_str)
-    except ValueError:
-        # If fromisoformat fails, handle timezone offset manually
-        parts = date_str.split("+")
-        base_date_str = parts[0]
-        timezone_offset = f"+{parts[1]}" if len(parts) > 1 else "+0000"
-        return datetime.strptime(base_date_str, "%Y-%m-%dT%H:%M:%S.%f") + timedelta(hours=int(timezone_offset[1:3]), minutes=int(timezone_offset[3:]))
-
-def calculate_and_display_defect_ages(section_name, resolved_queries, unresolved_queries):
+        validate_date(start_date)
+        validate_date(end_date)
+        queries, settings = split_defect_age_config(load_json_config(json_file_path))
+    except ConfigError as e:
+        logging.error("%s", e)
+        return None
+
+    errors = validate_defect_age_config(queries)
+    if errors:
+        for error in errors:
+            logging.error("%s", error)
+        return None
+
+    # Every request goes through one pooled session with retries and the optional rate limit,
+    # or is recorded into, or answered from, a snapshot directory
+    configure_snapshot_transport(capture_path, replay_path,
+                                 labels={'command': 'defect_age', 'config': os.path.basename(json_file_path),
+                                         'start_date': start_date, 'end_date': end_date},
+                                 rate_limit=rate_limit)
+    if capture_path or replay_path:
+        # Every response of a snapshot comes from Jira, neither the cache nor the mirror answer a query
+        no_cache = no_mirror = True
+
+    # Identical JQL within a run and across re-runs is served from this cache
+    query_cache = None if no_cache else QueryCache(refresh=refresh)
+
+    report = create_defect_age_report(queries, settings, start_date, end_date, query_cache=query_cache, no_mirror=no_mirror,
+                                      max_workers=max_workers, report_statistics=report_statistics)
+    if replay_path:
+        # Nothing is sent, so no token is needed
+        report.search_client.headers = {}
+    tracer = get_default_tracer()
+    # Sync the local issue mirror so the defect age queries can be answered from it
+    with tracer.span("sync_issue_mirror"):
+        report.sync_issue_mirror()
+    return generate_defect_age_report(report, settings, start_date, end_date, export_path=export_path, drill_down=drill_down)
+
+
+def generate_defect_age_report(report, settings, start_date, end_date, export_path=None, drill_down=True):
     """
-    Calculate and display defect ages for a given section.
-
-    :param section_name: Name of the section (e.g., Regression, Exploratory)
-    :param resolved_queries: List of resolved queries for different priorities
-    :param unresolved_queries: List of unresolved queries for different priorities
+    Build and save the defect age report, and the time in status report when the config has one.
+
+    :param report: DefectAgeReport with a synced mirror, if any
+    :param settings: Settings sections of the config
+    :param start_date: Start date, YYYY-MM-DD
+    :param end_date: End date, YYYY-MM-DD
+    :param export_path: Optional workbook holding both reports and the drill-down sheets
+    :param drill_down: Add the drill-down sheets to the exported workbook
+    :return: Numeric report frame
     """
-    overall_resolved_age = 0
-    overall_unresolved_age = 0
-    
-    for priority in ["Blocker", "Critical", "Others"]:
-        resolved_query = resolved_queries[0] if priority == "Blocker" else resolved_queries[1] if priority == "Critical" else resolved_queries[2]
-        unresolved_query = unresolved_queries[0] if priority == "Blocker" else unresolved_queries[1] if priority == "Critical" else unresolved_queries[2]
-
-        resolved_age = calculate_average_age(resolved_query)
-        unresolved_age = calculate_average_age(unresolved_query, resolved=False)
-
-        overall_resolved_age += resolved_age
-        overall_unresolved_age += unresolved_age
-
-
-def fetch_jira_issues(jql_query, jira_options):
-    try:
-        response = requests.get(
-            jira_options["server"] + '/rest/api/latest/search',
-            headers=jira_options['headers'],
-            params={"jql": jql_query},
-        )
-
-        response.raise_for_status()
-        issues = response.json()["issues"]
-
-        if issues:
-            jira_data = []
-            for issue in issues:
-                jira_id = issue["key"]
-                jira_title = issue["fields"]["summary"]
-                jira_link = f'https://issues.labcollab.net/browse/{jira_id}'
-                jira_data.append([f'<a href="{jira_link}">{jira_id}</a>', jira_title])
-
-            df = pd.DataFrame(jira_data, columns=["Jira ID", "Jira Title"])
-            return df
-        else:
-            print(f"No issues found for query: {jql_query}")
-            return pd.DataFrame(columns=["Jira ID", "Jira Title"])  # Return an empty DataFrame
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return pd.DataFrame(columns=["Jira ID", "Jira Title"])  # Return an empty DataFrame
-
-
-
-def create_report_layout():
-    columns = pd.MultiIndex.from_tuples([
-        ('Regression', 'Blocker'),
-        ('Regression', 'Critical'),
-        ('Regression', 'Others'),
-        ('Exploratory', 'Blocker'),
-        ('Exploratory', 'Critical'),
-        ('Exploratory', 'Others'),
-        ('Overall', '')],
-        names=['Metrics', 'Priority'])
-
-    index = [
-        'Resolved-Defect',
-        'Unresolved-Defect'
-    ]
-
-    data = [[0] * len(columns) for _ in range(len(index))]
-
-    df = pd.DataFrame(data, columns=columns, index=index)
-
-    return df
-
-# Calculate and display defect ages for regression and exploratory sections
-calculate_and_display_defect_ages("Regression", regression_resolved_queries, regression_unresolved_queries)
-calculate_and_display_defect_ages("Exploratory", exploratory_resolved_queries, exploratory_unresolved_queries)
-
-# Create a report layout
-report_df = create_report_layout()
-
-# Fill in the report data with calculated values
-report_df.at['Resolved-Defect', ('Regression', 'Blocker')] = calculate_average_age(regression_resolved_queries[0])
-report_df.at['Resolved-Defect', ('Regression', 'Critical')] = calculate_average_age(regression_resolved_queries[1])
-report_df.at['Resolved-Defect', ('Regression', 'Others')] = calculate_average_age(regression_resolved_queries[2])
-report_df.at['Resolved-Defect', ('Exploratory', 'Blocker')] = calculate_average_age(exploratory_resolved_queries[0])
-report_df.at['Resolved-Defect', ('Exploratory', 'Critical')] = calculate_average_age(exploratory_resolved_queries[1])
-report_df.at['Resolved-Defect', ('Exploratory', 'Others')] = calculate_average_age(exploratory_resolved_queries[2])
-
-report_df.at['Unresolved-Defect', ('Regression', 'Blocker')] = calculate_average_age(regression_unresolved_queries[0], resolved=False)
-report_df.at['Unresolved-Defect', ('Regression', 'Critical')] = calculate_average_age(regression_unresolved_queries[1], resolved=False)
-report_df.at['Unresolved-Defect', ('Regression', 'Others')] = calculate_average_age(regression_unresolved_queries[2], resolved=False)
-report_df.at['Unresolved-Defect', ('Exploratory', 'Blocker')] = calculate_average_age(exploratory_unresolved_queries[0], resolved=False)
-report_df.at['Unresolved-Defect', ('Exploratory', 'Critical')] = calculate_average_age(exploratory_unresolved_queries[1], resolved=False)
-report_df.at['Unresolved-Defect', ('Exploratory', 'Others')] = calculate_average_age(exploratory_unresolved_queries[2], resolved=False)
-
-# Calculate and set overall averages
-overall_resolved_avg = (report_df.loc['Resolved-Defect', ('Regression', 'Blocker')] + 
-                        report_df.loc['Resolved-Defect', ('Regression', 'Critical')] +
-                        report_df.loc['Resolved-Defect', ('Regression', 'Others')] +
-                        report_df.loc['Resolved-Defect', ('Exploratory', 'Blocker')] +
-                        report_df.loc['Resolved-Defect', ('Exploratory', 'Critical')] +
-                        report_df.loc['Resolved-Defect', ('Exploratory', 'Others')]) / 6
-
-overall_unresolved_avg = (report_df.loc['Unresolved-Defect', ('Regression', 'Blocker')] + 
-                          report_df.loc['Unresolved-Defect', ('Regression', 'Critical')] +
-                          report_df.loc['Unresolved-Defect', ('Regression', 'Others')] +
-                          report_df.loc['Unresolved-Defect', ('Exploratory', 'Blocker')] +
-                          report_df.loc['Unresolved-Defect', ('Exploratory', 'Critical')] +
-                          report_df.loc['Unresolved-Defect', ('Exploratory', 'Others')]) / 6
-
-report_df.at['Resolved-Defect', ('Overall', '')] = overall_resolved_avg
-report_df.at['Unresolved-Defect', ('Overall', '')] = overall_unresolved_avg
-
-report_df_rounded = report_df.round(2)
-
-print(report_df_rounded)
-
-# Convert input dates to datetime objects
-start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
-
-# Extract month name from the start date
-month_name = start_datetime.strftime("%B")
-
-# Specify the path for the Excel file
-directory = "defect"
-if not os.path.exists(directory):
-    os.makedirs(directory)
-excel_file_path = os.path.join(directory, f"defect_age_{month_name}.xlsx")
-# Save the report to file
-report_df_rounded = report_df.round(2)
-report_df_rounded.to_excel(excel_file_path, index=True)
-print(f"Defect saved to {excel_file_path}")
-
+    tracer = get_default_tracer()
+    with tracer.span("build_report"):
+        report_df = report.build_report()
+    with tracer.span("save_report"):
+        report.save_report(report_df, start_date)
+
+    # Optional "time_in_status" section, durations per status from the bulk changelog store
+    time_in_status_df = None
+    time_in_status = settings.get("time_in_status")
+    if time_in_status:
+        changelog_store = ChangelogStore(time_in_status["scope_jql"],
+                                         path=time_in_status.get("path", DEFAULT_CHANGELOG_PATH),
+                                         done_statuses=time_in_status.get("done_statuses", DEFAULT_DONE_STATUSES),
+                                         max_workers=time_in_status.get("max_workers", DEFAULT_CHANGELOG_WORKERS))
+        try:
+            with tracer.span("sync_changelog_store"):
+                report.sync_changelog_store(changelog_store)
+            section_queries = {section: render_jql(query, start_date, end_date)
+                               for section, query in time_in_status["sections"].items()}
+            with tracer.span("build_time_in_status_report"):
+                time_in_status_df = report.build_time_in_status_report(changelog_store, section_queries,
+                                                                       statuses=time_in_status.get("statuses"))
+            with tracer.span("save_time_in_status_report"):
+                report.save_time_in_status_report(time_in_status_df, start_date)
+        finally:
+            changelog_store.close()
+
+    if export_path:
+        try:
+            report.export_workbook(report_df, export_path, drill_down=drill_down, time_in_status_df=time_in_status_df)
+        except requests.exceptions.RequestException as e:
+            logging.error("Workbook %s not exported, a drill-down query failed: %s", export_path, e)
+        except ImportError as e:
+            logging.error("Workbook %s not exported: %s", export_path, e)
+    return report_df
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the defect age report from Jira.")
+    parser.add_argument("--config", help="Defect age config file, prompted for on a terminal when neither --config nor --section is given")
+    parser.add_argument("--section", help="Config name in the defect age config directory, e.g. Option1")
+    parser.add_argument("--start-date", help="Start date (YYYY-MM-DD), prompted for on a terminal when omitted")
+    parser.add_argument("--end-date", help="End date (YYYY-MM-DD), prompted for on a terminal when omitted")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the query result cache")
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch every query and overwrite the cached results")
+    parser.add_argument("--no-mirror", action="store_true", help="Query Jira directly even if the config defines an issue mirror")
+    parser.add_argument("--rate-limit", type=float, help="Maximum Jira requests per second across all workers")
+    parser.add_argument("--trace", help="Write a JSON trace of every query to this file")
+    parser.add_argument("--prometheus", help="Write run metrics in the Prometheus text format to this file")
+    parser.add_argument("--export", help="Also write the reports and the issue drill-downs into this workbook")
+    parser.add_argument("--no-drill-down", action="store_true", help="Leave the drill-down sheets out of the exported workbook")
+    snapshot_group = parser.add_mutually_exclusive_group()
+    snapshot_group.add_argument("--capture", help="Record every Jira response of the run into this snapshot directory")
+    snapshot_group.add_argument("--replay", help="Generate the report from this snapshot directory without querying Jira")
+    parser.add_argument("--log-level", default="ERROR", help="Logging level, INFO logs every query")
+    args = parser.parse_args()
+    require_prompt_free_args(parser, args)
+    return args
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    json_file_path = args.config
+    if json_file_path is None:
+        # Prompt the user for their choice of section
+        section_choice = args.section
+        while section_choice not in CONFIG_SECTIONS:
+            if section_choice is not None:
+                print("Invalid section choice. Please choose from Option1 , Option2.")
+            section_choice = input("Enter the section (Option1, Option2): ").strip()
+        json_file_path = resolve_config_path(DEFECT_AGE_CONFIG_DIRECTORY, section_choice)
+
+    # Prompt the user for start and end dates
+    start_date = args.start_date or input("Enter the start date (YYYY-MM-DD): ")
+    end_date = args.end_date or input("Enter the end date (YYYY-MM-DD): ")
+
+    run_defect_age(json_file_path, start_date, end_date, no_cache=args.no_cache, refresh=args.refresh,
+                   no_mirror=args.no_mirror, rate_limit=args.rate_limit, trace_path=args.trace, prometheus_path=args.prometheus,
+                   export_path=args.export, drill_down=not args.no_drill_down, capture_path=args.capture,
+                   replay_path=args.replay)
+
+
+if __name__ == "__main__":
+    main()
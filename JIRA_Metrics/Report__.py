@@ -1,93 +1,137 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
 import os
 import logging
 import requests
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from lasso_auth import LassoTokenClient
-
-# Suppressing FutureWarnings
-import warnings
-warnings.filterwarnings("ignore", category=FutureWarning, message="Setting an item of incompatible dtype is deprecated")
+from lasso_auth import get_token_client
+from jira_search import JiraSearchClient, DEFAULT_PAGE_SIZE, DEFAULT_PREFETCH
+from query_executor import QueryExecutor, DEFAULT_MAX_WORKERS
+from query_cache import QueryCache
+from issue_mirror import IssueMirror, DEFAULT_MIRROR_PATH
+from priority_classifier import PriorityClassifier
+from jira_transport import configure_default_transport, DEFAULT_POOL_SIZE
+from query_trace import get_default_tracer, configure_default_tracer, export_trace
+from search_snapshot import configure_snapshot_transport, release_snapshot_transport
+from jql_filter import and_clause, compile_undated_jql, date_window, field_id, field_values, UnsupportedJQL
+from query_planner import QueryPlanner
+from metrics_cube import CellCube, dimensions_from_config, EVENT_FIELDS
+from report_export import WorkbookExporter, browse_url, DRILL_DOWN_FIELDS, PERCENTAGE_FORMAT, COUNT_FORMAT
+from report_config import (ConfigError, load_json_config, render_jql, validate_date, validate_qmr_config,
+                           iter_months, require_prompt_free_args, resolve_config_path, CONFIG_SECTIONS, QMR_CONFIG_DIRECTORY)
+
+# Date field that places an issue in a month, tells which months an issue changed in the mirror touches
+DEFAULT_MONTH_FIELDS = {"BugsRaised": "created"}
+DEFAULT_MONTH_FIELD = "resolutiondate"
+
+# Count rows filled from the fetched issues, and ratio rows derived from them as numerator/denominator
+COUNT_ROWS = ['BugsRaised', 'Resolved', 'Noise', 'GerritFix', 'Fixed']
+METRIC_RATIOS = {
+    'Noise%': ('Noise', 'Resolved'),
+    'Fixed%': ('Fixed', 'Resolved'),
+    'Gerrit%': ('GerritFix', 'Resolved'),
+    'Resolution%': ('Resolved', 'BugsRaised'),
+}
+PERCENTAGE_ROWS = list(METRIC_RATIOS)
+
+# Sub-queries that only need per-priority counts, counted server side with maxResults=0.
+# Override with the "count_only_sub_queries" config list, sub-queries left out are fully fetched.
+DEFAULT_COUNT_ONLY_SUB_QUERIES = list(COUNT_ROWS)
+
+# Months generated concurrently, each month still runs its own queries concurrently
+DEFAULT_MONTH_WORKERS = 4
+
+# Directory the monthly and combined workbooks are written to
+DEFAULT_REPORT_DIRECTORY = "reports"
 
 # Jira credentials
 Jira_ID = 'API_Usernam'
 Jira_Passsword = 'API_Pwd'
 
 class JiraReportGenerator:
-    def __init__(self, api_url, json_file_path, jira_id, jira_password):
+    common_sub_queries = ["BugsRaised", "Resolved", "Fixed", "GerritFix", "Noise", "Resolution"]
+
+    def __init__(self, api_url, json_file_path, jira_id, jira_password, page_size=DEFAULT_PAGE_SIZE, prefetch=DEFAULT_PREFETCH, max_workers=DEFAULT_MAX_WORKERS, query_cache=None, issue_mirror=None, priority_classifier=None, month_workers=DEFAULT_MONTH_WORKERS):
         self.api_url = api_url
         self.json_file_path = json_file_path
-        self.auth = self.get_lasso_auth(jira_id, jira_password)
+        # The token is fetched on the first Jira request, so building a generator needs no network
+        self.token_client = self.get_lasso_auth(jira_id, jira_password)
+        self.search_client = JiraSearchClient(
+            api_url,
+            headers=self.get_auth_headers,
+            page_size=page_size,
+            prefetch=prefetch,
+            cache=query_cache,
+            mirror=issue_mirror
+        )
+        self.issue_mirror = issue_mirror
+        self.priority_classifier = priority_classifier or PriorityClassifier()
+        self.query_executor = QueryExecutor(max_workers=max_workers)
+        self.month_executor = QueryExecutor(max_workers=month_workers)
+        self.metrics_cube = None
+        self.report_directory = DEFAULT_REPORT_DIRECTORY
 
     def get_lasso_auth(self, jira_id, jira_password):
-        lasso_token_client = LassoTokenClient("https://api.lasso.labcollab.net/rest/user/token", jira_id, jira_password, "LabCollabJira")
-        access_token = lasso_token_client.get_access_token()
-        return ('lasso', access_token)
+        return get_token_client("https://api.lasso.labcollab.net/rest/user/token", jira_id, jira_password, "LabCollabJira")
+
+    def get_auth_headers(self):
+        return {'Authorization': f'Bearer {self.token_client.get_access_token()}'}
+
+    def sync_issue_mirror(self):
+        if self.issue_mirror is None:
+            return 0
+        try:
+            return self.issue_mirror.sync(self.search_client)
+        except requests.exceptions.RequestException as err:
+            logging.error("Issue mirror sync failed, falling back to live searches: %s", err)
+            self.search_client.mirror = None
+            return 0
+
+    def section_columns(self, report_layout):
+        return [column for column in report_layout.columns if column[0] != 'Overall']
+
+    def calculate_percentages(self, report_layout, columns):
+        # Every ratio row for every column in one array operation, 0 where the denominator is 0
+        numerators = report_layout.loc[[numerator for numerator, _ in METRIC_RATIOS.values()], columns].to_numpy(dtype=float)
+        denominators = report_layout.loc[[denominator for _, denominator in METRIC_RATIOS.values()], columns].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percentages = np.where(denominators != 0, numerators / denominators * 100, 0.0)
+        report_layout.loc[list(METRIC_RATIOS), columns] = percentages
 
     def calculate_overall_metrics(self, report_layout):
-        priorities = ['Blocker', 'Critical', 'Others']
-        overall_resolved, overall_bugs_raised, overall_noise_issues, overall_fixed_issues, overall_gerrit_issues = 0, 0, 0, 0, 0
-
-        for priority in priorities:
-            overall_resolved += report_layout.loc['Resolved', ('Regression', priority)] + report_layout.loc['Resolved', ('Exploratory', priority)]
-            overall_bugs_raised += report_layout.loc['BugsRaised', ('Regression', priority)] + report_layout.loc['BugsRaised', ('Exploratory', priority)]
-            overall_noise_issues += report_layout.loc['Noise', ('Regression', priority)] + report_layout.loc['Noise', ('Exploratory', priority)]
-            overall_fixed_issues += report_layout.loc['Fixed', ('Regression', priority)] + report_layout.loc['Fixed', ('Exploratory', priority)]
-            overall_gerrit_issues += report_layout.loc['GerritFix', ('Regression', priority)] + report_layout.loc['GerritFix', ('Exploratory', priority)]
-
-        overall_noise_percentage = (overall_noise_issues / overall_resolved) * 100
-        overall_fixed_percentage = (overall_fixed_issues / overall_resolved) * 100
-        overall_gerrit_percentage = (overall_gerrit_issues / overall_resolved) * 100
-        overall_resolution_percentage = (overall_resolved / overall_bugs_raised) * 100
-
-        for priority in priorities:
-            report_layout.loc["Noise%", ('Overall')] = f"{overall_noise_percentage:.2f}%"
-            report_layout.loc["Fixed%", ('Overall')] = f"{overall_fixed_percentage:.2f}%"
-            report_layout.loc["Gerrit%", ('Overall')] = f"{overall_gerrit_percentage:.2f}%"
-            report_layout.loc["Resolution%", ('Overall')] = f"{overall_resolution_percentage:.2f}%"
-
-    def fetch_and_sort_data(self, jql_query):
+        section_columns = self.section_columns(report_layout)
+        report_layout.loc[COUNT_ROWS, ('Overall', '')] = report_layout.loc[COUNT_ROWS, section_columns].sum(axis=1)
+        self.calculate_percentages(report_layout, [('Overall', '')])
+
+    def fetch_and_sort_data(self, jql_query, fields=('priority',)):
         try:
             logging.info("Fetching data for JQL query: %s", jql_query)
-            response = requests.get(
-                self.api_url,
-                headers={'Authorization': f'Bearer {self.auth[1]}'},
-                params={'jql': jql_query, 'startAt': 0, 'maxResults': 10000}
-            )
-            response.raise_for_status()
-            response_data = response.json()
+            issues = list(self.search_client.search(jql_query, fields=fields))
             logging.info("Successfully fetched data for JQL query: %s", jql_query)
-            return response_data.get('issues', [])
+            return issues
         except requests.exceptions.RequestException as err:
+            # Retries are exhausted at this point, an empty list would be reported as a real zero
             logging.error("Jira API request failed for JQL query %s: %s", jql_query, err)
-            return []
+            raise
 
-    def fetch_resolution_data(self, jql_query):
+    def count_issues(self, jql_query):
         try:
-            response = requests.get(
-                self.api_url,
-                headers={'Authorization': f'Bearer {self.auth[1]}'},
-                params={'jql': jql_query}
-            )
-            response.raise_for_status()
-            return response.json().get('issues', [])
-        except requests.exceptions.RequestException as e:
-            logging.error("Jira API request failed for Resolution data: %s", str(e))
-            return []
+            return self.search_client.count(jql_query)
+        except requests.exceptions.RequestException as err:
+            logging.error("Jira API count failed for JQL query %s: %s", jql_query, err)
+            raise
 
     def create_report_layout(self):
-        columns = pd.MultiIndex.from_tuples([
-            ('Regression', 'Blocker'), ('Regression', 'Critical'), ('Regression', 'Others'),
-            ('Exploratory', 'Blocker'), ('Exploratory', 'Critical'), ('Exploratory', 'Others'),
-            ('Overall', '')],
+        priorities = self.priority_classifier.columns
+        columns = pd.MultiIndex.from_tuples(
+            [('Regression', priority) for priority in priorities] +
+            [('Exploratory', priority) for priority in priorities] +
+            [('Overall', '')],
             names=['Metrics', 'Priority'])
-        index = ['BugsRaised', 'Resolved', 'Noise', 'GerritFix', 'Fixed', 'Noise%', 'Fixed%', 'Gerrit%', 'Resolution%']
-        data = [[0] * len(columns) for _ in range(len(index))]
-        df = pd.DataFrame(data, columns=columns, index=index)
-        return df
+        index = COUNT_ROWS + PERCENTAGE_ROWS
+        return pd.DataFrame(0.0, columns=columns, index=index)
 
     def validate_report_data(self, report_layout, data, common_sub_queries, start_date, end_date):
         success = True
@@ -103,240 +147,690 @@ class JiraReportGenerator:
         return success
 
     def calculate_metrics(self, report_layout):
-        priorities = ['Blocker', 'Critical', 'Others']
-
-        for priority in priorities:
-            noise_issues = report_layout.loc['Noise', ('Regression', priority)]
-            resolved_issues = report_layout.loc['Resolved', ('Regression', priority)]
-
-            if resolved_issues != 0:
-                noise_percentage = (noise_issues / resolved_issues) * 100
-                report_layout.loc["Noise%", ('Regression', priority)] = f"{noise_percentage:.2f}%"
-            else:
-                report_layout.loc["Noise%", ('Regression', priority)] = '0.0%'
-
-            fixed_issues = report_layout.loc['Fixed', ('Regression', priority)]
-            resolved_issues = report_layout.loc['Resolved', ('Regression', priority)]
-            gerrit_issues = report_layout.loc['GerritFix', ('Regression', priority)]
-
-            if resolved_issues != 0:
-                fixed_percentage = (fixed_issues / resolved_issues) * 100
-                gerrit_percentage = (gerrit_issues / resolved_issues) * 100
-
-                report_layout.loc["Fixed%", ('Regression', priority)] = f"{fixed_percentage:.2f}%"
-                report_layout.loc["Gerrit%", ('Regression', priority)] = f"{gerrit_percentage:.2f}%"
-            else:
-                report_layout.loc["Fixed%", ('Regression', priority)] = '0.0%'
-                report_layout.loc["Gerrit%", ('Regression', priority)] = '0.0%'
-
-            bugs_raised = report_layout.loc['BugsRaised', ('Regression', priority)]
-            resolved_issues = report_layout.loc['Resolved', ('Regression', priority)]
-
-            if bugs_raised > 0:
-                resolution_percentage = (resolved_issues / bugs_raised) * 100
-            else:
-                resolution_percentage = 0
-
-            report_layout.loc["Resolution%", ('Regression', priority)] = f"{resolution_percentage:.2f}%"
-
-        for priority in priorities:
-            noise_issues = report_layout.loc['Noise', ('Exploratory', priority)]
-            resolved_issues = report_layout.loc['Resolved', ('Exploratory', priority)]
-
-            if resolved_issues != 0:
-                noise_percentage = (noise_issues / resolved_issues) * 100
-                report_layout.loc["Noise%", ('Exploratory', priority)] = f"{noise_percentage:.2f}%"
-            else:
-                report_layout.loc["Noise%", ('Exploratory', priority)] = '0.0%'
-
-            fixed_issues = report_layout.loc['Fixed', ('Exploratory', priority)]
-            resolved_issues = report_layout.loc['Resolved', ('Exploratory', priority)]
-            gerrit_issues = report_layout.loc['GerritFix', ('Exploratory', priority)]
-
-            if resolved_issues != 0:
-                fixed_percentage = (fixed_issues / resolved_issues) * 100
-                gerrit_percentage = (gerrit_issues / resolved_issues) * 100
-
-                report_layout.loc["Fixed%", ('Exploratory', priority)] = f"{fixed_percentage:.2f}%"
-                report_layout.loc["Gerrit%", ('Exploratory', priority)] = f"{gerrit_percentage:.2f}%"
+        self.calculate_percentages(report_layout, self.section_columns(report_layout))
+
+    @staticmethod
+    def format_report(report_layout):
+        """
+        Format a numeric report frame for display and export.
+
+        Count rows become integers and ratio rows become "12.34%" strings.
+
+        :param report_layout: Numeric report frame, a single month or several months stacked
+        :return: Formatted copy of the frame
+        """
+        formatted = report_layout.astype(object)
+        percentage_rows = report_layout.index.get_level_values(-1).isin(PERCENTAGE_ROWS)
+        formatted.loc[percentage_rows] = report_layout.loc[percentage_rows].apply(lambda column: column.map("{:.2f}%".format))
+        formatted.loc[~percentage_rows] = report_layout.loc[~percentage_rows].round().astype('int64')
+        return formatted
+
+    def iter_months(self, start_date, end_date):
+        return iter_months(start_date, end_date)
+
+    def generate_monthly_reports(self, start_date, end_date, range_mode=False, cube_mode=False):
+        """
+        Generate one report per month between start_date and end_date.
+
+        Months are independent and are generated concurrently.
+
+        :param start_date: First day of the range (YYYY-MM-DD)
+        :param end_date: Last day of the range (YYYY-MM-DD)
+        :param range_mode: Fetch each JQL once for the whole range (default is False)
+        :param cube_mode: Fetch every JQL at once and project the reports from a metrics cube (default is False)
+        :return: Dictionary of report filename to report frame, in month order
+        """
+        if cube_mode:
+            reports = self.generate_cube_reports(start_date, end_date)
+            if reports is not None:
+                return reports
+            logging.warning("Falling back to range mode")
+            range_mode = True
+        if range_mode:
+            return self.generate_range_reports(start_date, end_date)
+
+        month_jobs = {report_filename: (current_month_start, current_month_end, report_filename)
+                      for current_month_start, current_month_end, report_filename in self.iter_months(start_date, end_date)}
+        reports = self.month_executor.run(self.generate_report, month_jobs)
+        return {report_filename: report_layout for report_filename, report_layout in reports.items() if report_layout is not None}
+
+    def load_report_config(self):
+        try:
+            return load_json_config(self.json_file_path)
+        except ConfigError as e:
+            logging.error("%s", e)
+            return None
+
+    def render_jql_jobs(self, data, start_date, end_date, fields_for):
+        # Every section/sub-query JQL a report row is filled from, in the order results are gathered.
+        # Resolution% is derived from Resolved/BugsRaised, the Resolution JQL is validated but never sent.
+        jql_jobs = {}
+        for sub_query in COUNT_ROWS:
+            for section in ('Regression', 'Exploratory'):
+                jql_query = render_jql(data[section][sub_query], start_date, end_date)
+                jql_jobs[(section, sub_query)] = (jql_query, fields_for(sub_query))
+        return jql_jobs
+
+    @staticmethod
+    def job_labels(job_key):
+        return dict(zip(('section', 'sub_query', 'priority'), job_key))
+
+    def run_query_plan(self, plan):
+        """
+        Send the planned queries at once and answer every report job from their results.
+
+        :param plan: QueryPlan of the report jobs
+        :return: Dictionary of job key to a list of issues or an issue count
+        """
+        tracer = get_default_tracer()
+        calls = {}
+        for query_key, (function, *args) in plan.calls(self.fetch_and_sort_data, self.count_issues).items():
+            labels = self.job_labels(plan.queries[query_key].job_keys[0])
+            calls[query_key] = (tracer.bind(function, **labels), *args)
+        return plan.resolve(self.query_executor.run_calls(calls))
+
+    def fetch_report_data(self, data, start_date, end_date):
+        """
+        Run every section/sub-query of a report at once.
+
+        Count-only sub-queries need one maxResults=0 search per priority bucket, the others
+        fetch their issues once and are bucketed locally. The query planner collapses identical
+        JQL and answers narrower queries from a broader fetch, see the "query_planner" config section.
+
+        :param data: Report config
+        :param start_date: Value for {{start_date}}
+        :param end_date: Value for {{end_date}}
+        :return: Dictionary of (section, sub_query) to a list of issues or a dictionary of priority counts
+        """
+        count_only = set(data.get("count_only_sub_queries", DEFAULT_COUNT_ONLY_SUB_QUERIES))
+        priority_fields = (self.priority_classifier.field,)
+        jql_jobs = self.render_jql_jobs(data, start_date, end_date, lambda sub_query: priority_fields)
+        bucket_clauses = self.priority_classifier.jql_clauses()
+
+        planner = QueryPlanner.from_config(data.get("query_planner"))
+        for (section, sub_query), (jql_query, fields) in jql_jobs.items():
+            if sub_query in count_only:
+                for priority, clause in bucket_clauses.items():
+                    if clause is not None:
+                        planner.add_count((section, sub_query, priority), and_clause(jql_query, clause), base=jql_query)
             else:
-                report_layout.loc["Fixed%", ('Exploratory', priority)] = '0.0%'
-                report_layout.loc["Gerrit%", ('Exploratory', priority)] = '0.0%'
-
-            bugs_raised = report_layout.loc['BugsRaised', ('Exploratory', priority)]
-            resolved_issues = report_layout.loc['Resolved', ('Exploratory', priority)]
-
-            if bugs_raised > 0:
-                resolution_percentage = (resolved_issues / bugs_raised) * 100
+                planner.add_search((section, sub_query), jql_query, fields)
+        plan = planner.plan()
+        logging.info("%s: %s", start_date[:7], plan.describe())
+        results = self.run_query_plan(plan)
+
+        fetched_data = {}
+        for job_key in jql_jobs:
+            if job_key[1] in count_only:
+                fetched_data[job_key] = {priority: results.get(job_key + (priority,), 0) for priority in bucket_clauses}
             else:
-                resolution_percentage = 0
-
-            report_layout.loc["Resolution%", ('Exploratory', priority)] = f"{resolution_percentage:.2f}%"
+                fetched_data[job_key] = results[job_key]
+        return fetched_data
 
-    def generate_monthly_reports(self, start_date, end_date):
-        start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-        end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
+    def build_report_layout(self, fetched_data):
+        """
+        Build the numeric report frame from the fetched data of every section/sub-query.
 
-        while start_datetime <= end_datetime:
-            current_month_start = start_datetime.strftime("%Y-%m-01")
-            current_month_end = (start_datetime + timedelta(days=31)).replace(day=1) - timedelta(days=1)
-            current_month_end = current_month_end.strftime("%Y-%m-%d")
+        :param fetched_data: Dictionary of (section, sub_query) to a list of issues or a dictionary of priority counts
+        :return: Report frame with float counts and percentages
+        """
+        report_layout = self.create_report_layout()
 
-            month_name = start_datetime.strftime("%B")
-            report_filename = f"report_{month_name}_{start_datetime.year}.xlsx"
+        def priority_counts(section_data):
+            # Issues are bucketed into priority columns in a single pass, counts are used as is
+            return section_data if isinstance(section_data, dict) else self.priority_classifier.count(section_data)
+
+        for sub_query in COUNT_ROWS:
+            regression_counts = priority_counts(fetched_data[('Regression', sub_query)])
+            exploratory_counts = priority_counts(fetched_data[('Exploratory', sub_query)])
+            section_counts = [regression_counts[priority] for priority in self.priority_classifier.columns] + \
+                             [exploratory_counts[priority] for priority in self.priority_classifier.columns]
+            report_layout.loc[sub_query, self.section_columns(report_layout)] = section_counts
+
+        # Resolution% is derived from Resolved/BugsRaised, the Resolution sub-query only has to be valid
+        self.calculate_metrics(report_layout)
+        self.calculate_overall_metrics(report_layout)
+        return report_layout
+
+    def save_report(self, report_layout, report_filename):
+        report_layout = self.format_report(report_layout)
+        print(report_layout)
+
+        report_directory = self.report_directory
+        # Months are saved from concurrent workers
+        os.makedirs(report_directory, exist_ok=True)
+
+        report_filepath = os.path.join(report_directory, report_filename)
+
+        report_layout.to_excel(report_filepath, index=True)
+        print(f"Report saved to {report_filepath}")
+
+    def compute_report(self, start_date, end_date, report_filename):
+        """
+        Fetch and build the numeric report frame of one month without saving it.
+
+        :param start_date: First day of the month (YYYY-MM-DD)
+        :param end_date: Last day of the month (YYYY-MM-DD)
+        :param report_filename: Report name used in log messages
+        :return: Report frame, None if the config is invalid or a Jira query failed
+        """
+        tracer = get_default_tracer()
+        data = self.load_report_config()
+        if data is None:
+            return None
+
+        if not self.validate_report_data(None, data, self.common_sub_queries, start_date, end_date):
+            logging.error("Validation failed. Please check the errors in the log.")
+            return None
+        try:
+            with tracer.span("fetch_report_data"):
+                fetched_data = self.fetch_report_data(data, start_date, end_date)
+        except requests.exceptions.RequestException:
+            logging.error("Report %s not generated, a Jira query failed.", report_filename)
+            return None
 
-            self.generate_report(current_month_start, current_month_end, report_filename)
-            start_datetime = (start_datetime + timedelta(days=32)).replace(day=1)
+        with tracer.span("build_report_layout"):
+            return self.build_report_layout(fetched_data)
 
     def generate_report(self, start_date, end_date, report_filename):
+        tracer = get_default_tracer()
+        with tracer.context(month=start_date[:7]):
+            report_layout = self.compute_report(start_date, end_date, report_filename)
+            if report_layout is None:
+                return None
+            with tracer.span("save_report"):
+                self.save_report(report_layout, report_filename)
+            return report_layout
+
+    def generate_range_reports(self, start_date, end_date):
+        """
+        Generate the monthly reports for a date range from one fetch per JQL.
+
+        Each JQL is templated once over the whole span, and the issues are then bucketed into
+        months by the date window each month's own JQL has, so a month counts exactly the issues
+        its monthly query would. Configs whose JQL is not bounded on one date field on both sides
+        are generated month by month instead.
+
+        :param start_date: First day of the range (YYYY-MM-DD)
+        :param end_date: Last day of the range (YYYY-MM-DD)
+        :return: Dictionary of report filename to report frame, in month order
+        """
+        data = self.load_report_config()
+        if data is None:
+            return {}
+
+        months = list(self.iter_months(start_date, end_date))
+        if not months:
+            return {}
+        span_start, span_end = months[0][0], months[-1][1]
+
+        if not self.validate_report_data(None, data, self.common_sub_queries, span_start, span_end):
+            logging.error("Validation failed. Please check the errors in the log.")
+            return {}
+
+        windows = self.cell_month_windows(data, months, span_start, span_end)
+        if windows is None:
+            logging.warning("Generating the reports month by month")
+            return self.generate_monthly_reports(start_date, end_date)
+
+        def fields_for(sub_query):
+            return tuple(dict.fromkeys((self.priority_classifier.field,) + tuple(
+                windows[(section, sub_query)][0] for section in ('Regression', 'Exploratory'))))
+
+        tracer = get_default_tracer()
+        jql_jobs = self.render_jql_jobs(data, span_start, span_end, fields_for)
+        planner = QueryPlanner.from_config(data.get("query_planner"))
+        for job_key, (jql_query, fields) in jql_jobs.items():
+            planner.add_search(job_key, jql_query, fields)
+        plan = planner.plan()
+        logging.info("%s to %s: %s", span_start, span_end, plan.describe())
         try:
-            with open(self.json_file_path, 'r') as json_file:
-                data = json.load(json_file)
-        except FileNotFoundError as e:
-            logging.error("JSON file not found: %s", str(e))
-            return
-
-        api_credentials = data["api_credentials"]
-        api_username = api_credentials["api_username"]
-        api_password = api_credentials["api_password"]
-        api_url = api_credentials["api_url"]
-
-        common_sub_queries = ["BugsRaised", "Resolved", "Fixed", "GerritFix", "Noise", "Resolution"]
-
-        jql_queries_data = {"Regression": {}, "Exploratory": {}}
-        jql_queries_df = pd.DataFrame(jql_queries_data)
-        report_layout = self.create_report_layout()
-
-        if self.validate_report_data(report_layout, data, common_sub_queries, start_date, end_date):
-            for sub_query in common_sub_queries:
-                regression_sub_query = data["Regression"][sub_query].replace("{{start_date}}", start_date).replace("{{end_date}}", end_date)
-                exploratory_sub_query = data["Exploratory"][sub_query].replace("{{start_date}}", start_date).replace("{{end_date}}", end_date)
-
-                regression_data = self.fetch_and_sort_data(regression_sub_query)
-                exploratory_data = self.fetch_and_sort_data(exploratory_sub_query)
-
-                for priority in ['Blocker', 'Critical', 'Others']:
-                    if priority == 'Others':
-                        priority_issues = [issue for issue in regression_data if issue['fields']['priority']['name'] not in ['Blocker', 'Critical']]
-                    else:
-                        priority_issues = [issue for issue in regression_data if issue['fields']['priority']['name'] == priority]
-                    report_layout.loc[sub_query, ('Regression', priority)] = len(priority_issues)
-
-                    if priority == 'Others':
-                        priority_issues = [issue for issue in exploratory_data if issue['fields']['priority']['name'] not in ['Blocker', 'Critical']]
-                    else:
-                        priority_issues = [issue for issue in exploratory_data if issue['fields']['priority']['name'] == priority]
-                    report_layout.loc[sub_query, ('Exploratory', priority)] = len(priority_issues)
-
-                overall_regression = sum(report_layout.loc[sub_query, ('Regression', priority)] for priority in ['Blocker', 'Critical', 'Others'])
-                overall_exploratory = sum(report_layout.loc[sub_query, ('Exploratory', priority)] for priority in ['Blocker', 'Critical', 'Others'])
-                report_layout.loc[sub_query, ('Overall', '')] = overall_regression + overall_exploratory
-
-                resolution_sub_query = data["Regression"]["Resolution"].replace("{{start_date}}", start_date).replace("{{end_date}}", end_date)
-                resolution_data = self.fetch_and_sort_data(resolution_sub_query)
-
-                for priority in ['Blocker', 'Critical', 'Others']:
-                    bugs_raised = report_layout.loc['BugsRaised', ('Regression', priority)]
-                    resolution_count = len(resolution_data)
-                    resolution_percentage = (resolution_count / bugs_raised) * 100
-
-                    report_layout.loc["Resolution%", ('Regression', priority)] = resolution_percentage
-
-                    jql_queries_df.loc[sub_query, ('Regression')] = regression_sub_query
-                    jql_queries_df.loc[sub_query, ('Exploratory')] = exploratory_sub_query
-            
-            report_layout = report_layout.drop("Resolution", errors='ignore')
-            self.calculate_metrics(report_layout)
-            self.calculate_overall_metrics(report_layout)
-
-            report_layout = report_layout.applymap(lambda x: str(x).rstrip("days"))
-            report_layout = report_layout.fillna('')
+            with tracer.span("fetch_report_data"):
+                fetched_data = self.run_query_plan(plan)
+        except requests.exceptions.RequestException:
+            logging.error("Reports for %s to %s not generated, a Jira query failed.", span_start, span_end)
+            return {}
+
+        with tracer.span("split_months"):
+            monthly_data = {month_start[:7]: {job_key: [] for job_key in jql_jobs} for month_start, _, _ in months}
+            for job_key, issues in fetched_data.items():
+                window_field, month_windows = windows[job_key]
+                for issue in issues:
+                    for value in field_values(issue, window_field):
+                        for month, (window_start, window_end) in month_windows.items():
+                            if window_start <= value < window_end:
+                                monthly_data[month][job_key].append(issue)
+
+        reports = {}
+        for month_start, _, report_filename in months:
+            with tracer.context(month=month_start[:7]):
+                with tracer.span("build_report_layout"):
+                    report_layout = self.build_report_layout(monthly_data[month_start[:7]])
+                with tracer.span("save_report"):
+                    self.save_report(report_layout, report_filename)
+            reports[report_filename] = report_layout
+        return reports
+
+    def cell_month_windows(self, data, months, span_start, span_end):
+        """
+        Month windows of every section/sub-query JQL, see month_windows.
+
+        :return: Dictionary of (section, sub_query) to (REST field id, {YYYY-MM: (start, end)}), None when
+                 a JQL is not bounded on one date field
+        """
+        windows = {}
+        for sub_query in COUNT_ROWS:
+            for section in ('Regression', 'Exploratory'):
+                windows[(section, sub_query)] = self.month_windows(data[section][sub_query], months, span_start, span_end)
+                if windows[(section, sub_query)] is None:
+                    logging.warning("%s %s JQL is not bounded on one date field", section, sub_query)
+                    return None
+        return windows
+
+    @staticmethod
+    def month_windows(jql_template, months, span_start, span_end):
+        """
+        Date window of a section/sub-query JQL in every month, as the month's own JQL bounds it.
+
+        A "<=" bound on a date without a time is 00:00 of that day in Jira, so the window ends
+        there rather than at the end of the day.
+
+        :param jql_template: JQL template of the section/sub-query
+        :param months: Months as returned by iter_months
+        :param span_start: First day of the range
+        :param span_end: Last day of the range
+        :return: Tuple of (REST field id, {YYYY-MM: (start, end)}), None when a month JQL is not bounded on
+                 both sides of a date field or uses the dates outside those bounds
+        """
+        jira_field = None
+        windows = {}
+        undated = set()
+        # The span query comes first, its entry is replaced by the window of the first month
+        for month_start, month_end in [(span_start, span_end)] + [month[:2] for month in months]:
+            jql_query = render_jql(jql_template, month_start, month_end)
+            window = date_window(jql_query)
+            if window is None or (jira_field is not None and field_id(window[0]) != jira_field):
+                return None
+            jira_field = field_id(window[0])
+            undated.add(compile_undated_jql(jql_query, jira_field).canonical())
+            windows[month_start[:7]] = window[1:]
+        # Everything but the date bounds has to be the same in every month for one fetch to cover them
+        if len(undated) > 1:
+            return None
+        return jira_field, windows
+
+    def build_metrics_cube(self, data, start_date, end_date, grain="day"):
+        """
+        Fetch the issues of every section/sub-query over a date range once and aggregate them into a cube.
+
+        Every cell JQL is a member of the cube's member dimension, next to the priority columns and
+        the dimensions of the optional "metrics_cube" config section.
+
+        :param data: Report config
+        :param start_date: Value for {{start_date}}
+        :param end_date: Value for {{end_date}}
+        :param grain: Time grain of the cube's periods, one of metrics_cube.GRAINS
+        :return: CellCube, None when a cell JQL cannot be evaluated locally
+        """
+        jql_jobs = self.render_jql_jobs(data, start_date, end_date, lambda sub_query: ())
+        cube_config = data.get("metrics_cube") or {}
+        try:
+            cell_cube = CellCube({job_key: (jql_query, "created") for job_key, (jql_query, _) in jql_jobs.items()},
+                                 self.priority_classifier, dimensions_from_config(cube_config.get("dimensions"), self.priority_classifier),
+                                 grain=grain)
+        except UnsupportedJQL as e:
+            logging.warning("Metrics cube not built: %s", e)
+            return None
+
+        tracer = get_default_tracer()
+        with tracer.span("fetch_report_data"):
+            issues = self.fetch_and_sort_data(cell_cube.jql, fields=cell_cube.fields())
+        with tracer.span("build_metrics_cube"):
+            cell_cube.build(issues)
+        self.metrics_cube = cell_cube
+        return cell_cube
+
+    def generate_cube_reports(self, start_date, end_date):
+        """
+        Generate the monthly reports for a date range as projections of one metrics cube.
+
+        Every JQL is templated once over the whole span and fetched with a single union query.
+        Each report cell is then the slice of its member over the date window the month's own JQL
+        has, so a month counts exactly the issues its monthly query would.
+
+        :param start_date: First day of the range (YYYY-MM-DD)
+        :param end_date: Last day of the range (YYYY-MM-DD)
+        :return: Dictionary of report filename to report frame, None when a JQL needs Jira to evaluate or
+                 is not bounded on the created or resolution date
+        """
+        data = self.load_report_config()
+        if data is None:
+            return {}
+
+        months = list(self.iter_months(start_date, end_date))
+        if not months:
+            return {}
+        span_start, span_end = months[0][0], months[-1][1]
+
+        if not self.validate_report_data(None, data, self.common_sub_queries, span_start, span_end):
+            logging.error("Validation failed. Please check the errors in the log.")
+            return {}
 
-            print(report_layout)
-            
-            report_directory = "reports"
+        windows = self.cell_month_windows(data, months, span_start, span_end)
+        if windows is None or any(window_field not in EVENT_FIELDS for window_field, _ in windows.values()):
+            logging.warning("Metrics cube not built, every JQL has to be bounded on the created or resolution date")
+            return None
 
-            if not os.path.exists(report_directory):
-                os.makedirs(report_directory)
+        tracer = get_default_tracer()
+        try:
+            cell_cube = self.build_metrics_cube(data, span_start, span_end)
+        except requests.exceptions.RequestException:
+            logging.error("Reports for %s to %s not generated, a Jira query failed.", span_start, span_end)
+            return {}
+        if cell_cube is None:
+            return None
+        logging.info("%s to %s: 1 Jira query, metrics cube of %d cells", span_start, span_end, len(cell_cube.cube.facts))
+
+        reports = {}
+        for month_start, month_end, report_filename in months:
+            with tracer.context(month=month_start[:7]):
+                with tracer.span("build_report_layout"):
+                    fetched_data = {cell_key: cell_cube.priority_counts(cell_key, windows[cell_key][1][month_start[:7]])
+                                    for cell_key in cell_cube.cells}
+                    report_layout = self.build_report_layout(fetched_data)
+                with tracer.span("save_report"):
+                    self.save_report(report_layout, report_filename)
+            reports[report_filename] = report_layout
+        return reports
+
+    @staticmethod
+    def number_format(row):
+        return PERCENTAGE_FORMAT if row in PERCENTAGE_ROWS else COUNT_FORMAT
+
+    def iter_drill_down(self, data, months):
+        """
+        Stream every issue of every section/sub-query over a range of months, one JQL after the other.
+
+        An issue is listed under the month it is counted in: the range JQL is split with the month
+        windows of its section/sub-query, as range mode does. Configs whose JQL is not bounded on
+        one date field are queried month by month instead.
+
+        :param data: Report config
+        :param months: Months as returned by iter_months
+        :return: Generator of (month, section, sub_query, issue), month is YYYY-MM
+        """
+        span_start, span_end = months[0][0], months[-1][1]
+        windows = self.cell_month_windows(data, months, span_start, span_end)
+        if windows is None:
+            def fields_for(sub_query):
+                return tuple(dict.fromkeys(DRILL_DOWN_FIELDS + (self.priority_classifier.field,)))
+
+            for month_start, month_end, _ in months:
+                jql_jobs = self.render_jql_jobs(data, month_start, month_end, fields_for)
+                for (section, sub_query), (jql_query, fields) in jql_jobs.items():
+                    for issue in self.search_client.search(jql_query, fields=fields):
+                        yield month_start[:7], section, sub_query, issue
+            return
 
-            report_filepath = os.path.join(report_directory, report_filename)
+        def fields_for(sub_query):
+            return tuple(dict.fromkeys(DRILL_DOWN_FIELDS + (self.priority_classifier.field,) + tuple(
+                windows[(section, sub_query)][0] for section in ('Regression', 'Exploratory'))))
+
+        for (section, sub_query), (jql_query, fields) in self.render_jql_jobs(data, span_start, span_end, fields_for).items():
+            window_field, month_windows = windows[(section, sub_query)]
+            for issue in self.search_client.search(jql_query, fields=fields):
+                for value in field_values(issue, window_field):
+                    for month, (window_start, window_end) in month_windows.items():
+                        if window_start <= value < window_end:
+                            yield month, section, sub_query, issue
+
+    def export_workbook(self, reports, workbook_path, start_date, end_date, drill_down=True, defect_age_frame=None):
+        """
+        Write the reports of a date range into one workbook.
+
+        The workbook holds a summary sheet with every month, one sheet per month, the optional
+        defect age frame and, with drill_down, one sheet per section and priority column listing
+        every issue with a link to Jira. Rows are streamed to disk as they are written.
+
+        :param reports: Dictionary of report filename to report frame, in month order
+        :param workbook_path: Output .xlsx file
+        :param start_date: First day of the range (YYYY-MM-DD)
+        :param end_date: Last day of the range (YYYY-MM-DD)
+        :param drill_down: Also list the issues behind every count (default is True)
+        :param defect_age_frame: Optional numeric defect age frame
+        :return: Path of the workbook, None when there is nothing to export
+        """
+        data = self.load_report_config()
+        if data is None or not reports:
+            logging.error("No reports to export.")
+            return None
+
+        months = list(self.iter_months(start_date, end_date))
+        tracer = get_default_tracer()
+        directory = os.path.dirname(workbook_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with tracer.span("export_workbook"), WorkbookExporter(workbook_path, browse_url(self.api_url)) as exporter:
+            month_labels = [os.path.splitext(report_filename)[0] for report_filename in reports]
+            summary = pd.concat(list(reports.values()), axis=0, keys=month_labels, names=['Report', None])
+            exporter.write_frame("Summary", summary, self.number_format)
+            for month_label, report_layout in zip(month_labels, reports.values()):
+                exporter.write_frame(month_label, report_layout, self.number_format)
+            if defect_age_frame is not None:
+                exporter.write_frame("Defect Age", defect_age_frame)
+            if drill_down and months:
+                for month, section, sub_query, issue in self.iter_drill_down(data, months):
+                    exporter.write_issue(f"{section} {self.priority_classifier.classify(issue)}", month, sub_query, issue)
+        print(f"Workbook saved to {workbook_path}")
+        return workbook_path
+
+    @classmethod
+    def combine_reports(cls, reports=None, report_directory=DEFAULT_REPORT_DIRECTORY):
+        """
+        Write every monthly report into one combined workbook, in month order.
+
+        :param reports: Dictionary of report filename to report frame as returned by
+                        generate_monthly_reports, the reports directory is read when omitted
+        :param report_directory: Directory holding the monthly reports
+        """
+        combined_report_filename = "combined_report.xlsx"
 
-            report_layout.to_excel(report_filepath, index=True)
-            print(f"Report saved to {report_filepath}")
-        else:
-            logging.error("Validation failed. Please check the errors in the log.")
+        # Frames read back from Excel are already formatted, in-memory frames are numeric
+        needs_formatting = reports is not None
+        if reports is None:
+            report_files = os.listdir(report_directory)
+            report_files = sorted(file for file in report_files if file.endswith('.xlsx') and file != combined_report_filename)
+            reports = {report_file: pd.read_excel(os.path.join(report_directory, report_file), index_col=0)
+                       for report_file in report_files}
 
-    def combine_reports(self):
-        report_directory = "reports"
-        report_files = os.listdir(report_directory)
-        report_files = [file for file in report_files if file.endswith('.xlsx')]
-        combined_data = pd.DataFrame()
+        if not reports:
+            logging.error("No reports to combine.")
+            return
 
-        for report_file in report_files:
-            report_filepath = os.path.join(report_directory, report_file)
-            report_data = pd.read_excel(report_filepath, index_col=0)
-            combined_data = pd.concat([combined_data, report_data], axis=0)
+        # One concat over all months instead of growing the frame file by file
+        month_labels = [os.path.splitext(report_filename)[0] for report_filename in reports]
+        combined_data = pd.concat(list(reports.values()), axis=0, keys=month_labels, names=['Report', None])
+        if needs_formatting:
+            combined_data = cls.format_report(combined_data)
 
-        combined_report_filename = "combined_report.xlsx"
         combined_report_filepath = os.path.join(report_directory, combined_report_filename)
         combined_data.to_excel(combined_report_filepath)
         print(f"Combined report saved to {combined_report_filepath}")
 
-def main():
-    logging.basicConfig(level=logging.ERROR)
-
-    if not os.path.exists("reports"):
-        os.makedirs("reports")
-
-    base_directory = "/path/Report_Script/QMR_json/"
-    json_options = {"Option1": "Option1.json", "Option2": "Option2.json"}
-
-    while True:
-        print("Choose an option:")
-        for option in json_options:
-            print(f"{option}: {json_options[option]}")
-
-        user_choice = input("Enter your choice: ")
+def run_qmr(json_file_path, start_date, end_date, no_cache=False, refresh=False, no_mirror=False, rate_limit=None,
+            range_mode=False, combine=True, trace_path=None, prometheus_path=None, cube_mode=False, export_path=None,
+            drill_down=True, capture_path=None, replay_path=None):
+    """
+    Generate the monthly QMR reports for a config and date range without prompting.
+
+    :param json_file_path: QMR config file
+    :param start_date: First day of the range, YYYY-MM-DD
+    :param end_date: Last day of the range, YYYY-MM-DD
+    :param combine: Also write the combined workbook
+    :param cube_mode: Project the reports from one metrics cube, see generate_cube_reports
+    :param export_path: Optional workbook holding every month and the drill-down sheets, see export_workbook
+    :param drill_down: Add the drill-down sheets to the exported workbook
+    :param capture_path: Optional snapshot directory every Jira response of the run is recorded into
+    :param replay_path: Optional snapshot directory the run is generated from without querying Jira
+    :param trace_path: Optional JSON file for the per-query run trace
+    :param prometheus_path: Optional Prometheus textfile for the run metrics
+    :return: Dictionary of report filename to report frame, None if the config is invalid
+    """
+    tracer = configure_default_tracer("qmr", config=os.path.basename(json_file_path), start_date=start_date, end_date=end_date)
+    try:
+        return _run_qmr(json_file_path, start_date, end_date, no_cache, refresh, no_mirror, rate_limit, range_mode, combine, cube_mode,
+                        export_path, drill_down, capture_path, replay_path)
+    finally:
+        release_snapshot_transport()
+        export_trace(tracer, trace_path, prometheus_path)
+
+
+def create_report_generator(json_file_path, data, query_cache=None, no_mirror=False):
+    """
+    Build a report generator for a validated QMR config, with its optional mirror and priority buckets.
+
+    :param json_file_path: QMR config file, re-read for every report
+    :param data: Parsed QMR config
+    :param query_cache: Optional QueryCache
+    :param no_mirror: Ignore the "issue_mirror" section of the config
+    :return: JiraReportGenerator instance
+    """
+    # Optional "issue_mirror": {"scope_jql": ..., "path": ...} section of the config
+    issue_mirror = None
+    mirror_config = data.get("issue_mirror")
+    if mirror_config and not no_mirror:
+        issue_mirror = IssueMirror(mirror_config["scope_jql"], path=mirror_config.get("path", DEFAULT_MIRROR_PATH))
+
+    priority_classifier = PriorityClassifier.from_config(data.get("priority_buckets"))
+
+    return JiraReportGenerator(data["api_credentials"]["api_url"], json_file_path, Jira_ID, Jira_Passsword, query_cache=query_cache,
+                               issue_mirror=issue_mirror, priority_classifier=priority_classifier)
+
+
+def _run_qmr(json_file_path, start_date, end_date, no_cache, refresh, no_mirror, rate_limit, range_mode, combine, cube_mode,
+             export_path, drill_down, capture_path=None, replay_path=None):
+    configure_snapshot_transport(capture_path, replay_path,
+                                 labels={'command': 'qmr', 'config': os.path.basename(json_file_path),
+                                         'start_date': start_date, 'end_date': end_date},
+                                 pool_size=max(DEFAULT_POOL_SIZE, DEFAULT_MAX_WORKERS * DEFAULT_MONTH_WORKERS), rate_limit=rate_limit)
+    if capture_path or replay_path:
+        # Every response of a snapshot comes from Jira, neither the cache nor the mirror answer a query
+        no_cache = no_mirror = True
 
-        if user_choice in json_options:
-            selected_json_file = json_options[user_choice]
-            json_file_path = os.path.join(base_directory, selected_json_file)
+    try:
+        data = load_json_config(json_file_path)
+        validate_date(start_date)
+        validate_date(end_date)
+    except ConfigError as e:
+        logging.error("%s", e)
+        return None
+
+    errors = validate_qmr_config(data)
+    if errors:
+        for error in errors:
+            logging.error(error)
+        return None
+
+    query_cache = None if no_cache else QueryCache(refresh=refresh)
+    jira_report_generator = create_report_generator(json_file_path, data, query_cache=query_cache, no_mirror=no_mirror)
+    if replay_path:
+        # Nothing is sent, so no token is needed
+        jira_report_generator.search_client.headers = {}
+    tracer = get_default_tracer()
+    with tracer.span("sync_issue_mirror"):
+        jira_report_generator.sync_issue_mirror()
+
+    reports = jira_report_generator.generate_monthly_reports(start_date, end_date, range_mode=range_mode, cube_mode=cube_mode)
+    if combine:
+        with tracer.span("combine_reports"):
+            jira_report_generator.combine_reports(reports, jira_report_generator.report_directory)
+    if export_path:
+        try:
+            jira_report_generator.export_workbook(reports, export_path, start_date, end_date, drill_down=drill_down)
+        except requests.exceptions.RequestException as e:
+            logging.error("Workbook %s not exported, a drill-down query failed: %s", export_path, e)
+        except ImportError as e:
+            logging.error("Workbook %s not exported: %s", export_path, e)
+    return reports
+
+
+def run_metrics_cube(json_file_path, start_date, end_date, grain=None, no_cache=False, no_mirror=False, rate_limit=None):
+    """
+    Fetch every QMR JQL over a date range once and aggregate the issues into a metrics cube for ad-hoc slicing.
+
+    :param json_file_path: QMR config file
+    :param start_date: Value for {{start_date}}, YYYY-MM-DD
+    :param end_date: Value for {{end_date}}, YYYY-MM-DD
+    :param grain: Time grain, defaults to the "grain" of the "metrics_cube" config section or day
+    :return: CellCube, None if the config is invalid, a JQL cannot be evaluated locally or the query failed
+    """
+    configure_default_transport(rate_limit=rate_limit)
+    try:
+        data = load_json_config(json_file_path)
+    except ConfigError as e:
+        logging.error("%s", e)
+        return None
+
+    query_cache = None if no_cache else QueryCache()
+    jira_report_generator = create_report_generator(json_file_path, data, query_cache=query_cache, no_mirror=no_mirror)
+    jira_report_generator.sync_issue_mirror()
+    grain = grain or (data.get("metrics_cube") or {}).get("grain", "day")
+    try:
+        return jira_report_generator.build_metrics_cube(data, start_date, end_date, grain=grain)
+    except requests.exceptions.RequestException:
+        logging.error("Metrics cube for %s to %s not built, the Jira query failed.", start_date, end_date)
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate monthly QMR reports from Jira.")
+    parser.add_argument("--config", help="QMR config file, prompted for on a terminal when neither --config nor --section is given")
+    parser.add_argument("--section", help="Config name in the QMR config directory, e.g. Option1")
+    parser.add_argument("--start-date", help="Start date (YYYY-MM-DD), prompted for on a terminal when omitted")
+    parser.add_argument("--end-date", help="End date (YYYY-MM-DD), prompted for on a terminal when omitted")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the query result cache")
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch every query and overwrite the cached results")
+    parser.add_argument("--no-mirror", action="store_true", help="Query Jira directly even if the config defines an issue mirror")
+    parser.add_argument("--rate-limit", type=float, help="Maximum Jira requests per second across all workers")
+    parser.add_argument("--range-mode", action="store_true", help="Fetch each JQL once for the whole date range and split it into months locally")
+    parser.add_argument("--cube-mode", action="store_true", help="Fetch every JQL in one query and project the reports from a metrics cube")
+    parser.add_argument("--export", help="Also write every month and the issue drill-downs into this workbook")
+    parser.add_argument("--no-drill-down", action="store_true", help="Leave the drill-down sheets out of the exported workbook")
+    snapshot_group = parser.add_mutually_exclusive_group()
+    snapshot_group.add_argument("--capture", help="Record every Jira response of the run into this snapshot directory")
+    snapshot_group.add_argument("--replay", help="Generate the reports from this snapshot directory without querying Jira")
+    parser.add_argument("--trace", help="Write a JSON trace of every query to this file")
+    parser.add_argument("--prometheus", help="Write run metrics in the Prometheus text format to this file")
+    parser.add_argument("--log-level", default="ERROR", help="Logging level, INFO logs every query")
+    args = parser.parse_args()
+    require_prompt_free_args(parser, args)
+    return args
 
-            break
-        else:
-            print("Invalid choice. Please choose a valid option.")
 
-    try:
-        with open(json_file_path, 'r') as json_file:
-            data = json.load(json_file)
-    except FileNotFoundError as e:
-        logging.error("JSON file not found: %s", str(e))
-        return
-    except KeyError:
-        logging.error("API credentials not found in JSON data.")
-        return
-
-    api_credentials = data.get("api_credentials")
-    if api_credentials is None:
-        logging.error("API credentials not found in JSON data.")
-        return
-
-    api_username = api_credentials.get("api_username")
-    api_password = api_credentials.get("api_password")
-    api_url = api_credentials.get("api_url")
-
-    if not api_username or not api_password or not api_url:
-        logging.error("API credentials incomplete in JSON data.")
-        return
-
-    auth = (api_username, api_password)
-
-    jira_report_generator = JiraReportGenerator(api_url, json_file_path, Jira_ID, Jira_Passsword)
-    start_date = input("Enter start date (YYYY-MM-DD): ")
-    end_date = input("Enter end date (YYYY-MM-DD): ")
-
-    jira_report_generator.generate_monthly_reports(start_date, end_date)
-    jira_report_generator.combine_reports()
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    json_file_path = args.config
+    if json_file_path is None:
+        json_options = CONFIG_SECTIONS
+        user_choice = args.section
+        while user_choice not in json_options:
+            if user_choice is not None:
+                print("Invalid choice. Please choose a valid option.")
+            print("Choose an option:")
+            for option in json_options:
+                print(f"{option}: {json_options[option]}")
+            user_choice = input("Enter your choice: ")
+        json_file_path = resolve_config_path(QMR_CONFIG_DIRECTORY, user_choice)
+
+    start_date = args.start_date or input("Enter start date (YYYY-MM-DD): ")
+    end_date = args.end_date or input("Enter end date (YYYY-MM-DD): ")
+
+    run_qmr(json_file_path, start_date, end_date, no_cache=args.no_cache, refresh=args.refresh, no_mirror=args.no_mirror,
+            rate_limit=args.rate_limit, range_mode=args.range_mode, trace_path=args.trace, prometheus_path=args.prometheus,
+            cube_mode=args.cube_mode, export_path=args.export, drill_down=not args.no_drill_down, capture_path=args.capture,
+            replay_path=args.replay)
 
 if __name__ == "__main__":
     main()
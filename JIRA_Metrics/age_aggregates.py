@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from changelog_store import parse_timestamp
+from defect_age_stats import SECONDS_PER_DAY
+from issue_mirror import RECONCILE_INTERVAL, SYNC_OVERLAP
+from jql_filter import compile_jql, compile_undated_jql, date_bounds, field_values, strip_order_by, UnsupportedJQL
+from query_planner import locally_exact
+from query_trace import get_default_tracer
+from report_config import render_jql
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AGGREGATE_PATH = os.path.join("cache", "age_aggregates.sqlite")
+
+# Fields every synced issue needs next to the fields of the cell JQLs
+AGGREGATE_FIELDS = ("created", "resolutiondate", "updated")
+
+# SQLite host parameter limit is 999 on older builds
+_KEY_BATCH_SIZE = 500
+
+# Dates the cell templates are rendered with to tell their date bounds from the rest of the JQL
+_PROBE_DATES = (("2001-01-01", "2001-01-31"), ("2002-02-01", "2002-02-28"))
+
+# Window field values are stored as wall-clock text, the way JQL dates compare
+_WINDOW_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Part of the signature, a store with older tables is rebuilt
+_SCHEMA_VERSION = 2
+
+
+def cell_id(cell_key):
+    return json.dumps(list(cell_key) if isinstance(cell_key, tuple) else cell_key)
+
+
+def undated_template(jql_template):
+    """
+    Split a cell JQL template into the date field its dates bound and the predicate of the rest.
+
+    :param jql_template: JQL with {{start_date}} and {{end_date}} placeholders
+    :return: Tuple of (REST field id or None, predicate)
+    """
+    probes = [render_jql(jql_template, start_date, end_date) for start_date, end_date in _PROBE_DATES]
+    # The dates may only bound one date field, a store keyed on the template has to hold every date range
+    for window_field in [None] + sorted(date_bounds(probes[0])):
+        predicates = [compile_undated_jql(jql_query, window_field) if window_field else compile_jql(strip_order_by(jql_query))
+                      for jql_query in probes]
+        if len({predicate.canonical() for predicate in predicates}) == 1:
+            return window_field, predicates[0]
+    raise UnsupportedJQL("JQL uses the dates outside the bounds of one date field: {}".format(jql_template))
+
+
+class AgeAggregateStore:
+    """
+    Defect age contributions per report cell and priority column, for any date range.
+
+    The store is keyed on the un-rendered cell JQL templates. Every issue of the scope that
+    matches a cell's JQL without its date bounds is kept with its creation time, resolution age
+    and the value of the bounded date field, so a report over any date range sums the rows
+    inside the bounds that range renders to with one indexed range scan. A sync only fetches the
+    issues updated since the previous one and replaces their rows, so a daily run costs as much
+    as the day's churn rather than the size of the backlog.
+
+    The cell JQLs are evaluated locally against the synced issues, so they must be exact without
+    Jira, and scope_jql must match every issue of every cell so that an issue leaving a cell is
+    seen. Issues that leave the scope or are deleted never come back in a delta sync, a periodic
+    key-only search of the scope removes them. Changing the scope, a cell JQL template or the
+    priority buckets rebuilds the store.
+    """
+
+    # Initialize store, cells maps a cell key to (JQL template, priority column or None),
+    # None puts each issue under its priority_classifier column,
+    # reconcile_interval=None never removes issues that left the scope
+    def __init__(self, scope_jql, cells, priority_classifier, path=DEFAULT_AGGREGATE_PATH, reconcile_interval=RECONCILE_INTERVAL):
+        self.scope_jql = scope_jql
+        self.path = path
+        self.reconcile_interval = reconcile_interval
+        self.priority_classifier = priority_classifier
+        self.cells = {}
+        fields = set(AGGREGATE_FIELDS) | {priority_classifier.field}
+        for cell_key, (jql_template, priority) in cells.items():
+            window_field, predicate = undated_template(jql_template)
+            if not locally_exact(predicate):
+                raise UnsupportedJQL("JQL of {} cannot be evaluated exactly without Jira: {}".format(cell_key, jql_template))
+            fields |= predicate.fields() | ({window_field} if window_field else set())
+            self.cells[cell_id(cell_key)] = (cell_key, jql_template, window_field, predicate, priority)
+        self.fields = tuple(sorted(field for field in fields if field != 'key'))
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+
+        signature = json.dumps({
+            'schema': _SCHEMA_VERSION,
+            'scope': scope_jql,
+            'cells': sorted((identifier, jql_template, priority) for identifier, (jql_template, priority) in
+                            ((cell_id(cell_key), cell) for cell_key, cell in cells.items())),
+            'buckets': priority_classifier.jql_clauses(),
+        })
+        if self._get_state('signature') != signature:
+            with self._lock, self._connection:
+                for table in ("members", "aggregates"):
+                    self._connection.execute("DROP TABLE IF EXISTS {}".format(table))
+                self._connection.execute("DELETE FROM sync_state")
+            self._set_state('signature', signature)
+        with self._lock, self._connection:
+            # Creation times and ages are whole seconds, so the sums stay exact
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS members (key TEXT NOT NULL, cell TEXT NOT NULL, bucket TEXT NOT NULL,"
+                " created INTEGER NOT NULL, resolved_age INTEGER NOT NULL, window_value TEXT, PRIMARY KEY (key, cell))"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS members_window ON members (cell, window_value)")
+
+    def _get_state(self, name):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, value))
+
+    @property
+    def watermark(self):
+        return self._get_state('watermark')
+
+    def sync_jql(self):
+        watermark = self.watermark
+        if watermark is None:
+            return self.scope_jql
+        return '({}) AND updated >= "{}"'.format(self.scope_jql, watermark)
+
+    def _memberships(self, issue):
+        # Rows (cell, bucket, created, resolved age, window value) the issue contributes now
+        fields = issue.get('fields', {})
+        created = parse_timestamp(fields.get('created'))
+        if created is None:
+            return []
+        resolved = parse_timestamp(fields.get('resolutiondate'))
+        # Like the full report, a resolved-age cell counts an issue without a resolution date as 0 days
+        resolved_age = max(0, int(resolved) - int(created)) if resolved is not None else 0
+        rows = []
+        for identifier, (_, _, window_field, predicate, priority) in self.cells.items():
+            if predicate(issue):
+                window_values = field_values(issue, window_field) if window_field else []
+                window_value = window_values[0].strftime(_WINDOW_FORMAT) if window_values else None
+                bucket = priority or self.priority_classifier.classify(issue)
+                rows.append((identifier, bucket, int(created), resolved_age, window_value))
+        return rows
+
+    def _apply(self, issues):
+        # Replace the rows of the page's issues, returns the number of issues whose rows changed
+        keys = [issue['key'] for issue in issues]
+        new_rows = defaultdict(set)
+        for issue in issues:
+            for row in self._memberships(issue):
+                new_rows[issue['key']].add(row)
+
+        with self._lock, self._connection:
+            placeholders = ','.join('?' * len(keys))
+            old_rows = defaultdict(set)
+            for key, *row in self._connection.execute(
+                    "SELECT key, cell, bucket, created, resolved_age, window_value FROM members WHERE key IN ({})".format(placeholders), keys):
+                old_rows[key].add(tuple(row))
+            self._connection.execute("DELETE FROM members WHERE key IN ({})".format(placeholders), keys)
+            self._connection.executemany(
+                "INSERT INTO members (key, cell, bucket, created, resolved_age, window_value) VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, *row) for key, rows in new_rows.items() for row in rows]
+            )
+        return sum(1 for key in keys if old_rows[key] != new_rows[key])
+
+    def sync(self, search_client):
+        """
+        Apply the issues updated since the last sync to the running aggregates.
+
+        The first sync reads the whole scope. Re-reading an issue, e.g. within the sync overlap,
+        replaces its previous contribution, so it is never counted twice. A delta sync is followed
+        by a reconcile when one is due.
+
+        :param search_client: JiraSearchClient used for the live search
+        :return: Number of issues read
+        """
+        jql_query = self.sync_jql()
+        full_sync = self.watermark is None
+        logger.info("Syncing age aggregates with JQL query: %s", jql_query)
+        synced = 0
+        changed_issues = 0
+        latest_update = None
+        with get_default_tracer().span("sync_age_aggregates"):
+            for page in search_client.iter_pages(jql_query, fields=self.fields):
+                issues = page.get('issues', [])
+                for offset in range(0, len(issues), _KEY_BATCH_SIZE):
+                    changed_issues += self._apply(issues[offset:offset + _KEY_BATCH_SIZE])
+                for issue in issues:
+                    updated = issue.get('fields', {}).get('updated')
+                    if updated and (latest_update is None or updated > latest_update):
+                        latest_update = updated
+                synced += len(issues)
+
+        if latest_update is not None:
+            latest = datetime.strptime(latest_update[:16], "%Y-%m-%dT%H:%M") - SYNC_OVERLAP
+            self._set_state('watermark', latest.strftime("%Y/%m/%d %H:%M"))
+        self._set_state('last_sync', datetime.now().isoformat(timespec='seconds'))
+        logger.info("Age aggregates synced %d issues, %d of them changed", synced, changed_issues)
+
+        if full_sync:
+            # A full read holds nothing outside the scope
+            self._set_state('last_reconcile', datetime.now().isoformat(timespec='seconds'))
+        elif self.reconcile_due():
+            self.reconcile(search_client)
+        return synced
+
+    def reconcile_due(self):
+        if self.reconcile_interval is None:
+            return False
+        last_reconcile = self._get_state('last_reconcile')
+        return last_reconcile is None or datetime.now() - datetime.fromisoformat(last_reconcile) >= self.reconcile_interval
+
+    def reconcile(self, search_client):
+        """
+        Remove the rows of issues that no longer match the scope, e.g. moved to another project or deleted.
+
+        Only the keys of the whole scope are fetched and compared with the store.
+
+        :param search_client: JiraSearchClient used for the live search
+        :return: Number of issues removed
+        """
+        logger.info("Reconciling age aggregates with JQL query: %s", self.scope_jql)
+        in_scope = set()
+        for page in search_client.iter_pages(self.scope_jql, fields=("key",)):
+            in_scope.update(issue['key'] for issue in page.get('issues', []))
+
+        with self._lock:
+            stored = [row[0] for row in self._connection.execute("SELECT DISTINCT key FROM members")]
+        removed = [key for key in stored if key not in in_scope]
+        for offset in range(0, len(removed), _KEY_BATCH_SIZE):
+            keys = removed[offset:offset + _KEY_BATCH_SIZE]
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM members WHERE key IN ({})".format(','.join('?' * len(keys))), keys)
+
+        self._set_state('last_reconcile', datetime.now().isoformat(timespec='seconds'))
+        logger.info("Age aggregates reconciled, %d issues left the scope", len(removed))
+        return len(removed)
+
+    def cell_means(self, start_date, end_date, as_of=None):
+        """
+        Mean ages per cell and priority column over a date range.
+
+        Each cell template is rendered with the dates and only the rows inside the date bounds of
+        the rendered JQL are summed, so a cell counts exactly the issues its JQL matches.
+
+        :param start_date: Value for {{start_date}}
+        :param end_date: Value for {{end_date}}
+        :param as_of: Epoch seconds the age of an issue is measured up to (default is the current time)
+        :return: Dictionary of cell key to {column: {'count', 'resolved_age', 'age'}} with means in days,
+                 resolved_age runs to the resolution date and age to as_of
+        """
+        as_of = datetime.now().timestamp() if as_of is None else as_of
+        means = {}
+        for identifier, (cell_key, jql_template, window_field, _, _) in self.cells.items():
+            query = "SELECT bucket, COUNT(*), SUM(created), SUM(resolved_age) FROM members WHERE cell = ?"
+            parameters = [identifier]
+            if window_field:
+                window_start, window_end = date_bounds(render_jql(jql_template, start_date, end_date)).get(window_field, (None, None))
+                if window_start is not None:
+                    query += " AND window_value >= ?"
+                    parameters.append(window_start.strftime(_WINDOW_FORMAT))
+                if window_end is not None:
+                    query += " AND window_value < ?"
+                    parameters.append(window_end.strftime(_WINDOW_FORMAT))
+            with self._lock:
+                rows = self._connection.execute(query + " GROUP BY bucket", parameters).fetchall()
+            means[cell_key] = {
+                bucket: {
+                    'count': count,
+                    'resolved_age': resolved_age_sum / count / SECONDS_PER_DAY,
+                    'age': (count * as_of - created_sum) / count / SECONDS_PER_DAY,
+                }
+                for bucket, count, created_sum, resolved_age_sum in rows
+            }
+        return means
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
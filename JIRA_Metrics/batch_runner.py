@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Run the QMR and defect age reports of many configs in one process.
+
+Every config shares the process-wide token client and pooled transport, and all report queries
+go through one QueryScheduler: the number of queries in flight is capped for the whole batch,
+and a JQL several configs ask for at the same time is sent to Jira once. Finished issue lists are
+not kept, a later request for the same JQL is answered by the query cache. Configs sharing an
+issue mirror file share one mirror, synced once.
+
+Each config writes to its own directory, reports/<config name>/ for QMR and defect/<config name>/
+for defect age, so configs do not overwrite each other's workbooks.
+
+Example:
+    python jira_metrics.py batch --all-sections --start-date 2024-01-01 --end-date 2024-03-31
+"""
+
+import logging
+import os
+
+import requests
+
+from Report__ import create_report_generator, DEFAULT_REPORT_DIRECTORY as QMR_REPORT_DIRECTORY
+from Defect_Age import create_defect_age_report, generate_defect_age_report, DEFAULT_REPORT_DIRECTORY as DEFECT_AGE_REPORT_DIRECTORY
+from query_cache import QueryCache
+from query_executor import QueryExecutor
+from query_scheduler import QueryScheduler
+from jira_transport import configure_default_transport, DEFAULT_POOL_SIZE
+from query_trace import get_default_tracer, configure_default_tracer, export_trace
+from report_config import (ConfigError, load_json_config, validate_date, validate_qmr_config, validate_defect_age_config,
+                           split_defect_age_config)
+
+logger = logging.getLogger(__name__)
+
+# Queries in flight for the whole batch, shared by every config
+DEFAULT_BATCH_WORKERS = 16
+# Configs generated concurrently, their queries still go through the shared scheduler
+DEFAULT_CONFIG_WORKERS = 4
+
+
+def config_name(json_file_path):
+    return os.path.splitext(os.path.basename(json_file_path))[0]
+
+
+class BatchJob:
+
+    # Initialize one config of the batch, kind is 'qmr' or 'defect_age',
+    # report is the JiraReportGenerator or DefectAgeReport built for it
+    def __init__(self, kind, json_file_path, report, settings=None):
+        self.kind = kind
+        self.json_file_path = json_file_path
+        self.name = config_name(json_file_path)
+        self.report = report
+        self.settings = settings or {}
+
+    @property
+    def key(self):
+        return self.kind, self.name
+
+
+def load_batch_jobs(qmr_config_paths, defect_age_config_paths, start_date, end_date, query_cache=None, no_mirror=False):
+    """
+    Validate every config and build its report, invalid configs are logged and left out.
+
+    :return: Tuple of (list of BatchJob, list of (kind, config path, error) for the skipped configs)
+    """
+    jobs, failed = [], []
+    for json_file_path in qmr_config_paths:
+        try:
+            data = load_json_config(json_file_path)
+        except ConfigError as e:
+            failed.append(('qmr', json_file_path, str(e)))
+            continue
+        errors = validate_qmr_config(data)
+        if errors:
+            failed.append(('qmr', json_file_path, "; ".join(errors)))
+            continue
+        generator = create_report_generator(json_file_path, data, query_cache=query_cache, no_mirror=no_mirror)
+        jobs.append(BatchJob('qmr', json_file_path, generator))
+
+    for json_file_path in defect_age_config_paths:
+        try:
+            queries, settings = split_defect_age_config(load_json_config(json_file_path))
+        except ConfigError as e:
+            failed.append(('defect_age', json_file_path, str(e)))
+            continue
+        errors = validate_defect_age_config(queries)
+        if errors:
+            failed.append(('defect_age', json_file_path, "; ".join(errors)))
+            continue
+        report = create_defect_age_report(queries, settings, start_date, end_date, query_cache=query_cache, no_mirror=no_mirror)
+        jobs.append(BatchJob('defect_age', json_file_path, report, settings))
+
+    for _, json_file_path, error in failed:
+        logger.error("Skipping %s: %s", json_file_path, error)
+    return jobs, failed
+
+
+def attach_scheduler(jobs, scheduler):
+    # Every report dispatches onto the shared pool and joins the fetches other configs have in flight
+    for job in jobs:
+        job.report.query_executor = scheduler
+        job.report.search_client.scheduler = scheduler
+        directory = QMR_REPORT_DIRECTORY if job.kind == 'qmr' else DEFECT_AGE_REPORT_DIRECTORY
+        job.report.report_directory = os.path.join(directory, job.name)
+
+
+def share_mirrors(jobs):
+    """
+    Replace mirrors opened on the same file and scope by one shared mirror.
+
+    Two mirrors on one file would each miss the issues the other synced.
+
+    :param jobs: List of BatchJob
+    :return: List of (IssueMirror, JiraSearchClient) pairs, one per distinct mirror
+    """
+    mirrors = {}
+    for job in jobs:
+        mirror = job.report.issue_mirror
+        if mirror is None:
+            continue
+        key = (os.path.abspath(mirror.path), mirror.scope_jql)
+        if key not in mirrors:
+            mirrors[key] = (mirror, job.report.search_client)
+            continue
+        shared_mirror = mirrors[key][0]
+        if mirror is not shared_mirror:
+            mirror.close()
+        job.report.issue_mirror = shared_mirror
+        job.report.search_client.mirror = shared_mirror
+    return list(mirrors.values())
+
+
+def sync_mirrors(mirrors, jobs):
+    tracer = get_default_tracer()
+    for mirror, search_client in mirrors:
+        with tracer.span("sync_issue_mirror"):
+            try:
+                mirror.sync(search_client)
+            except requests.exceptions.RequestException as e:
+                logger.error("Issue mirror sync of %s failed, its configs query Jira directly: %s", mirror.path, e)
+                for job in jobs:
+                    if job.report.search_client.mirror is mirror:
+                        job.report.search_client.mirror = None
+
+
+def run_batch_job(job, start_date, end_date, range_mode=False, cube_mode=False, combine=True):
+    """
+    Generate the reports of one config.
+
+    :return: Dictionary of report filename to frame for QMR, the report frame for defect age,
+             None when the config failed
+    """
+    tracer = get_default_tracer()
+    with tracer.context(config=job.name):
+        try:
+            if job.kind == 'qmr':
+                reports = job.report.generate_monthly_reports(start_date, end_date, range_mode=range_mode, cube_mode=cube_mode)
+                if combine and reports:
+                    with tracer.span("combine_reports"):
+                        job.report.combine_reports(reports, job.report.report_directory)
+                return reports
+            return generate_defect_age_report(job.report, job.settings, start_date, end_date)
+        except Exception:
+            # One broken config must not stop the rest of the batch
+            logger.exception("%s report of %s failed", job.kind, job.json_file_path)
+            return None
+
+
+def run_batch(qmr_config_paths, defect_age_config_paths, start_date, end_date, no_cache=False, refresh=False, no_mirror=False,
+              rate_limit=None, max_workers=DEFAULT_BATCH_WORKERS, config_workers=DEFAULT_CONFIG_WORKERS, range_mode=False,
+              cube_mode=False, combine=True, trace_path=None, prometheus_path=None):
+    """
+    Generate the reports of every QMR and defect age config in one process.
+
+    :param qmr_config_paths: QMR config files
+    :param defect_age_config_paths: Defect age config files
+    :param start_date: First day of the range, YYYY-MM-DD
+    :param end_date: Last day of the range, YYYY-MM-DD
+    :param max_workers: Queries in flight for the whole batch
+    :param config_workers: Configs generated concurrently
+    :param trace_path: Optional JSON file for the per-query run trace, queries are labelled with their config
+    :param prometheus_path: Optional Prometheus textfile for the run metrics
+    :return: Dictionary of (kind, config name) to the result of run_batch_job, None if the dates are invalid
+    """
+    tracer = configure_default_tracer("batch", start_date=start_date, end_date=end_date)
+    try:
+        return _run_batch(qmr_config_paths, defect_age_config_paths, start_date, end_date, no_cache, refresh, no_mirror,
+                          rate_limit, max_workers, config_workers, range_mode, cube_mode, combine)
+    finally:
+        export_trace(tracer, trace_path, prometheus_path)
+
+
+def _run_batch(qmr_config_paths, defect_age_config_paths, start_date, end_date, no_cache, refresh, no_mirror, rate_limit,
+               max_workers, config_workers, range_mode, cube_mode, combine):
+    try:
+        validate_date(start_date)
+        validate_date(end_date)
+    except ConfigError as e:
+        logger.error("%s", e)
+        return None
+
+    # One pool of connections sized for the whole batch, the token client is process-wide already
+    configure_default_transport(pool_size=max(DEFAULT_POOL_SIZE, max_workers), rate_limit=rate_limit)
+    query_cache = None if no_cache else QueryCache(refresh=refresh)
+
+    jobs, failed = load_batch_jobs(qmr_config_paths, defect_age_config_paths, start_date, end_date,
+                                   query_cache=query_cache, no_mirror=no_mirror)
+    results = {(kind, config_name(json_file_path)): None for kind, json_file_path, _ in failed}
+    if not jobs:
+        return results
+
+    scheduler = QueryScheduler(max_workers=max_workers)
+    try:
+        attach_scheduler(jobs, scheduler)
+        sync_mirrors(share_mirrors(jobs), jobs)
+
+        config_executor = QueryExecutor(max_workers=config_workers)
+        job_results = config_executor.run(
+            lambda job: run_batch_job(job, start_date, end_date, range_mode=range_mode, cube_mode=cube_mode, combine=combine),
+            {job.key: (job,) for job in jobs})
+        results.update(job_results)
+
+        summary = scheduler.summary()
+        logger.info("Batch of %d configs: %d distinct queries, %d answered from another config's fetch",
+                    len(jobs), summary['queries'], summary['deduplicated'])
+    finally:
+        scheduler.close()
+    return results
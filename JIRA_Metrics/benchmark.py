@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+End-to-end report benchmark against the local mock Jira/LASSO server in mock_jira.py.
+
+For every issue set size a mock server is started in its own process, then every stage runs in a
+fresh process so its peak RSS is not inflated by earlier stages. Request count and bytes
+transferred are read from the mock server counters, which are reset before each stage.
+The monthly and range stages write their reports to reports/<stage>/ so that the combine stage
+combines the monthly stage's reports only.
+
+Example:
+    python benchmark.py --issues 1000 50000 --latency 0.05 --output benchmark.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import Request, urlopen
+
+from mock_jira import SEARCH_PATH, TOKEN_PATH, STATS_PATH, PROJECT_KEY
+
+STAGES = ("monthly_reports", "range_reports", "combine_reports", "defect_age")
+
+# Synthetic configs in the JQL subset the mock server evaluates
+SECTION_LABELS = {"Regression": "regression", "Exploratory": "exploratory"}
+CREATED_RANGE = 'created >= "{{start_date}}" AND created <= "{{end_date}}"'
+RESOLVED_RANGE = 'resolutiondate >= "{{start_date}}" AND resolutiondate <= "{{end_date}}"'
+QMR_SUB_QUERY_TEMPLATES = {
+    "BugsRaised": CREATED_RANGE,
+    "Resolved": RESOLVED_RANGE,
+    "Fixed": RESOLVED_RANGE + ' AND resolution = Fixed',
+    "GerritFix": RESOLVED_RANGE + ' AND resolution = Fixed AND labels = gerrit',
+    "Noise": RESOLVED_RANGE + ' AND resolution in (Duplicate, "Won\'t Fix", "Cannot Reproduce")',
+    "Resolution": RESOLVED_RANGE + ' AND resolution is not EMPTY',
+}
+DEFECT_AGE_TEMPLATES = {
+    "resolved_queries": RESOLVED_RANGE,
+    "unresolved_queries": 'resolution = Unresolved AND created <= "{{end_date}}"',
+}
+
+
+def section_jql(section, condition):
+    return 'project = {} AND labels = {} AND {}'.format(PROJECT_KEY, SECTION_LABELS[section], condition)
+
+
+def write_configs(workdir, base_url):
+    """
+    Write QMR and defect age configs pointing at the mock server.
+
+    :param workdir: Benchmark working directory
+    :param base_url: Mock server base URL
+    :return: Tuple of (QMR config path, defect age config path)
+    """
+    qmr_config = {
+        "api_credentials": {"api_username": "bench", "api_password": "bench", "api_url": base_url + SEARCH_PATH},
+    }
+    for section in SECTION_LABELS:
+        qmr_config[section] = {sub_query: section_jql(section, template)
+                               for sub_query, template in QMR_SUB_QUERY_TEMPLATES.items()}
+
+    defect_age_config = {
+        "{}_{}".format(section.lower(), metric): section_jql(section, template)
+        for section in SECTION_LABELS
+        for metric, template in DEFECT_AGE_TEMPLATES.items()
+    }
+
+    paths = []
+    for name, config in (("qmr.json", qmr_config), ("defect_age.json", defect_age_config)):
+        path = os.path.join(workdir, name)
+        with open(path, "w") as config_file:
+            json.dump(config, config_file, indent=2)
+        paths.append(path)
+    return tuple(paths)
+
+
+def start_mock_server(issue_count, latency, seed):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_jira.py")
+    process = subprocess.Popen(
+        [sys.executable, script, "--issues", str(issue_count), "--latency", str(latency), "--seed", str(seed)],
+        stdout=subprocess.PIPE, text=True
+    )
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.kill()
+        raise RuntimeError("Mock Jira server did not start")
+    return process, base_url
+
+
+def server_stats(base_url):
+    with urlopen(base_url + STATS_PATH) as response:
+        return json.load(response)
+
+
+def reset_server_stats(base_url):
+    with urlopen(Request(base_url + STATS_PATH + "/reset", data=b"", method="POST")):
+        pass
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_report_generator(base_url, qmr_config_path, query_cache):
+    from Report__ import JiraReportGenerator
+    from lasso_auth import get_token_client
+
+    class BenchmarkReportGenerator(JiraReportGenerator):
+
+        # Fetch tokens from the mock LASSO endpoint
+        def get_lasso_auth(self, jira_id, jira_password):
+            return get_token_client(base_url + TOKEN_PATH, jira_id, jira_password, "LabCollabJira")
+
+    return BenchmarkReportGenerator(base_url + SEARCH_PATH, qmr_config_path, "bench", "bench", query_cache=query_cache)
+
+
+def stage_query_cache(options):
+    if not options["query_cache"]:
+        return None
+    from query_cache import QueryCache
+    return QueryCache(path=os.path.join("cache", "benchmark_query_cache.sqlite"))
+
+
+def stage_report_directory(stage):
+    # Each report stage writes its own directory, combine_reports reads the monthly stage's reports only
+    from Report__ import DEFAULT_REPORT_DIRECTORY
+    return os.path.join(DEFAULT_REPORT_DIRECTORY, stage)
+
+
+def benchmark_monthly_reports(base_url, options, range_mode=False):
+    generator = make_report_generator(base_url, options["qmr_config"], stage_query_cache(options))
+    generator.report_directory = stage_report_directory("range_reports" if range_mode else "monthly_reports")
+    reports = generator.generate_monthly_reports(options["start_date"], options["end_date"], range_mode=range_mode)
+    return {"reports": len(reports)}
+
+
+def benchmark_range_reports(base_url, options):
+    return benchmark_monthly_reports(base_url, options, range_mode=True)
+
+
+def benchmark_combine_reports(base_url, options):
+    from Report__ import JiraReportGenerator
+    report_directory = stage_report_directory("monthly_reports")
+    if not os.path.isdir(report_directory):
+        raise RuntimeError("No monthly reports to combine, run the monthly_reports stage first")
+    JiraReportGenerator.combine_reports(report_directory=report_directory)
+    return {}
+
+
+def benchmark_defect_age(base_url, options):
+    from Defect_Age import DefectAgeReport
+    from lasso_auth import get_token_client
+    from report_config import load_json_config, render_defect_age_queries
+
+    token_client = get_token_client(base_url + TOKEN_PATH, "bench", "bench", "name")
+
+    def headers():
+        return {'Authorization': f'Bearer {token_client.get_access_token()}'}
+
+    queries = render_defect_age_queries(load_json_config(options["defect_age_config"]), options["start_date"], options["end_date"])
+    report = DefectAgeReport(queries, query_cache=stage_query_cache(options), server=base_url, headers=headers,
+                             report_statistics=("mean", "median", "p90", "max"))
+    report.save_report(report.build_report(), options["start_date"])
+    return {}
+
+
+STAGE_RUNNERS = {
+    "monthly_reports": benchmark_monthly_reports,
+    "range_reports": benchmark_range_reports,
+    "combine_reports": benchmark_combine_reports,
+    "defect_age": benchmark_defect_age,
+}
+
+
+def _stage_process(stage, base_url, options, results):
+    os.chdir(options["workdir"])
+    # Report modules print every frame, keep the benchmark output readable
+    sys.stdout = open(os.devnull, "w")
+    error = None
+    details = {}
+    start = time.perf_counter()
+    try:
+        details = STAGE_RUNNERS[stage](base_url, options)
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    results.put({"wall_time": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb(), "error": error, **details})
+
+
+def run_stage(stage, base_url, options):
+    """
+    Run one stage in a fresh process and measure it.
+
+    :param stage: Stage name, one of STAGES
+    :param base_url: Mock server base URL
+    :param options: Stage options dictionary
+    :return: Dictionary of measurements
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    reset_server_stats(base_url)
+    process = context.Process(target=_stage_process, args=(stage, base_url, options, results))
+    process.start()
+    result = results.get()
+    process.join()
+
+    stats = server_stats(base_url)
+    result.update({
+        "requests": stats["requests"],
+        "search_requests": stats["search_requests"],
+        "token_requests": stats["token_requests"],
+        "bytes_transferred": stats["bytes_sent"] + stats["bytes_received"],
+    })
+    return result
+
+
+def run_benchmark(issue_counts, stages=STAGES, latency=0.0, start_date="2024-01-01", end_date="2024-03-31", seed=0,
+                  query_cache=False, workdir=None):
+    """
+    Benchmark the report stages for each issue set size.
+
+    :param issue_counts: Iterable of synthetic issue set sizes
+    :param stages: Stage names to run, in order
+    :param latency: Seconds the mock server adds to every request
+    :param query_cache: Run the stages with a QueryCache in the working directory
+    :param workdir: Directory for configs and reports, a temporary directory when omitted
+    :return: List of result dictionaries, one per size and stage
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="jira_metrics_benchmark_") as temporary_directory:
+        for issue_count in issue_counts:
+            size_workdir = os.path.join(workdir or temporary_directory, "issues_{}".format(issue_count))
+            os.makedirs(size_workdir, exist_ok=True)
+
+            server_start = time.perf_counter()
+            server, base_url = start_mock_server(issue_count, latency, seed)
+            server_startup = time.perf_counter() - server_start
+            try:
+                qmr_config, defect_age_config = write_configs(size_workdir, base_url)
+                options = {
+                    "workdir": size_workdir,
+                    "qmr_config": qmr_config,
+                    "defect_age_config": defect_age_config,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "query_cache": query_cache,
+                }
+                for stage in stages:
+                    result = run_stage(stage, base_url, options)
+                    result.update({"issues": issue_count, "stage": stage, "latency": latency,
+                                   "server_startup": server_startup})
+                    results.append(result)
+                    print_result(result)
+            finally:
+                server.terminate()
+                server.wait()
+    return results
+
+
+def print_result(result):
+    line = "{issues:>8} {stage:<16} {wall_time:>9.2f}s {requests:>8} {mb:>10.2f}MB {peak_rss_mb:>9.1f}MB".format(
+        mb=result["bytes_transferred"] / (1024 * 1024), **result)
+    if result["error"]:
+        line += "  ERROR {}".format(result["error"])
+    print(line, flush=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the QMR and defect age reports against a local mock Jira server.")
+    parser.add_argument("--issues", type=int, nargs="+", default=[1000, 10000], help="Synthetic issue set sizes")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="Stages to run, in order")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the mock server adds to every request")
+    parser.add_argument("--start-date", default="2024-01-01", help="Report start date (YYYY-MM-DD)")
+    parser.add_argument("--end-date", default="2024-03-31", help="Report end date (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the issue set")
+    parser.add_argument("--query-cache", action="store_true", help="Run with a query cache, later stages reuse earlier results")
+    parser.add_argument("--workdir", help="Keep configs and reports in this directory instead of a temporary one")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print("{:>8} {:<16} {:>10} {:>8} {:>12} {:>11}".format("issues", "stage", "wall", "requests", "transferred", "peak RSS"))
+    results = run_benchmark(args.issues, stages=args.stages, latency=args.latency, start_date=args.start_date,
+                            end_date=args.end_date, seed=args.seed, query_cache=args.query_cache, workdir=args.workdir)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    return 1 if any(result["error"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import numpy as np
+
+from defect_age_stats import summarize_ages, SECONDS_PER_DAY
+from issue_mirror import SYNC_OVERLAP
+from query_trace import get_default_tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANGELOG_PATH = os.path.join("cache", "changelog.sqlite")
+
+# A transition out of one of these statuses into any other status counts as a reopen
+DEFAULT_DONE_STATUSES = ("Resolved", "Closed", "Done")
+
+# Fields fetched next to the changelog, the changelog itself carries the transitions
+CHANGELOG_FIELDS = ("status", "created", "updated")
+
+# Changelog pages fetched concurrently during a sync
+DEFAULT_CHANGELOG_WORKERS = 4
+
+# SQLite host parameter limit is 999 on older builds
+_KEY_BATCH_SIZE = 500
+
+JIRA_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+
+def parse_timestamp(value):
+    """
+    Parse a Jira timestamp into epoch seconds.
+
+    :param value: ISO 8601 string such as 2024-01-05T10:00:00.000+0000, or None
+    :return: Epoch seconds, None for a missing or unparsable value
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, JIRA_TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+
+
+def status_transitions(issue):
+    """
+    Extract the status transitions of an issue from its expanded changelog.
+
+    :param issue: Issue dictionary fetched with expand=changelog
+    :return: List of (epoch seconds, from status, to status) in changelog order
+    """
+    transitions = []
+    for history in (issue.get('changelog') or {}).get('histories', []):
+        at = parse_timestamp(history.get('created'))
+        if at is None:
+            continue
+        for item in history.get('items', []):
+            if item.get('field') == 'status':
+                transitions.append((at, item.get('fromString'), item.get('toString')))
+    # Histories are oldest first on Jira Server, sort anyway, the sort is stable within a history
+    transitions.sort(key=lambda transition: transition[0])
+    return transitions
+
+
+def status_intervals(created, current_status, transitions, done_statuses=DEFAULT_DONE_STATUSES):
+    """
+    Walk the transitions of one issue into completed time per status.
+
+    :param created: Creation time in epoch seconds
+    :param current_status: Status the issue is in now
+    :param transitions: List of (epoch seconds, from status, to status), oldest first
+    :param done_statuses: Statuses a reopen leaves
+    :return: Tuple of ({status: (seconds, visits)} for completed intervals, status, status since, reopens)
+    """
+    status = transitions[0][1] if transitions else current_status
+    since = created
+    durations = defaultdict(lambda: [0.0, 0])
+    reopens = 0
+    for at, from_status, to_status in transitions:
+        spent = durations[status]
+        spent[0] += max(0.0, at - since)
+        spent[1] += 1
+        if from_status in done_statuses and to_status not in done_statuses:
+            reopens += 1
+        status, since = to_status, at
+    return {name: tuple(spent) for name, spent in durations.items()}, status, since, reopens
+
+
+class ChangelogStore:
+
+    # Initialize local transition table for every issue matching scope_jql
+    def __init__(self, scope_jql, path=DEFAULT_CHANGELOG_PATH, done_statuses=DEFAULT_DONE_STATUSES,
+                 max_workers=DEFAULT_CHANGELOG_WORKERS):
+        self.scope_jql = scope_jql
+        self.path = path
+        self.done_statuses = tuple(done_statuses)
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS issues (key TEXT PRIMARY KEY, created REAL, updated TEXT, status TEXT,"
+                " status_since REAL, reopens INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS transitions (key TEXT NOT NULL, seq INTEGER NOT NULL, at REAL NOT NULL,"
+                " from_status TEXT, to_status TEXT, PRIMARY KEY (key, seq))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS status_durations (key TEXT NOT NULL, status TEXT NOT NULL,"
+                " seconds REAL NOT NULL, visits INTEGER NOT NULL, PRIMARY KEY (key, status))"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+
+        # Completed durations depend on the scope and on which statuses count as done
+        signature = json.dumps({'scope': scope_jql, 'done': sorted(self.done_statuses)})
+        if self._get_state('signature') != signature:
+            with self._lock, self._connection:
+                for table in ("issues", "transitions", "status_durations", "sync_state"):
+                    self._connection.execute("DELETE FROM {}".format(table))
+            self._set_state('signature', signature)
+
+    def _get_state(self, name):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, value))
+
+    @property
+    def watermark(self):
+        return self._get_state('watermark')
+
+    def sync_jql(self):
+        # A stable order keeps concurrently fetched pages from skipping or repeating issues
+        watermark = self.watermark
+        if watermark is None:
+            return '({}) ORDER BY key ASC'.format(self.scope_jql)
+        return '({}) AND updated >= "{}" ORDER BY key ASC'.format(self.scope_jql, watermark)
+
+    def _complete_changelog(self, search_client, issue, record):
+        # Search pages may cut long changelogs short, the issue endpoint returns all of them
+        changelog = issue.get('changelog') or {}
+        if changelog.get('total', 0) > len(changelog.get('histories', [])):
+            return search_client.fetch_issue(issue['key'], CHANGELOG_FIELDS, expand='changelog', record=record)
+        return issue
+
+    def _fetch_rows(self, search_client, jql_query, start_at, record):
+        # Runs on a worker, the page is reduced to table rows before it is handed back
+        page = search_client.fetch_page(jql_query, start_at, CHANGELOG_FIELDS, record=record, expand='changelog')
+        rows = []
+        for issue in page.get('issues', []):
+            issue = self._complete_changelog(search_client, issue, record)
+            fields = issue.get('fields', {})
+            status = (fields.get('status') or {}).get('name')
+            rows.append((issue['key'], parse_timestamp(fields.get('created')), fields.get('updated'), status,
+                         status_transitions(issue)))
+        return page, rows
+
+    def _store_rows(self, rows):
+        issue_rows, transition_rows, duration_rows = [], [], []
+        for key, created, updated, current_status, transitions in rows:
+            durations, status, since, reopens = status_intervals(created or 0.0, current_status, transitions, self.done_statuses)
+            issue_rows.append((key, created, updated, status, since, reopens))
+            transition_rows.extend((key, seq, at, from_status, to_status)
+                                   for seq, (at, from_status, to_status) in enumerate(transitions))
+            duration_rows.extend((key, name, seconds, visits) for name, (seconds, visits) in durations.items())
+
+        keys = [(row[0],) for row in issue_rows]
+        with self._lock, self._connection:
+            # Only issues whose changelog grew are re-read, their rows are replaced as a whole
+            self._connection.executemany("DELETE FROM transitions WHERE key = ?", keys)
+            self._connection.executemany("DELETE FROM status_durations WHERE key = ?", keys)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO issues (key, created, updated, status, status_since, reopens) VALUES (?, ?, ?, ?, ?, ?)",
+                issue_rows
+            )
+            self._connection.executemany("INSERT INTO transitions (key, seq, at, from_status, to_status) VALUES (?, ?, ?, ?, ?)",
+                                         transition_rows)
+            self._connection.executemany("INSERT INTO status_durations (key, status, seconds, visits) VALUES (?, ?, ?, ?)",
+                                         duration_rows)
+        return max((row[2] for row in issue_rows if row[2]), default=None)
+
+    def sync(self, search_client):
+        """
+        Pull the changelogs of issues updated since the last sync into the transition table.
+
+        The first page gives the total, the remaining pages are fetched concurrently by at most
+        max_workers workers and written as they arrive, so only a few pages are held at once.
+
+        :param search_client: JiraSearchClient used for the live search
+        :return: Number of issues inserted or updated
+        """
+        jql_query = self.sync_jql()
+        logger.info("Syncing changelogs with JQL query: %s", jql_query)
+        tracer = get_default_tracer()
+        record = tracer.start_query(jql_query, 'changelog', CHANGELOG_FIELDS)
+        try:
+            synced, latest_update = self._sync_pages(search_client, jql_query, record)
+        except Exception as e:
+            record.error = '{}: {}'.format(type(e).__name__, e)
+            raise
+        finally:
+            tracer.finish_query(record)
+
+        if latest_update is not None:
+            latest = datetime.strptime(latest_update[:16], "%Y-%m-%dT%H:%M") - SYNC_OVERLAP
+            self._set_state('watermark', latest.strftime("%Y/%m/%d %H:%M"))
+        self._set_state('last_sync', datetime.now().isoformat(timespec='seconds'))
+        logger.info("Changelog store synced %d issues", synced)
+        return synced
+
+    def _sync_pages(self, search_client, jql_query, record):
+        page, rows = self._fetch_rows(search_client, jql_query, 0, record)
+        latest_updates = [self._store_rows(rows)]
+        synced = len(rows)
+        record.issues += len(rows)
+
+        # Jira may return fewer issues than requested when changelogs are expanded
+        page_size = len(page.get('issues', []))
+        total = page.get('total', 0)
+        if page_size:
+            offsets = iter(range(page_size, total, page_size))
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="changelog") as pool:
+                pending = set()
+                while True:
+                    while len(pending) < self.max_workers:
+                        start_at = next(offsets, None)
+                        if start_at is None:
+                            break
+                        pending.add(pool.submit(self._fetch_rows, search_client, jql_query, start_at, record))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        _, rows = future.result()
+                        latest_updates.append(self._store_rows(rows))
+                        synced += len(rows)
+                        record.issues += len(rows)
+
+        latest_updates = [update for update in latest_updates if update]
+        return synced, max(latest_updates, default=None)
+
+    def issue_durations(self, keys, now=None):
+        """
+        Time spent in each status by the given issues.
+
+        Completed intervals come from the table, only the interval of the current status is
+        computed against now.
+
+        :param keys: Issue keys
+        :param now: Epoch seconds the current status is measured up to (default is the current time)
+        :return: Dictionary of key to ({status: seconds}, reopens), keys not in the store are left out
+        """
+        now = datetime.now().timestamp() if now is None else now
+        keys = list(dict.fromkeys(keys))
+        results = {}
+        with self._lock:
+            for offset in range(0, len(keys), _KEY_BATCH_SIZE):
+                batch = keys[offset:offset + _KEY_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                for key, status, since, reopens in self._connection.execute(
+                        "SELECT key, status, status_since, reopens FROM issues WHERE key IN ({})".format(placeholders), batch):
+                    durations = {}
+                    if status is not None and since is not None:
+                        durations[status] = max(0.0, now - since)
+                    results[key] = (durations, reopens)
+                for key, status, seconds in self._connection.execute(
+                        "SELECT key, status, seconds FROM status_durations WHERE key IN ({})".format(placeholders), batch):
+                    durations = results[key][0]
+                    durations[status] = durations.get(status, 0.0) + seconds
+        return results
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def summarize_time_in_status(store, section_issues, classifier, statuses=None, now=None):
+    """
+    Summarize time in status and reopens per section and priority column.
+
+    :param store: Synced ChangelogStore
+    :param section_issues: Dictionary of section name to the issues of that section
+    :param classifier: PriorityClassifier mapping issues to report columns
+    :param statuses: Statuses to report, in order (default is every status seen, alphabetically)
+    :param now: Epoch seconds the current status is measured up to
+    :return: Dictionary of (section, column) to {'statuses': {status: statistics in days}, 'reopens', 'reopened', 'issues'},
+             with an ('Overall', '') entry pooling every section
+    """
+    buckets = defaultdict(list)
+    for section, issues in section_issues.items():
+        for issue in issues:
+            buckets[(section, classifier.classify(issue))].append(issue['key'])
+
+    all_keys = [key for keys in buckets.values() for key in keys]
+    durations = store.issue_durations(all_keys, now=now)
+    missing = len(set(all_keys) - set(durations))
+    if missing:
+        logger.warning("%d issues are outside the changelog store scope and are left out", missing)
+
+    if statuses is None:
+        statuses = sorted({status for status_seconds, _ in durations.values() for status in status_seconds})
+
+    def summarize(keys):
+        known = [durations[key] for key in keys if key in durations]
+        return {
+            'statuses': {status: summarize_ages(np.array([status_seconds[status] for status_seconds, _ in known
+                                                          if status in status_seconds], dtype=float) / SECONDS_PER_DAY)
+                         for status in statuses},
+            'reopens': sum(reopens for _, reopens in known),
+            'reopened': sum(1 for _, reopens in known if reopens),
+            'issues': len(known),
+        }
+
+    cells = {(section, column): summarize(buckets.get((section, column), []))
+             for section in section_issues for column in classifier.columns}
+    cells[('Overall', '')] = summarize(all_keys)
+    return cells
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# Statistics returned for every age vector, in days
+AGE_STATISTICS = ('count', 'mean', 'median', 'p90', 'max')
+
+JIRA_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+SECONDS_PER_DAY = 86400.0
+
+
+class AgeColumns:
+
+    # Initialize column buffers, classifier is optional and fills the bucket column
+    def __init__(self, classifier=None):
+        self.classifier = classifier
+        self.created = []
+        self.resolved = []
+        self.buckets = []
+
+    def add(self, issue):
+        fields = issue["fields"]
+        self.created.append(fields.get("created"))
+        self.resolved.append(fields.get("resolutiondate"))
+        if self.classifier is not None:
+            self.buckets.append(self.classifier.classify(issue))
+
+    def extend(self, issues):
+        for issue in issues:
+            self.add(issue)
+        return self
+
+    def __len__(self):
+        return len(self.created)
+
+
+def parse_jira_dates(values):
+    """
+    Parse Jira timestamps in bulk into a UTC datetime Series.
+
+    :param values: Sequence of ISO 8601 strings, None for missing values
+    :return: pandas Series of UTC timestamps, NaT for missing or unparsable values
+    """
+    values = pd.Series(values, dtype=object)
+    parsed = pd.to_datetime(values, format=JIRA_DATETIME_FORMAT, utc=True, errors='coerce')
+
+    # Fall back to the generic parser for the odd value in a different ISO layout
+    unparsed = parsed.isna() & values.notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(values[unparsed], utc=True, errors='coerce')
+    return parsed
+
+
+def age_days(columns, resolved=True, now=None):
+    """
+    Compute the age of every collected issue in days.
+
+    Resolved ages run from created to resolutiondate, and an issue without a resolution
+    date counts as zero days. Unresolved ages run from created to now.
+
+    :param columns: AgeColumns holding created/resolutiondate values
+    :param resolved: Flag indicating whether to measure up to the resolution date (default is True)
+    :param now: Reference time for unresolved ages (default is the current time)
+    :return: NumPy float array of ages in days, NaN where created could not be parsed
+    """
+    created = parse_jira_dates(columns.created)
+    if resolved:
+        ages = parse_jira_dates(columns.resolved) - created
+        ages = ages.fillna(pd.Timedelta(0)).where(created.notna())
+    else:
+        now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+        if now.tzinfo is None:
+            now = now.tz_localize('UTC')
+        ages = now - created
+    return ages.dt.total_seconds().to_numpy(dtype=float) / SECONDS_PER_DAY
+
+
+def summarize_ages(ages):
+    """
+    Summarize an age vector in a single set of array reductions.
+
+    :param ages: NumPy array of ages in days
+    :return: Dictionary with count, mean, median, p90 and max in days
+    """
+    ages = ages[~np.isnan(ages)]
+    if ages.size == 0:
+        return dict.fromkeys(AGE_STATISTICS, 0)
+
+    median, p90 = np.percentile(ages, [50, 90])
+    return {
+        'count': int(ages.size),
+        'mean': float(ages.mean()),
+        'median': float(median),
+        'p90': float(p90),
+        'max': float(ages.max()),
+    }
+
+
+def summarize_ages_by_bucket(ages, buckets, columns):
+    """
+    Summarize an age vector per report column.
+
+    :param ages: NumPy array of ages in days
+    :param buckets: Report column of every issue, aligned with ages
+    :param columns: Report columns to return, in order
+    :return: Dictionary of column to statistics dictionary
+    """
+    buckets = np.asarray(buckets, dtype=object)
+    return {column: summarize_ages(ages[buckets == column]) for column in columns}
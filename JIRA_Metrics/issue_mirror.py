@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from jql_filter import compile_jql, UnsupportedJQL
+from query_planner import locally_exact, within_scope
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIRROR_PATH = os.path.join("cache", "issue_mirror.sqlite")
+
+# Fields kept for every mirrored issue, enough for the QMR and defect age JQLs
+MIRROR_FIELDS = (
+    "priority", "created", "updated", "resolutiondate", "resolution", "status", "summary",
+    "project", "issuetype", "labels", "components", "fixVersions", "assignee",
+)
+
+# Jira matches "updated >=" at minute precision, re-read a little before the watermark
+SYNC_OVERLAP = timedelta(minutes=2)
+
+# Delta syncs never see issues that left the scope or were deleted, a key-only search of the
+# whole scope removes them this often
+RECONCILE_INTERVAL = timedelta(hours=24)
+
+# SQLite host parameter limit is 999 on older builds
+_KEY_BATCH_SIZE = 500
+
+
+class IssueMirror:
+
+    # Initialize local issue store for every issue matching scope_jql,
+    # reconcile_interval=None never removes issues that left the scope
+    def __init__(self, scope_jql, path=DEFAULT_MIRROR_PATH, fields=MIRROR_FIELDS, reconcile_interval=RECONCILE_INTERVAL):
+        self.scope_jql = scope_jql
+        self.path = path
+        self.reconcile_interval = reconcile_interval
+        self.fields = tuple(dict.fromkeys(tuple(fields) + ("updated",)))
+        self._lock = threading.Lock()
+        self._issues = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS issues (key TEXT PRIMARY KEY, updated TEXT, data TEXT NOT NULL)"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT)")
+
+        # A different scope or field set invalidates everything that was mirrored
+        signature = json.dumps({'scope': scope_jql, 'fields': sorted(self.fields)})
+        if self._get_state('signature') != signature:
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM issues")
+                self._connection.execute("DELETE FROM sync_state")
+            self._set_state('signature', signature)
+
+    def _get_state(self, name):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, value))
+
+    @property
+    def watermark(self):
+        return self._get_state('watermark')
+
+    def sync_jql(self):
+        watermark = self.watermark
+        if watermark is None:
+            return self.scope_jql
+        return '({}) AND updated >= "{}"'.format(self.scope_jql, watermark)
+
+    def sync(self, search_client, on_change=None):
+        """
+        Pull issues updated since the last sync into the mirror.
+
+        The first sync copies the whole scope, later syncs only fetch the delta. Issues already
+        loaded in memory are updated in place instead of reloading the whole mirror.
+
+        :param search_client: JiraSearchClient used for the live search
+        :param on_change: Optional callable (previous issue or None, issue) called for every issue
+                          whose updated timestamp changed, e.g. to find the report months it affects,
+                          and (previous issue, None) for every issue removed by a reconciliation
+        :return: Number of issues inserted or updated
+        """
+        full_sync = self.watermark is None
+        jql_query = self.sync_jql()
+        logger.info("Syncing issue mirror with JQL query: %s", jql_query)
+
+        synced = 0
+        latest_update = None
+        for page in search_client.iter_pages(jql_query, fields=self.fields):
+            rows = []
+            issues = []
+            for issue in page.get('issues', []):
+                updated = issue.get('fields', {}).get('updated')
+                mirrored = {'key': issue['key'], 'fields': issue.get('fields', {})}
+                rows.append((issue['key'], updated, json.dumps(mirrored)))
+                issues.append(mirrored)
+                if updated and (latest_update is None or updated > latest_update):
+                    latest_update = updated
+            previous = self._stored_issues([issue['key'] for issue in issues]) if on_change is not None else {}
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO issues (key, updated, data) VALUES (?, ?, ?)", rows
+                )
+                if self._issues is not None:
+                    for issue in issues:
+                        self._issues[issue['key']] = issue
+            synced += len(rows)
+
+            if on_change is not None:
+                for issue in issues:
+                    # The sync overlap re-reads unchanged issues, those are not reported
+                    old = previous.get(issue['key'])
+                    if old is None or old['fields'].get('updated') != issue['fields'].get('updated'):
+                        on_change(old, issue)
+
+        if latest_update is not None:
+            # Timestamps carry the Jira user's offset, JQL dates are read in that same timezone
+            latest = datetime.strptime(latest_update[:16], "%Y-%m-%dT%H:%M") - SYNC_OVERLAP
+            self._set_state('watermark', latest.strftime("%Y/%m/%d %H:%M"))
+        self._set_state('last_sync', datetime.now().isoformat(timespec='seconds'))
+        logger.info("Issue mirror synced %d issues", synced)
+
+        if full_sync:
+            # A full copy holds nothing outside the scope
+            self._set_state('last_reconcile', datetime.now().isoformat(timespec='seconds'))
+        elif self.reconcile_due():
+            self.reconcile(search_client, on_change=on_change)
+        return synced
+
+    def reconcile_due(self):
+        if self.reconcile_interval is None:
+            return False
+        last_reconcile = self._get_state('last_reconcile')
+        return last_reconcile is None or datetime.now() - datetime.fromisoformat(last_reconcile) >= self.reconcile_interval
+
+    def reconcile(self, search_client, on_change=None):
+        """
+        Remove mirrored issues that no longer match the scope, e.g. moved to another project or deleted.
+
+        Only the keys of the whole scope are fetched and compared with the mirror.
+
+        :param search_client: JiraSearchClient used for the live search
+        :param on_change: Optional callable (previous issue, None) called for every removed issue
+        :return: Number of issues removed
+        """
+        logger.info("Reconciling issue mirror with JQL query: %s", self.scope_jql)
+        in_scope = set()
+        for page in search_client.iter_pages(self.scope_jql, fields=("key",)):
+            in_scope.update(issue['key'] for issue in page.get('issues', []))
+
+        with self._lock:
+            stored = [row[0] for row in self._connection.execute("SELECT key FROM issues")]
+        removed = [key for key in stored if key not in in_scope]
+        for offset in range(0, len(removed), _KEY_BATCH_SIZE):
+            keys = removed[offset:offset + _KEY_BATCH_SIZE]
+            previous = self._stored_issues(keys) if on_change is not None else {}
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM issues WHERE key IN ({})".format(','.join('?' * len(keys))), keys)
+                if self._issues is not None:
+                    for key in keys:
+                        self._issues.pop(key, None)
+            for key in keys:
+                if key in previous:
+                    on_change(previous[key], None)
+
+        self._set_state('last_reconcile', datetime.now().isoformat(timespec='seconds'))
+        logger.info("Issue mirror reconciled, %d issues left the scope", len(removed))
+        return len(removed)
+
+    def _stored_issues(self, keys):
+        if not keys:
+            return {}
+        with self._lock:
+            placeholders = ','.join('?' * len(keys))
+            rows = self._connection.execute("SELECT key, data FROM issues WHERE key IN ({})".format(placeholders), keys).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+    def _load_issues(self):
+        with self._lock:
+            if self._issues is None:
+                rows = self._connection.execute("SELECT key, data FROM issues").fetchall()
+                self._issues = {key: json.loads(data) for key, data in rows}
+            # A snapshot, a sync may update the mirror while a search iterates
+            return list(self._issues.values())
+
+    def can_answer(self, jql_query, fields=None):
+        """
+        Check whether a JQL query and field list can be served from the mirror.
+
+        The query must be within the mirror scope, every issue it matches has to be mirrored, and
+        evaluate locally the way Jira does.
+
+        :param jql_query: JQL query string
+        :param fields: Requested fields
+        :return: True if the query can be evaluated locally
+        """
+        if self.watermark is None:
+            return False
+        try:
+            predicate = compile_jql(jql_query)
+        except UnsupportedJQL:
+            return False
+        if not locally_exact(predicate) or not within_scope(jql_query, self.scope_jql):
+            return False
+        return predicate.fields() <= set(self.fields) and set(fields or ()) <= set(self.fields)
+
+    def search(self, jql_query, fields=None):
+        """
+        Yield mirrored issues matching a JQL query, projected to the requested fields.
+
+        :param jql_query: JQL query string that must be within the mirror scope
+        :param fields: Fields to return (default is all mirrored fields)
+        :return: Generator of issue dictionaries
+        """
+        predicate = compile_jql(jql_query)
+        fields = self.fields if fields is None else tuple(fields)
+        for issue in self._load_issues():
+            if predicate(issue):
+                issue_fields = issue['fields']
+                yield {'key': issue['key'], 'fields': {field: issue_fields.get(field) for field in fields}}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
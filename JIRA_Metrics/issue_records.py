@@ -0,0 +1,174 @@
+import logging
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    # Optional, without ijson each page is decoded in one go, which is still bounded by the page size
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+# Fields kept in their own slot, any other requested field goes to IssueRecord.other
+RECORD_FIELDS = ("priority", "created", "resolutiondate", "summary")
+
+# Search response keys kept next to the issues of a page
+PAGE_KEYS = ("startAt", "maxResults", "total")
+
+# Bytes handed to the incremental parser per read
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+# Identifiers JQL compares an object field on, e.g. project = ABC or project = "Alpha Project"
+IDENTIFIER_KEYS = ('name', 'value', 'key')
+
+
+def compact_value(value):
+    """
+    Reduce a Jira field value to what the reports compare on.
+
+    Objects such as priority or resolution become their name, value or key. An object carrying
+    more than one of them, such as a project's key and name, keeps each in a reduced dictionary so
+    JQL on any of them matches as it does on the search API value. Lists are reduced item by item.
+
+    :param value: Field value as returned by the search API
+    :return: Scalar, reduced dictionary, list of those or None
+    """
+    if isinstance(value, dict):
+        identifiers = {name: value[name] for name in IDENTIFIER_KEYS if value.get(name) is not None}
+        if len(identifiers) > 1:
+            return identifiers
+        return next(iter(identifiers.values()), None)
+    if isinstance(value, list):
+        return [compact_value(item) for item in value]
+    return value
+
+
+class IssueRecord:
+    """
+    Compact issue holding only the reduced values of the requested fields.
+
+    Supports issue['key'], issue['fields'] and issue.get(...) so code written for the
+    search API dictionaries keeps working.
+    """
+
+    __slots__ = ('key',) + RECORD_FIELDS + ('other',)
+
+    def __init__(self, key, priority=None, created=None, resolutiondate=None, summary=None, other=None):
+        self.key = key
+        self.priority = priority
+        self.created = created
+        self.resolutiondate = resolutiondate
+        self.summary = summary
+        self.other = other
+
+    @classmethod
+    def from_issue(cls, issue):
+        if isinstance(issue, cls):
+            return issue
+        fields = issue.get('fields') or {}
+        other = {name: compact_value(value) for name, value in fields.items() if name not in RECORD_FIELDS}
+        return cls(
+            issue.get('key'),
+            priority=compact_value(fields.get('priority')),
+            created=fields.get('created'),
+            resolutiondate=fields.get('resolutiondate'),
+            summary=fields.get('summary'),
+            other=other or None
+        )
+
+    @property
+    def fields(self):
+        fields = {name: getattr(self, name) for name in RECORD_FIELDS}
+        if self.other:
+            fields.update(self.other)
+        return fields
+
+    def __getitem__(self, name):
+        if name == 'key':
+            return self.key
+        if name == 'fields':
+            return self.fields
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {'key': self.key, 'fields': self.fields}
+
+    def __repr__(self):
+        return "IssueRecord({!r})".format(self.to_dict())
+
+
+def compact_issues(issues):
+    return [IssueRecord.from_issue(issue) for issue in issues]
+
+
+def to_json(value):
+    # json.dumps default hook, lets cached result sets hold IssueRecords
+    if isinstance(value, IssueRecord):
+        return value.to_dict()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+def can_stream():
+    return ijson is not None
+
+
+class _CountingReader:
+
+    # Initialize file-like wrapper counting the bytes read from a response stream
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def read_search_page(response, streamed=False):
+    """
+    Decode a search response page into compact issue records.
+
+    With ijson and a streamed response, each issue is reduced as soon as it is parsed, so the
+    nested JSON of at most one issue is alive at a time. Otherwise the page is decoded at once
+    and reduced right after.
+
+    :param response: Search response, opened with stream=True when streamed is set
+    :param streamed: Whether the response body has not been read yet
+    :return: Tuple of (page dictionary with IssueRecord issues, response size in bytes)
+    """
+    if not streamed:
+        page = response.json()
+        page['issues'] = compact_issues(page.get('issues', []))
+        return page, len(response.content)
+
+    # Read the decompressed body, the same bytes response.content would hold
+    response.raw.decode_content = True
+    reader = _CountingReader(response.raw)
+    page = {}
+    issues = []
+    builder = None
+    try:
+        for prefix, event, value in ijson.parse(reader, buf_size=STREAM_CHUNK_SIZE, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == 'issues.item' and event == 'end_map':
+                    issues.append(IssueRecord.from_issue(builder.value))
+                    builder = None
+            elif prefix == 'issues.item' and event == 'start_map':
+                builder = ObjectBuilder()
+                builder.event(event, value)
+            elif prefix in PAGE_KEYS and event == 'number':
+                page[prefix] = int(value)
+    finally:
+        response.close()
+
+    page['issues'] = issues
+    return page, reader.bytes_read
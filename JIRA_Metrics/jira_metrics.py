@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Non-interactive entry point for the QMR and defect age reports.
+
+Only the standard library and report_config are imported up front, the report modules (and with
+them pandas and requests) are imported by the subcommand that needs them, so --help, config
+validation and --dry-run never touch the network or load pandas.
+"""
+
+import argparse
+import logging
+import sys
+
+from report_config import (ConfigError, load_json_config, validate_date, validate_qmr_config, validate_defect_age_config,
+                           split_defect_age_config, render_jql, render_defect_age_queries, iter_months,
+                           resolve_config_path, CONFIG_SECTIONS, QMR_CONFIG_DIRECTORY, DEFECT_AGE_CONFIG_DIRECTORY,
+                           QMR_SECTIONS, QMR_SUB_QUERIES)
+
+
+def config_path(args, directory):
+    if args.config:
+        return args.config
+    if args.section:
+        return resolve_config_path(directory, args.section)
+    raise ConfigError("Either --config or --section is required")
+
+
+def print_errors(errors):
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
+
+
+def run_qmr_command(args):
+    json_file_path = config_path(args, QMR_CONFIG_DIRECTORY)
+    data = load_json_config(json_file_path)
+    validate_date(args.start_date)
+    validate_date(args.end_date)
+    if print_errors(validate_qmr_config(data)):
+        return 1
+
+    if args.dry_run:
+        for month_start, month_end, report_filename in iter_months(args.start_date, args.end_date):
+            print(f"# {report_filename}")
+            for section in QMR_SECTIONS:
+                for sub_query in QMR_SUB_QUERIES:
+                    print(f"{section}.{sub_query}: {render_jql(data[section][sub_query], month_start, month_end)}")
+        return 0
+
+    from Report__ import run_qmr
+    reports = run_qmr(json_file_path, args.start_date, args.end_date, no_cache=args.no_cache, refresh=args.refresh,
+                      no_mirror=args.no_mirror, rate_limit=args.rate_limit, range_mode=args.range_mode,
+                      combine=not args.no_combine, trace_path=args.trace, prometheus_path=args.prometheus,
+                      cube_mode=args.cube_mode, export_path=args.export, drill_down=not args.no_drill_down,
+                      capture_path=args.capture, replay_path=args.replay)
+    return 0 if reports else 1
+
+
+def run_defect_age_command(args):
+    json_file_path = config_path(args, DEFECT_AGE_CONFIG_DIRECTORY)
+    queries, _ = split_defect_age_config(load_json_config(json_file_path))
+    validate_date(args.start_date)
+    validate_date(args.end_date)
+    if print_errors(validate_defect_age_config(queries)):
+        return 1
+
+    if args.dry_run:
+        for key, value in render_defect_age_queries(queries, args.start_date, args.end_date).items():
+            for query in [value] if isinstance(value, str) else value:
+                print(f"{key}: {query}")
+        return 0
+
+    from Defect_Age import run_defect_age
+    report_df = run_defect_age(json_file_path, args.start_date, args.end_date, no_cache=args.no_cache, refresh=args.refresh,
+                               no_mirror=args.no_mirror, rate_limit=args.rate_limit, trace_path=args.trace,
+                               prometheus_path=args.prometheus, export_path=args.export, drill_down=not args.no_drill_down,
+                               capture_path=args.capture, replay_path=args.replay)
+    return 0 if report_df is not None else 1
+
+
+def run_combine_command(args):
+    from Report__ import JiraReportGenerator
+    JiraReportGenerator.combine_reports()
+    return 0
+
+
+def parse_filters(filters):
+    parsed = {}
+    for item in filters or ():
+        name, separator, value = item.partition("=")
+        if not separator:
+            raise ConfigError(f"Invalid --filter '{item}', expected dimension=value")
+        parsed.setdefault(name.strip(), []).append(value.strip())
+    return parsed
+
+
+def run_cube_command(args):
+    json_file_path = config_path(args, QMR_CONFIG_DIRECTORY)
+    data = load_json_config(json_file_path)
+    validate_date(args.start_date)
+    validate_date(args.end_date)
+    if print_errors(validate_qmr_config(data)):
+        return 1
+    filters = parse_filters(args.filter)
+
+    from Report__ import run_metrics_cube
+    cell_cube = run_metrics_cube(json_file_path, args.start_date, args.end_date, grain=args.grain, no_cache=args.no_cache,
+                                 no_mirror=args.no_mirror, rate_limit=args.rate_limit)
+    if cell_cube is None:
+        return 1
+
+    cube = cell_cube.cube
+    slice_args = dict(event=args.event, filters=filters, start=args.slice_start, end=args.slice_end)
+    if args.columns:
+        table = cube.pivot(args.by or [], args.columns, measure=args.measure, **slice_args)
+    else:
+        table = cube.slice(by=args.by or [], **slice_args)
+    print(table.to_csv() if args.csv else table.to_string())
+    return 0
+
+
+def run_batch_command(args):
+    qmr_configs = list(args.qmr_config or [])
+    defect_age_configs = list(args.defect_age_config or [])
+    sections = list(CONFIG_SECTIONS) if args.all_sections else list(args.section or [])
+    for section in sections:
+        qmr_configs.append(resolve_config_path(QMR_CONFIG_DIRECTORY, section))
+        defect_age_configs.append(resolve_config_path(DEFECT_AGE_CONFIG_DIRECTORY, section))
+    if not qmr_configs and not defect_age_configs:
+        raise ConfigError("--qmr-config, --defect-age-config, --section or --all-sections is required")
+    validate_date(args.start_date)
+    validate_date(args.end_date)
+
+    from batch_runner import run_batch
+    results = run_batch(qmr_configs, defect_age_configs, args.start_date, args.end_date, no_cache=args.no_cache,
+                        refresh=args.refresh, no_mirror=args.no_mirror, rate_limit=args.rate_limit,
+                        max_workers=args.max_workers, config_workers=args.config_workers, range_mode=args.range_mode,
+                        cube_mode=args.cube_mode, combine=not args.no_combine, trace_path=args.trace,
+                        prometheus_path=args.prometheus)
+    if results is None:
+        return 1
+    failed = [f"{kind} {name}" for (kind, name), result in results.items() if result is None or (kind == 'qmr' and not result)]
+    for job in failed:
+        print(f"Failed: {job}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def run_serve_command(args):
+    qmr_config = args.qmr_config
+    defect_age_config = args.defect_age_config
+    if args.section:
+        qmr_config = qmr_config or resolve_config_path(QMR_CONFIG_DIRECTORY, args.section)
+        defect_age_config = defect_age_config or resolve_config_path(DEFECT_AGE_CONFIG_DIRECTORY, args.section)
+    if qmr_config is None and defect_age_config is None:
+        raise ConfigError("--qmr-config, --defect-age-config or --section is required")
+    validate_date(args.start_date)
+    if args.end_date:
+        validate_date(args.end_date)
+
+    from metrics_service import run_service
+    run_service(args.start_date, args.end_date, qmr_config_path=qmr_config, defect_age_config_path=defect_age_config,
+                interval=args.interval, host=args.host, port=args.port, rate_limit=args.rate_limit,
+                prometheus_path=args.prometheus)
+    return 0
+
+
+def add_report_arguments(parser):
+    parser.add_argument("--config", help="Config file path")
+    parser.add_argument("--section", choices=list(CONFIG_SECTIONS), help="Config name in the default config directory, used when --config is omitted")
+    parser.add_argument("--start-date", required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end-date", required=True, help="End date (YYYY-MM-DD)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the query result cache")
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch every query and overwrite the cached results")
+    parser.add_argument("--no-mirror", action="store_true", help="Query Jira directly even if the config defines an issue mirror")
+    parser.add_argument("--rate-limit", type=float, help="Maximum Jira requests per second across all workers")
+    parser.add_argument("--dry-run", action="store_true", help="Validate the config and print the rendered JQL without querying Jira")
+    parser.add_argument("--trace", help="Write a JSON trace of every query to this file")
+    parser.add_argument("--prometheus", help="Write run metrics in the Prometheus text format to this file")
+    parser.add_argument("--export", help="Also write every report and the issue drill-downs into this workbook")
+    parser.add_argument("--no-drill-down", action="store_true", help="Leave the drill-down sheets out of the exported workbook")
+    snapshot_group = parser.add_mutually_exclusive_group()
+    snapshot_group.add_argument("--capture", help="Record every Jira response of the run into this snapshot directory")
+    snapshot_group.add_argument("--replay", help="Generate the reports from this snapshot directory without querying Jira")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate Jira metrics reports without prompting.")
+    parser.add_argument("--log-level", default="ERROR", help="Logging level, e.g. INFO or DEBUG")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    qmr_parser = subparsers.add_parser("qmr", help="Generate the monthly QMR reports")
+    add_report_arguments(qmr_parser)
+    qmr_parser.add_argument("--range-mode", action="store_true", help="Fetch each JQL once for the whole date range and split it into months locally")
+    qmr_parser.add_argument("--no-combine", action="store_true", help="Do not write the combined workbook")
+    qmr_parser.add_argument("--cube-mode", action="store_true", help="Fetch every JQL in one query and project the reports from a metrics cube")
+    qmr_parser.set_defaults(handler=run_qmr_command)
+
+    defect_age_parser = subparsers.add_parser("defect-age", help="Generate the defect age report")
+    add_report_arguments(defect_age_parser)
+    defect_age_parser.set_defaults(handler=run_defect_age_command)
+
+    combine_parser = subparsers.add_parser("combine", help="Combine the saved monthly QMR reports into one workbook")
+    combine_parser.set_defaults(handler=run_combine_command)
+
+    cube_parser = subparsers.add_parser("cube", help="Fetch the QMR JQLs once and print ad-hoc slices of the metrics cube")
+    cube_parser.add_argument("--config", help="Config file path")
+    cube_parser.add_argument("--section", choices=list(CONFIG_SECTIONS), help="Config name in the default config directory, used when --config is omitted")
+    cube_parser.add_argument("--start-date", required=True, help="Start date (YYYY-MM-DD) the JQLs are rendered with")
+    cube_parser.add_argument("--end-date", required=True, help="End date (YYYY-MM-DD) the JQLs are rendered with")
+    cube_parser.add_argument("--grain", choices=["day", "week", "month", "quarter", "year"], help="Time grain of the period dimension, default day")
+    cube_parser.add_argument("--event", choices=["created", "resolved"], default="created", help="Place issues in the period they were created or resolved in")
+    cube_parser.add_argument("--by", action="append", help="Dimension to group by, repeatable: member, priority, period or a configured dimension")
+    cube_parser.add_argument("--columns", action="append", help="Dimension to pivot into columns, repeatable")
+    cube_parser.add_argument("--measure", default="issues", help="Measure of a pivot, e.g. issues, mean_age or mean_open_age")
+    cube_parser.add_argument("--filter", action="append", help="Keep dimension=value, repeatable, e.g. member=Regression/BugsRaised")
+    cube_parser.add_argument("--slice-start", help="First day of the slice (YYYY-MM-DD)")
+    cube_parser.add_argument("--slice-end", help="Last day of the slice (YYYY-MM-DD)")
+    cube_parser.add_argument("--csv", action="store_true", help="Print CSV instead of a table")
+    cube_parser.add_argument("--no-cache", action="store_true", help="Do not read or write the query result cache")
+    cube_parser.add_argument("--no-mirror", action="store_true", help="Query Jira directly even if the config defines an issue mirror")
+    cube_parser.add_argument("--rate-limit", type=float, help="Maximum Jira requests per second across all workers")
+    cube_parser.set_defaults(handler=run_cube_command)
+
+    batch_parser = subparsers.add_parser("batch", help="Run many QMR and defect age configs in one process with shared queries")
+    batch_parser.add_argument("--qmr-config", action="append", help="QMR config file, repeatable")
+    batch_parser.add_argument("--defect-age-config", action="append", help="Defect age config file, repeatable")
+    batch_parser.add_argument("--section", action="append", choices=list(CONFIG_SECTIONS), help="Config name run for both reports, repeatable")
+    batch_parser.add_argument("--all-sections", action="store_true", help="Run both reports for every config name")
+    batch_parser.add_argument("--start-date", required=True, help="Start date (YYYY-MM-DD)")
+    batch_parser.add_argument("--end-date", required=True, help="End date (YYYY-MM-DD)")
+    batch_parser.add_argument("--max-workers", type=int, default=16, help="Queries in flight for the whole batch")
+    batch_parser.add_argument("--config-workers", type=int, default=4, help="Configs generated concurrently")
+    batch_parser.add_argument("--no-cache", action="store_true", help="Do not read or write the query result cache")
+    batch_parser.add_argument("--refresh", action="store_true", help="Re-fetch every query and overwrite the cached results")
+    batch_parser.add_argument("--no-mirror", action="store_true", help="Query Jira directly even if a config defines an issue mirror")
+    batch_parser.add_argument("--rate-limit", type=float, help="Maximum Jira requests per second across the whole batch")
+    batch_parser.add_argument("--range-mode", action="store_true", help="Fetch each QMR JQL once for the whole date range")
+    batch_parser.add_argument("--cube-mode", action="store_true", help="Project the QMR reports from a metrics cube")
+    batch_parser.add_argument("--no-combine", action="store_true", help="Do not write the combined QMR workbooks")
+    batch_parser.add_argument("--trace", help="Write a JSON trace of every query to this file")
+    batch_parser.add_argument("--prometheus", help="Write run metrics in the Prometheus text format to this file")
+    batch_parser.set_defaults(handler=run_batch_command)
+
+    serve_parser = subparsers.add_parser("serve", help="Keep the reports in memory, refresh them on a schedule and serve them over HTTP")
+    serve_parser.add_argument("--qmr-config", help="QMR config file")
+    serve_parser.add_argument("--defect-age-config", help="Defect age config file")
+    serve_parser.add_argument("--section", choices=list(CONFIG_SECTIONS), help="Config name used for both reports when their config is omitted")
+    serve_parser.add_argument("--start-date", required=True, help="Start date (YYYY-MM-DD)")
+    serve_parser.add_argument("--end-date", help="End date (YYYY-MM-DD), follows the current date when omitted")
+    serve_parser.add_argument("--interval", type=float, default=300, help="Seconds between refreshes")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    serve_parser.add_argument("--rate-limit", type=float, help="Maximum Jira requests per second across all workers")
+    serve_parser.add_argument("--prometheus", help="Rewrite this Prometheus textfile after every refresh")
+    serve_parser.set_defaults(handler=run_serve_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    try:
+        return args.handler(args)
+    except ConfigError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+import logging
+import math
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from issue_records import compact_issues, can_stream, read_search_page
+from jira_transport import get_default_transport
+from jql_filter import and_clause, date_window, date_range_clause
+from query_trace import get_default_tracer
+
+logger = logging.getLogger(__name__)
+
+# Jira caps maxResults server side (usually 100 or 1000), so the page size is only a request
+DEFAULT_PAGE_SIZE = 100
+# Number of pages fetched ahead of the consumer, 0 disables the background fetcher
+DEFAULT_PREFETCH = 1
+
+# Fields needed by the QMR and defect age metrics
+METRIC_FIELDS = ("priority", "created", "resolutiondate", "summary")
+
+# Cache key field list marking a stored total rather than a list of issues
+COUNT_CACHE_FIELDS = ("#total",)
+
+# Searches matching more issues than this are split into date shards fetched in parallel,
+# None disables sharding
+DEFAULT_SHARD_THRESHOLD = 5000
+DEFAULT_SHARD_WORKERS = 4
+# Shards are not split below this window, whatever they hold is paged through
+MIN_SHARD_WINDOW = timedelta(hours=1)
+
+_END_OF_PAGES = object()
+
+
+class JiraSearchClient:
+
+    # Initialize Jira search client for a /rest/api/latest/search endpoint,
+    # headers may be a callable so that refreshed tokens are picked up,
+    # cache is an optional QueryCache for complete result sets and
+    # mirror an optional IssueMirror that answers queries it can evaluate locally,
+    # transport defaults to the process-wide pooled JiraTransport and
+    # tracer to the process-wide QueryTracer current at query time,
+    # searches over shard_threshold issues are split by date when their JQL has a bounded date range,
+    # scheduler is an optional QueryScheduler sharing the queries in flight across a whole batch of reports
+    def __init__(self, api_url, headers, page_size=DEFAULT_PAGE_SIZE, prefetch=DEFAULT_PREFETCH, fields=METRIC_FIELDS, cache=None, mirror=None,
+                 transport=None, tracer=None, shard_threshold=DEFAULT_SHARD_THRESHOLD, shard_workers=DEFAULT_SHARD_WORKERS,
+                 scheduler=None):
+        self.api_url = api_url
+        self.headers = headers
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.fields = tuple(fields)
+        self.cache = cache
+        self.mirror = mirror
+        self.transport = transport or get_default_transport()
+        self._tracer = tracer
+        self.shard_threshold = shard_threshold
+        self.shard_workers = shard_workers
+        self.scheduler = scheduler
+
+    @property
+    def tracer(self):
+        return self._tracer or get_default_tracer()
+
+    # Fetch a single search page starting at start_at, recording it on the optional QueryRecord,
+    # compact pages hold IssueRecords decoded incrementally when ijson is installed
+    def fetch_page(self, jql_query, start_at, fields, max_results=None, record=None, compact=False, expand=None):
+        params = {
+            'jql': jql_query,
+            'startAt': start_at,
+            'maxResults': self.page_size if max_results is None else max_results,
+            'fields': ','.join(fields),
+        }
+        if expand:
+            params['expand'] = expand
+        headers = self.headers() if callable(self.headers) else self.headers
+        streamed = compact and can_stream()
+        requested = time.perf_counter()
+        response = self.transport.get(self.api_url, headers=headers, params=params, stream=streamed)
+        response.raise_for_status()
+        # A streamed body is still being received while it is parsed, that time counts as parse time
+        received = time.perf_counter()
+        if compact:
+            page, size = read_search_page(response, streamed)
+        else:
+            page, size = response.json(), len(response.content)
+        if record is not None:
+            record.add_page(received - requested, time.perf_counter() - received, size,
+                            getattr(response, 'retries', 0), page.get('total'))
+        return page
+
+    # Fetch a single issue from the issue endpoint next to the search endpoint
+    def fetch_issue(self, key, fields, expand=None, record=None):
+        params = {'fields': ','.join(fields)}
+        if expand:
+            params['expand'] = expand
+        headers = self.headers() if callable(self.headers) else self.headers
+        issue_url = '{}/issue/{}'.format(self.api_url.rsplit('/search', 1)[0], key)
+        requested = time.perf_counter()
+        response = self.transport.get(issue_url, headers=headers, params=params)
+        response.raise_for_status()
+        received = time.perf_counter()
+        issue = response.json()
+        if record is not None:
+            record.add_page(received - requested, time.perf_counter() - received, len(response.content),
+                            getattr(response, 'retries', 0), record.total)
+        return issue
+
+    # Walk startAt/total and yield raw search pages in order
+    def _walk_pages(self, jql_query, fields, record=None, compact=False, start_at=0):
+        while True:
+            page = self.fetch_page(jql_query, start_at, fields, record=record, compact=compact)
+            yield page
+
+            issues = page.get('issues', [])
+            start_at += len(issues)
+            if not issues or start_at >= page.get('total', 0):
+                return
+
+    def _prefetch_pages(self, jql_query, fields, record=None, compact=False, start_at=0):
+        pages = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for page in self._walk_pages(jql_query, fields, record, compact, start_at):
+                    if not put(page):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(_END_OF_PAGES)
+
+        worker = threading.Thread(target=produce, name="jira-search-prefetch", daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is _END_OF_PAGES:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            worker.join()
+
+    def iter_pages(self, jql_query, fields=None, record=None, compact=False, start_at=0):
+        """
+        Yield the search result pages for a JQL query.
+
+        At most `prefetch` pages are buffered ahead of the consumer, so memory
+        stays bounded by the page size regardless of how many issues match.
+
+        :param jql_query: JQL query string
+        :param fields: Fields to request (default is the client's fields)
+        :param record: Optional QueryRecord the pages are recorded on
+        :param compact: Reduce the issues of each page to IssueRecords while decoding
+        :param start_at: Index of the first issue to fetch
+        :return: Generator of search response dictionaries
+        """
+        fields = self.fields if fields is None else tuple(fields)
+        if self.prefetch > 0:
+            return self._prefetch_pages(jql_query, fields, record, compact, start_at)
+        return self._walk_pages(jql_query, fields, record, compact, start_at)
+
+    def search(self, jql_query, fields=None):
+        """
+        Yield every issue matching a JQL query, page by page.
+
+        Queries the issue mirror can evaluate are answered locally. Otherwise, when a cache is
+        configured, the complete result set is served from, or stored in, the cache.
+
+        Issues are compact IssueRecords holding only the requested fields, so at most a page of
+        full search JSON is alive at a time.
+
+        :param jql_query: JQL query string
+        :param fields: Fields to request (default is the client's fields)
+        :return: Generator of IssueRecord
+        """
+        fields = self.fields if fields is None else tuple(fields)
+        tracer = self.tracer
+        record = tracer.start_query(jql_query, 'search', fields)
+        try:
+            for issues in self._search_chunks(jql_query, fields, record):
+                record.issues += len(issues)
+                # Time spent by the consumer between issues is the caller's aggregation time
+                started = time.perf_counter()
+                yield from issues
+                record.aggregation_time += time.perf_counter() - started
+        except Exception as e:
+            record.error = '{}: {}'.format(type(e).__name__, e)
+            raise
+        finally:
+            tracer.finish_query(record)
+
+    def _search_chunks(self, jql_query, fields, record):
+        # Lists of issues from the mirror, another report of the batch, the cache or Jira pages
+        if self.mirror is not None and self.mirror.can_answer(jql_query, fields):
+            logger.info("Answering JQL query from the issue mirror: %s", jql_query)
+            record.source = 'mirror'
+            yield compact_issues(self.mirror.search(jql_query, fields))
+            return
+
+        if self.scheduler is not None:
+            def fetch():
+                return [issue for issues in self._fetched_chunks(jql_query, fields, record) for issue in issues]
+            issues, owner = self.scheduler.shared(self.scheduler.query_key('search', self.api_url, jql_query, fields), fetch)
+            if not owner:
+                record.source = 'batch'
+            yield issues
+            return
+
+        yield from self._fetched_chunks(jql_query, fields, record)
+
+    def _fetched_chunks(self, jql_query, fields, record):
+        # Lists of issues from the cache or Jira pages
+        if self.cache is not None:
+            record.cache = 'hit'
+
+            def fetch():
+                record.cache = 'miss'
+                return list(self._search_pages(jql_query, fields, record))
+            yield compact_issues(self.cache.get_or_fetch(jql_query, fields, fetch))
+            return
+
+        yield from self._live_chunks(jql_query, fields, record)
+
+    def _live_chunks(self, jql_query, fields, record):
+        # Lists of issues from Jira, the first page tells whether the query is worth sharding
+        first_page = self.fetch_page(jql_query, 0, fields, record=record, compact=True)
+        issues = first_page.get('issues', [])
+        total = first_page.get('total', 0)
+        window = None
+        if self.shard_threshold is not None and total > self.shard_threshold:
+            window = date_window(jql_query)
+            if window is None:
+                logger.info("%d issues match a query without a bounded date range, paging through: %s", total, jql_query)
+        if window is not None:
+            yield from self._sharded_chunks(jql_query, fields, record, window, total)
+            return
+
+        yield issues
+        if issues and len(issues) < total:
+            for page in self.iter_pages(jql_query, fields, record, compact=True, start_at=len(issues)):
+                yield page.get('issues', [])
+
+    def _count_total(self, jql_query, record=None):
+        return self.fetch_page(jql_query, 0, ("key",), max_results=0, record=record).get('total', 0)
+
+    def _plan_shards(self, jql_query, window, total, record):
+        """
+        Split a date window until every shard holds at most shard_threshold issues.
+
+        Each oversized window is cut into as many equal parts as the threshold requires and the
+        parts are counted with maxResults=0 searches, empty parts are dropped.
+
+        :return: List of (start, end) windows
+        """
+        jql_field, start, end = window
+        pending = [(start, end, total)]
+        shards = []
+        with ThreadPoolExecutor(max_workers=self.shard_workers, thread_name_prefix="jql-shard") as pool:
+            while pending:
+                windows = []
+                for window_start, window_end, count in pending:
+                    if count <= self.shard_threshold or window_end - window_start <= MIN_SHARD_WINDOW:
+                        shards.append((window_start, window_end))
+                        continue
+                    parts = max(2, math.ceil(count / self.shard_threshold))
+                    step = (window_end - window_start) / parts
+                    # JQL dates have minute precision, so are the shard boundaries
+                    boundaries = sorted({window_start} | {(window_start + step * part).replace(second=0, microsecond=0)
+                                                          for part in range(1, parts)} | {window_end})
+                    windows.extend(zip(boundaries, boundaries[1:]))
+
+                counts = pool.map(lambda bounds: self._count_total(and_clause(jql_query, date_range_clause(jql_field, *bounds)), record),
+                                  windows)
+                pending = [(window_start, window_end, count) for (window_start, window_end), count in zip(windows, counts) if count]
+        return shards
+
+    def _fetch_shard(self, jql_query, fields, record):
+        issues = []
+        for page in self._walk_pages(jql_query, fields, record, compact=True):
+            issues.extend(page.get('issues', []))
+        return issues
+
+    def _sharded_chunks(self, jql_query, fields, record, window, total):
+        """
+        Fetch an oversized query as date shards in parallel, de-duplicated by issue key.
+
+        An issue whose date changes while the shards are fetched can show up in two of them.
+        """
+        jql_field = window[0]
+        shards = self._plan_shards(jql_query, window, total, record)
+        logger.info("Fetching %d issues in %d date shards on %s: %s", total, len(shards), jql_field, jql_query)
+        seen = set()
+        with ThreadPoolExecutor(max_workers=self.shard_workers, thread_name_prefix="jql-shard") as pool:
+            futures = [pool.submit(self._fetch_shard, and_clause(jql_query, date_range_clause(jql_field, start, end)), fields, record)
+                       for start, end in shards]
+            for future in as_completed(futures):
+                issues = [issue for issue in future.result() if issue['key'] not in seen]
+                seen.update(issue['key'] for issue in issues)
+                yield issues
+        if record is not None:
+            record.total = total
+
+    def count(self, jql_query):
+        """
+        Count the issues matching a JQL query without downloading them.
+
+        Sends a maxResults=0 search and reads `total`, unless the mirror or cache can answer.
+
+        :param jql_query: JQL query string
+        :return: Number of matching issues
+        """
+        tracer = self.tracer
+        record = tracer.start_query(jql_query, 'count')
+        try:
+            record.total = self._count(jql_query, record)
+            return record.total
+        except Exception as e:
+            record.error = '{}: {}'.format(type(e).__name__, e)
+            raise
+        finally:
+            tracer.finish_query(record)
+
+    def _count(self, jql_query, record):
+        if self.mirror is not None and self.mirror.can_answer(jql_query, ()):
+            record.source = 'mirror'
+            return sum(1 for _ in self.mirror.search(jql_query, ()))
+
+        def fetch_total():
+            logger.info("Counting Jira issues for JQL query: %s", jql_query)
+            return self._count_total(jql_query, record)
+
+        def fetch_stored_total():
+            if self.cache is None:
+                return fetch_total()
+            record.cache = 'hit'
+
+            def fetch():
+                record.cache = 'miss'
+                return fetch_total()
+            return self.cache.get_or_fetch(jql_query, COUNT_CACHE_FIELDS, fetch)
+
+        if self.scheduler is not None:
+            total, owner = self.scheduler.shared(self.scheduler.query_key('count', self.api_url, jql_query), fetch_stored_total,
+                                                 keep=True)
+            if not owner:
+                record.source = 'batch'
+            return total
+        return fetch_stored_total()
+
+    def _search_pages(self, jql_query, fields, record=None):
+        logger.info("Searching Jira for JQL query: %s", jql_query)
+        for issues in self._live_chunks(jql_query, fields, record):
+            yield from issues
@@ -0,0 +1,180 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Connections kept alive per host, sized for the month and query workers running together
+DEFAULT_POOL_SIZE = 32
+DEFAULT_MAX_RETRIES = 5
+# Backoff before retry n is backoff_factor * 2 ** n seconds, capped at max_backoff
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_MAX_BACKOFF = 60
+DEFAULT_TIMEOUT = 60
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+
+    # Initialize token bucket allowing `rate` requests per second with bursts of `burst`
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive, got {}".format(rate))
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header given either as seconds or as an HTTP date.
+
+    :param value: Header value, or None
+    :return: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class JiraTransport:
+
+    # Initialize pooled keep-alive session with retries and optional client-side rate limit
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 max_backoff=DEFAULT_MAX_BACKOFF, rate_limit=None, timeout=DEFAULT_TIMEOUT):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def backoff(self, attempt, response=None):
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        # Jitter keeps concurrent workers from retrying in lockstep
+        return delay * random.uniform(0.5, 1.0)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request on the pooled session, retrying connection errors, 429 and 5xx responses.
+
+        :param method: HTTP method
+        :param url: Request URL
+        :return: requests.Response with a `retries` attribute, the last response is returned once retries are exhausted
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning("%s %s failed (%s), retrying in %.1fs", method, url, e, delay)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    # Read by the query trace
+                    response.retries = attempt
+                    return response
+                delay = self.backoff(attempt, response)
+                logger.warning("%s %s returned %d, retrying in %.1fs", method, url, response.status_code, delay)
+                response.close()
+
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """
+    Return the process-wide transport shared by the search and token clients.
+
+    :return: JiraTransport instance
+    """
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = JiraTransport()
+        return _default_transport
+
+
+def configure_default_transport(**kwargs):
+    """
+    Replace the process-wide transport, e.g. to set a rate limit before any request is sent.
+
+    :return: The new JiraTransport instance
+    """
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is not None:
+            _default_transport.close()
+        _default_transport = JiraTransport(**kwargs)
+        return _default_transport
+
+
+def set_default_transport(transport):
+    """
+    Replace the process-wide transport by a prepared one, e.g. a snapshot capture or replay transport.
+
+    :param transport: Object with the JiraTransport request methods, None gets a new pooled JiraTransport on next use
+    :return: The new transport
+    """
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is not None and _default_transport is not transport:
+            _default_transport.close()
+        _default_transport = transport
+        return transport
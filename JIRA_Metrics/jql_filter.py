@@ -0,0 +1,505 @@
+import re
+from datetime import datetime, timedelta
+
+
+class UnsupportedJQL(ValueError):
+    """Raised when a JQL query uses syntax that cannot be evaluated locally."""
+
+
+# JQL field name -> Jira REST field id
+FIELD_ALIASES = {
+    'key': 'key',
+    'issuekey': 'key',
+    'project': 'project',
+    'priority': 'priority',
+    'status': 'status',
+    'statuscategory': 'statusCategory',
+    'resolution': 'resolution',
+    'issuetype': 'issuetype',
+    'type': 'issuetype',
+    'assignee': 'assignee',
+    'reporter': 'reporter',
+    'labels': 'labels',
+    'component': 'components',
+    'components': 'components',
+    'fixversion': 'fixVersions',
+    'fixversions': 'fixVersions',
+    'affectedversion': 'versions',
+    'summary': 'summary',
+    'created': 'created',
+    'createddate': 'created',
+    'updated': 'updated',
+    'updateddate': 'updated',
+    'resolved': 'resolutiondate',
+    'resolutiondate': 'resolutiondate',
+    'due': 'duedate',
+    'duedate': 'duedate',
+}
+
+DATE_FIELDS = {'created', 'updated', 'resolutiondate', 'duedate'}
+
+# Pseudo fields that are read from another REST field
+SOURCE_FIELDS = {'statusCategory': 'status'}
+
+DATE_FORMATS = ("%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d")
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>!=|>=|<=|!~|=|>|<|~)
+      | (?P<punct>[(),])
+      | (?P<word>[^\s"'(),=!<>~]+)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not', 'in', 'is', 'empty', 'null', 'order', 'by'}
+
+
+def field_id(jql_field):
+    """
+    Map a JQL field name to the Jira REST field id that holds its value.
+
+    :param jql_field: Field name as written in JQL
+    :return: REST field id
+    """
+    name = jql_field.strip().strip('"\'')
+    custom = re.fullmatch(r'cf\[(\d+)\]', name, re.IGNORECASE)
+    if custom:
+        return 'customfield_{}'.format(custom.group(1))
+    if re.fullmatch(r'customfield_\d+', name, re.IGNORECASE):
+        return name.lower()
+    try:
+        return FIELD_ALIASES[name.lower()]
+    except KeyError:
+        raise UnsupportedJQL("Field '{}' cannot be evaluated locally".format(jql_field))
+
+
+def parse_jql_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise UnsupportedJQL("Date '{}' cannot be evaluated locally".format(value))
+
+
+def parse_issue_date(value):
+    # Jira returns timestamps in the requesting user's timezone, compare on that wall clock time
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if len(value) == 10:
+        return datetime.strptime(value, "%Y-%m-%d")
+    return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+
+
+def _named_values(value, field):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        values = []
+        for item in value:
+            values.extend(_named_values(item, field))
+        return values
+    if isinstance(value, dict):
+        return [value[name] for name in ('key', 'name', 'value', 'displayName', 'emailAddress', 'id') if value.get(name) is not None]
+    return [value]
+
+
+def field_values(issue, jira_field):
+    """
+    Return the comparable values of a REST field on an issue.
+
+    :param issue: Issue dictionary as returned by the search API
+    :param jira_field: REST field id
+    :return: List of values, empty when the field is not set
+    """
+    if jira_field == 'key':
+        return [issue.get('key')]
+    value = issue.get('fields', {}).get(SOURCE_FIELDS.get(jira_field, jira_field))
+    if jira_field == 'statusCategory':
+        value = (value or {}).get('statusCategory')
+    if jira_field in DATE_FIELDS:
+        parsed = parse_issue_date(value)
+        return [] if parsed is None else [parsed]
+    return [str(item) for item in _named_values(value, jira_field)]
+
+
+def _normalise(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+class Clause:
+
+    # Initialize a single field/operator/value clause
+    def __init__(self, field, operator, values):
+        self.field = field
+        self.jira_field = field_id(field)
+        # "resolution = Unresolved" is Jira's spelling of an empty resolution
+        if self.jira_field == 'resolution' and operator in ('=', '!=') and values[0].lower() == 'unresolved':
+            operator, values = ('is' if operator == '=' else 'is not'), []
+        self.operator = operator
+        self.values = values
+        if self.jira_field in DATE_FIELDS and operator not in ('is', 'is not'):
+            self._operands = [parse_jql_date(value) for value in values]
+        else:
+            self._operands = [_normalise(value) for value in values]
+        if operator in ('>', '>=', '<', '<=') and self.jira_field not in DATE_FIELDS:
+            raise UnsupportedJQL("Ordering on '{}' cannot be evaluated locally".format(field))
+
+    def __call__(self, issue):
+        issue_values = field_values(issue, self.jira_field)
+        if self.operator == 'is':
+            return not issue_values
+        if self.operator == 'is not':
+            return bool(issue_values)
+        # Like Jira, negative operators never match issues without a value
+        if not issue_values:
+            return False
+        if self.jira_field not in DATE_FIELDS:
+            issue_values = [_normalise(value) for value in issue_values]
+
+        operand = self._operands[0] if self._operands else None
+        if self.operator in ('=', 'in'):
+            return any(value in self._operands for value in issue_values)
+        if self.operator in ('!=', 'not in'):
+            return not any(value in self._operands for value in issue_values)
+        if self.operator == '~':
+            return any(operand in value for value in issue_values)
+        if self.operator == '!~':
+            return not any(operand in value for value in issue_values)
+        if self.operator == '>':
+            return any(value > operand for value in issue_values)
+        if self.operator == '>=':
+            return any(value >= operand for value in issue_values)
+        if self.operator == '<':
+            return any(value < operand for value in issue_values)
+        if self.operator == '<=':
+            return any(value <= operand for value in issue_values)
+        raise UnsupportedJQL("Operator '{}' cannot be evaluated locally".format(self.operator))
+
+    def fields(self):
+        return {SOURCE_FIELDS.get(self.jira_field, self.jira_field)}
+
+    def canonical(self):
+        if self.operator in ('is', 'is not'):
+            return '{} {} EMPTY'.format(self.field.lower(), self.operator.upper())
+        if self.operator in ('in', 'not in'):
+            values = ', '.join('"{}"'.format(value) for value in sorted(set(self.values), key=str.lower))
+            return '{} {} ({})'.format(self.field.lower(), self.operator.upper(), values)
+        return '{} {} "{}"'.format(self.field.lower(), self.operator, self.values[0])
+
+
+class BooleanExpression:
+
+    # Initialize an AND/OR node over child expressions
+    def __init__(self, operator, children):
+        self.operator = operator
+        self.children = children
+
+    def __call__(self, issue):
+        if self.operator == 'and':
+            return all(child(issue) for child in self.children)
+        return any(child(issue) for child in self.children)
+
+    def fields(self):
+        return set().union(*(child.fields() for child in self.children))
+
+    def canonical(self):
+        parts = sorted(child.canonical() if isinstance(child, Clause) else '({})'.format(child.canonical())
+                       for child in self.children)
+        return ' {} '.format(self.operator.upper()).join(parts)
+
+
+class NotExpression:
+
+    # Initialize a NOT node
+    def __init__(self, child):
+        self.child = child
+
+    def __call__(self, issue):
+        return not self.child(issue)
+
+    def fields(self):
+        return self.child.fields()
+
+    def canonical(self):
+        return 'NOT ({})'.format(self.child.canonical())
+
+
+class MatchAll:
+
+    def __call__(self, issue):
+        return True
+
+    def fields(self):
+        return set()
+
+    def canonical(self):
+        return ''
+
+
+class _Parser:
+
+    def __init__(self, jql_query):
+        self.tokens = self._tokenize(jql_query)
+        self.position = 0
+
+    @staticmethod
+    def _tokenize(jql_query):
+        tokens = []
+        position = 0
+        text = jql_query.strip()
+        while position < len(text):
+            match = _TOKEN_PATTERN.match(text, position)
+            if not match or match.end() == position:
+                raise UnsupportedJQL("Cannot tokenize JQL near: {}".format(text[position:position + 20]))
+            position = match.end()
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == 'string':
+                tokens.append(('string', re.sub(r'\\(.)', r'\1', value[1:-1])))
+            elif kind == 'word' and value.lower() in _KEYWORDS:
+                tokens.append(('keyword', value.lower()))
+            else:
+                tokens.append((kind, value))
+        return tokens
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, kind, value=None):
+        token_kind, token_value = self.take()
+        if token_kind != kind or (value is not None and token_value != value):
+            raise UnsupportedJQL("Expected {} but found {}".format(value or kind, token_value))
+        return token_value
+
+    def at_keyword(self, *keywords):
+        kind, value = self.peek()
+        return kind == 'keyword' and value in keywords
+
+    def parse(self):
+        if not self.tokens or self.at_keyword('order'):
+            return MatchAll()
+        expression = self.parse_or()
+        if self.at_keyword('order'):
+            # Ordering does not change which issues match
+            self.position = len(self.tokens)
+        if self.position != len(self.tokens):
+            raise UnsupportedJQL("Unexpected token: {}".format(self.peek()[1]))
+        return expression
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.at_keyword('or'):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else BooleanExpression('or', children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.at_keyword('and'):
+            self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else BooleanExpression('and', children)
+
+    def parse_not(self):
+        if self.at_keyword('not'):
+            self.take()
+            return NotExpression(self.parse_not())
+        if self.peek() == ('punct', '('):
+            self.take()
+            expression = self.parse_or()
+            self.expect('punct', ')')
+            return expression
+        return self.parse_clause()
+
+    def parse_value(self):
+        kind, value = self.take()
+        if kind not in ('string', 'word'):
+            raise UnsupportedJQL("Expected a value but found {}".format(value))
+        if self.peek() == ('punct', '('):
+            raise UnsupportedJQL("JQL function '{}' cannot be evaluated locally".format(value))
+        return value
+
+    def parse_clause(self):
+        kind, field = self.take()
+        if kind not in ('string', 'word'):
+            raise UnsupportedJQL("Expected a field but found {}".format(field))
+
+        if self.at_keyword('is'):
+            self.take()
+            operator = 'is'
+            if self.at_keyword('not'):
+                self.take()
+                operator = 'is not'
+            if not self.at_keyword('empty', 'null'):
+                raise UnsupportedJQL("Expected EMPTY after IS")
+            self.take()
+            return Clause(field, operator, [])
+
+        operator = None
+        if self.at_keyword('not') and self.peek(1) == ('keyword', 'in'):
+            self.position += 2
+            operator = 'not in'
+        elif self.at_keyword('in'):
+            self.take()
+            operator = 'in'
+        if operator:
+            self.expect('punct', '(')
+            values = [self.parse_value()]
+            while self.peek() == ('punct', ','):
+                self.take()
+                values.append(self.parse_value())
+            self.expect('punct', ')')
+            return Clause(field, operator, values)
+
+        kind, operator = self.take()
+        if kind != 'op':
+            raise UnsupportedJQL("Expected an operator after '{}'".format(field))
+        if self.at_keyword('empty', 'null'):
+            self.take()
+            if operator not in ('=', '!='):
+                raise UnsupportedJQL("EMPTY only supports = and !=")
+            return Clause(field, 'is' if operator == '=' else 'is not', [])
+        return Clause(field, operator, [self.parse_value()])
+
+
+def strip_order_by(jql_query):
+    """
+    Remove a trailing ORDER BY clause, which is not allowed inside parentheses.
+
+    :param jql_query: JQL query string
+    :return: JQL query string without ordering
+    """
+    return re.split(r'\s+order\s+by\s+', ' ' + jql_query.strip(), maxsplit=1, flags=re.IGNORECASE)[0].strip()
+
+
+def and_clause(jql_query, clause):
+    """
+    Narrow a JQL query with an extra clause.
+
+    :param jql_query: JQL query string
+    :param clause: JQL clause to AND onto the query
+    :return: Combined JQL query string
+    """
+    base = strip_order_by(jql_query)
+    if not clause:
+        return base
+    return '({}) AND {}'.format(base, clause) if base else clause
+
+
+def jql_field_name(jira_field):
+    custom = re.fullmatch(r'customfield_(\d+)', jira_field)
+    return 'cf[{}]'.format(custom.group(1)) if custom else jira_field
+
+
+def jql_value(value):
+    return '"{}"'.format(str(value).replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def compile_jql(jql_query):
+    """
+    Compile a JQL query into a predicate that can be evaluated against fetched issues.
+
+    Only plain field clauses combined with AND/OR/NOT are supported; JQL functions,
+    history operators (WAS, CHANGED) and relative dates raise UnsupportedJQL.
+
+    :param jql_query: JQL query string
+    :return: Callable predicate taking an issue dictionary
+    """
+    return _Parser(jql_query).parse()
+
+
+def can_evaluate(jql_query):
+    try:
+        compile_jql(jql_query)
+    except UnsupportedJQL:
+        return False
+    return True
+
+
+def and_terms(predicate):
+    if isinstance(predicate, BooleanExpression) and predicate.operator == 'and':
+        terms = []
+        for child in predicate.children:
+            terms.extend(and_terms(child))
+        return terms
+    return [predicate]
+
+
+def date_bounds(jql_query):
+    """
+    Bounds the top-level AND clauses of a JQL query put on its date fields.
+
+    A "<=" bound is widened by a minute because Jira compares it against the start of that minute.
+
+    :param jql_query: JQL query string
+    :return: Dictionary of REST field id to (start or None, end or None) so that every match has
+             start <= value < end, empty when the query cannot be parsed locally
+    """
+    try:
+        predicate = compile_jql(strip_order_by(jql_query))
+    except UnsupportedJQL:
+        return {}
+
+    bounds = {}
+    for term in and_terms(predicate):
+        if not isinstance(term, Clause) or term.jira_field not in DATE_FIELDS or term.operator not in ('>', '>=', '<', '<='):
+            continue
+        lower, upper = bounds.get(term.jira_field, (None, None))
+        value = term._operands[0]
+        if term.operator in ('>', '>='):
+            lower = value if lower is None else max(lower, value)
+        else:
+            end = value + timedelta(minutes=1) if term.operator == '<=' else value
+            upper = end if upper is None else min(upper, end)
+        bounds[term.jira_field] = (lower, upper)
+    return bounds
+
+
+def date_window(jql_query):
+    """
+    Date range a JQL query is bounded to, used to split a large query into date shards.
+
+    Only top-level AND clauses count, see date_bounds.
+
+    :param jql_query: JQL query string
+    :return: Tuple of (JQL field name, start, end) so that every match has start <= value < end,
+             None when no date field is bounded on both sides
+    """
+    for jira_field, (lower, upper) in date_bounds(jql_query).items():
+        if lower is not None and upper is not None and lower < upper:
+            return jql_field_name(jira_field), lower, upper
+    return None
+
+
+def date_range_clause(jql_field, start, end):
+    """
+    JQL clause selecting start <= field < end, at the minute precision JQL dates have.
+    """
+    return '{0} >= "{1}" AND {0} < "{2}"'.format(jql_field, start.strftime("%Y/%m/%d %H:%M"), end.strftime("%Y/%m/%d %H:%M"))
+
+
+def compile_undated_jql(jql_query, jira_field):
+    """
+    Compile a JQL query without its top-level range clauses on one date field.
+
+    Used when the date range is applied afterwards, e.g. by slicing periods of a metrics cube.
+
+    :param jql_query: JQL query string
+    :param jira_field: REST field id of the date field, e.g. resolutiondate
+    :return: Callable predicate taking an issue dictionary
+    """
+    terms = [term for term in and_terms(compile_jql(strip_order_by(jql_query)))
+             if not (isinstance(term, Clause) and term.jira_field == jira_field and term.operator in ('>', '>=', '<', '<='))]
+    terms = [term for term in terms if not isinstance(term, MatchAll)]
+    if not terms:
+        return MatchAll()
+    return terms[0] if len(terms) == 1 else BooleanExpression('and', terms)
@@ -1,43 +1,133 @@
 import json
 import logging
-import requests
+import os
+import threading
 from datetime import datetime
- 
+
+from jira_transport import get_default_transport
+
 logger = logging.getLogger(__name__)
- 
+
 OK_STATUS_CODES = (200)
 
-Jira_ID = 'name' 
-Jira_Passsword = 'pwd' 
+# Refresh the token when it expires within this many seconds
+TOKEN_REFRESH_MARGIN = 60
+# Optional token cache file shared by consecutive runs, disabled when unset
+DEFAULT_TOKEN_CACHE_PATH = os.environ.get("LASSO_TOKEN_CACHE")
+
+
 class LassoTokenClient:
- 
-    # Initialize LASSO Token Client
-    def __init__(self, lasso_token_url, username, password, service):
+
+    # Initialize LASSO Token Client, the token is only retrieved on first use
+    def __init__(self, lasso_token_url, username, password, service, cache_path=DEFAULT_TOKEN_CACHE_PATH, transport=None):
         self.lasso_token_url = lasso_token_url
         self.username = username
         self.password = password
         self.service = service
-        self.get_new_access_token()
- 
+        self.cache_path = cache_path
+        self.transport = transport
+        self.access_token = None
+        self.access_token_expiration = 0
+        self._lock = threading.Lock()
+        self.load_cached_token()
+
     # Retrieve new LASSO access token using bot username/password and save it
     def get_new_access_token(self):
         headers = {"Content-Type": "application/json"}
         data = {"username": self.username, "password": self.password, "service": self.service}
-        res = requests.post(self.lasso_token_url, data=json.dumps(data), headers=headers)
- 
+        transport = self.transport or get_default_transport()
+        res = transport.post(self.lasso_token_url, data=json.dumps(data), headers=headers)
+
         if res.status_code != 200:
             raise Exception("Cannot retrieve LASSO access token.\n{}\n{}".format(res.status_code, res.content))
- 
+
         access_token_resp = json.loads(res.content.decode())
         self.access_token = access_token_resp["access_token"]
         self.access_token_expiration = datetime.now().timestamp() + access_token_resp["expires_in"]
- 
+        self.save_cached_token()
+
+    def _token_is_fresh(self):
+        return self.access_token is not None and datetime.now().timestamp() + TOKEN_REFRESH_MARGIN <= self.access_token_expiration
+
     # Reuse existing LASSO access token until it expires
     def get_access_token(self):
-        # If access token expires in a minute, retrieve a new one
-        if datetime.now().timestamp() + 60 > self.access_token_expiration:
-            self.get_new_access_token()
-        return self.access_token
-    
-lasso_token_client = LassoTokenClient("https://api.lasso.name.net/rest/user/token", Jira_ID, Jira_Passsword,"name")
-access_token = lasso_token_client.get_access_token()
\ No newline at end of file
+        if self._token_is_fresh():
+            return self.access_token
+
+        # Only one thread refreshes, the others wait and reuse its token
+        with self._lock:
+            if not self._token_is_fresh():
+                self.get_new_access_token()
+            return self.access_token
+
+    def _cache_key(self):
+        return "{}|{}|{}".format(self.lasso_token_url, self.username, self.service)
+
+    def _read_cache_file(self):
+        try:
+            with open(self.cache_path, 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    # Load an unexpired token saved by a previous run
+    def load_cached_token(self):
+        if not self.cache_path:
+            return
+
+        entry = self._read_cache_file().get(self._cache_key())
+        if not entry:
+            return
+
+        self.access_token = entry.get("access_token")
+        self.access_token_expiration = entry.get("expires_at", 0)
+        if self._token_is_fresh():
+            logger.info("Reusing cached LASSO access token for %s", self.service)
+        else:
+            self.access_token = None
+            self.access_token_expiration = 0
+
+    # Persist the current token so the next run can reuse it
+    def save_cached_token(self):
+        if not self.cache_path:
+            return
+
+        cache = self._read_cache_file()
+        cache[self._cache_key()] = {"access_token": self.access_token, "expires_at": self.access_token_expiration}
+
+        try:
+            cache_directory = os.path.dirname(self.cache_path)
+            if cache_directory:
+                os.makedirs(cache_directory, exist_ok=True)
+            temp_path = "{}.{}.tmp".format(self.cache_path, os.getpid())
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(cache, cache_file)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Cannot write LASSO token cache %s: %s", self.cache_path, e)
+
+
+_token_clients = {}
+_token_clients_lock = threading.Lock()
+
+
+def get_token_client(lasso_token_url, username, password, service, cache_path=DEFAULT_TOKEN_CACHE_PATH):
+    """
+    Return the process-wide LassoTokenClient for a token endpoint, user and service.
+
+    :param lasso_token_url: LASSO token endpoint
+    :param username: Bot username
+    :param password: Bot password
+    :param service: LASSO service name
+    :param cache_path: Optional token cache file
+    :return: Shared LassoTokenClient instance
+    """
+    key = (lasso_token_url, username, service)
+    with _token_clients_lock:
+        client = _token_clients.get(key)
+        if client is None:
+            client = LassoTokenClient(lasso_token_url, username, password, service, cache_path=cache_path)
+            _token_clients[key] = client
+        return client
+
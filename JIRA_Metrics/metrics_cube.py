@@ -0,0 +1,355 @@
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+
+from defect_age_stats import parse_jira_dates, SECONDS_PER_DAY
+from jql_filter import compile_jql, compile_undated_jql, date_window, field_id, field_values, strip_order_by, and_terms, UnsupportedJQL
+from query_planner import locally_exact
+
+logger = logging.getLogger(__name__)
+
+# Time grain -> pandas period frequency, finest first
+GRAINS = {"minute": "min", "day": "D", "week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+DEFAULT_GRAIN = "month"
+
+# JQL dates have minute precision, so do the periods of a cube sliced by JQL date windows
+JQL_GRAIN = "minute"
+
+# An issue is counted in the period it was created in and, once resolved, in the period it was resolved in
+EVENTS = ("created", "resolved")
+EVENT_FIELDS = {"created": "created", "resolutiondate": "resolved"}
+
+# Summed per cell: issues, resolved issues and their resolution age, and for still open issues their
+# count and summed creation time, so the mean open age can be taken at any reference time
+MEASURES = ("issues", "resolved", "age_days", "open", "open_created_days")
+
+# Dimension value of an issue without a value
+NO_VALUE = "(none)"
+
+# Dimensions the report projections slice on, one member per report cell JQL and its priority column
+MEMBER_DIMENSION = "member"
+PRIORITY_DIMENSION = "priority"
+
+
+class FieldDimension:
+
+    # Initialize dimension over the values of a REST field, a multi-valued field such as
+    # components puts the issue under each of its values
+    def __init__(self, name, field):
+        self.name = name
+        self.field = field
+
+    def fields(self):
+        return {self.field}
+
+    def values(self, issue):
+        return [str(value) for value in field_values(issue, self.field)] or [NO_VALUE]
+
+
+class BucketDimension:
+
+    # Initialize dimension over the report columns of a PriorityClassifier
+    def __init__(self, name, classifier):
+        self.name = name
+        self.classifier = classifier
+
+    def fields(self):
+        return {self.classifier.field}
+
+    def values(self, issue):
+        return [self.classifier.classify(issue)]
+
+
+class JqlDimension:
+
+    # Initialize dimension whose values are named JQL predicates, an issue is put under every
+    # value it matches, members maps the value to its JQL or to a compiled predicate
+    def __init__(self, name, members):
+        self.name = name
+        self.members = {label: compile_jql(strip_order_by(member)) if isinstance(member, str) else member
+                        for label, member in members.items()}
+        inexact = [label for label, predicate in self.members.items() if not all(locally_exact(term) for term in and_terms(predicate))]
+        if inexact:
+            raise UnsupportedJQL("JQL of {} cannot be evaluated exactly without Jira".format(", ".join(map(str, inexact))))
+
+    def fields(self):
+        return set().union(*(predicate.fields() for predicate in self.members.values()))
+
+    def values(self, issue):
+        return [label for label, predicate in self.members.items() if predicate(issue)] or [NO_VALUE]
+
+
+def dimensions_from_config(config, classifier=None):
+    """
+    Build dimensions from the "dimensions" mapping of a "metrics_cube" config section.
+
+    A value that is a dictionary of name to JQL is a JQL dimension, "priority_buckets" is the
+    report's priority columns, and any other string is a REST field such as components.
+
+    :param config: Dictionary of dimension name to its definition
+    :param classifier: PriorityClassifier of the report
+    :return: List of dimensions
+    """
+    dimensions = []
+    for name, definition in (config or {}).items():
+        if isinstance(definition, dict):
+            dimensions.append(JqlDimension(name, definition))
+        elif definition == "priority_buckets":
+            dimensions.append(BucketDimension(name, classifier))
+        else:
+            dimensions.append(FieldDimension(name, definition))
+    return dimensions
+
+
+def cube_member(jql_query, default_event="created"):
+    """
+    Split a report JQL into a cube event, its date bounds and the predicate of everything else.
+
+    A created or resolutiondate range becomes the event and date window of the slice, a JQL
+    without one is sliced over every period. The window keeps the minute a bound such as
+    <= "2024-01-31" ends at in Jira, not the whole day.
+
+    :param jql_query: Rendered JQL
+    :param default_event: Event of a JQL without a created or resolutiondate range
+    :return: Tuple of (event, window start or None, exclusive window end or None, predicate)
+    """
+    window = date_window(jql_query)
+    if window is None or field_id(window[0]) not in EVENT_FIELDS:
+        return default_event, None, None, compile_jql(strip_order_by(jql_query))
+    jira_field = field_id(window[0])
+    return EVENT_FIELDS[jira_field], window[1], window[2], compile_undated_jql(jql_query, jira_field)
+
+
+def union_jql(jql_queries):
+    """
+    One JQL matching every issue of any of the queries, so a cube over them is fetched at once.
+    """
+    unique = list(dict.fromkeys(strip_order_by(jql_query) for jql_query in jql_queries))
+    return unique[0] if len(unique) == 1 else " OR ".join("({})".format(jql_query) for jql_query in unique)
+
+
+def cell_label(cell_key):
+    # Member value of a report cell, e.g. "Regression/BugsRaised"
+    return "/".join(map(str, cell_key)) if isinstance(cell_key, tuple) else str(cell_key)
+
+
+class CellCube:
+    """
+    Metrics cube over the cells of a report, each cell being one JQL.
+
+    The cells are fetched with one union JQL, every cell becomes a member of the member dimension
+    and is read back as a slice over its event and date window. Periods are stored per minute so
+    the windows are exact, grain is the period of ad-hoc slices.
+    """
+
+    # Initialize from a dictionary of cell key to (JQL, default event), raises UnsupportedJQL when
+    # a cell cannot be evaluated exactly without Jira
+    def __init__(self, cell_queries, priority_classifier, dimensions=(), grain="day"):
+        self.cells = {}
+        for cell_key, (jql_query, default_event) in cell_queries.items():
+            self.cells[cell_key] = cube_member(jql_query, default_event)
+        self.jql = union_jql(jql_query for jql_query, _ in cell_queries.values())
+        self.dimensions = [
+            JqlDimension(MEMBER_DIMENSION, {cell_label(cell_key): predicate for cell_key, (_, _, _, predicate) in self.cells.items()}),
+            BucketDimension(PRIORITY_DIMENSION, priority_classifier),
+        ] + list(dimensions)
+        self.priority_classifier = priority_classifier
+        self.grain = grain
+        self.cube = None
+
+    def fields(self):
+        return tuple(sorted(field for field in MetricsCube.required_fields(self.dimensions) if field != 'key'))
+
+    def build(self, issues):
+        self.cube = MetricsCube.build(issues, self.dimensions, self.grain, resolution=JQL_GRAIN)
+        return self.cube
+
+    def cell_slice(self, cell_key, by=(), window=None, now=None):
+        """
+        Slice of one cell, narrowed to the given window within its own date window.
+
+        :param window: Tuple of (start, exclusive end) datetimes, e.g. a month's JQL date window
+        :return: DataFrame as returned by MetricsCube.slice
+        """
+        event, cell_start, cell_end, _ = self.cells[cell_key]
+        window_start, window_end = window or (None, None)
+        start = max(filter(None, (window_start, cell_start)), default=None)
+        end = min(filter(None, (window_end, cell_end)), default=None)
+        window = None if start is None and end is None else (start, end)
+        return self.cube.slice(event, by=by, filters={MEMBER_DIMENSION: cell_label(cell_key)}, window=window, now=now)
+
+    def priority_counts(self, cell_key, window=None):
+        counts = self.cell_slice(cell_key, by=(PRIORITY_DIMENSION,), window=window)["issues"]
+        return {priority: int(counts.get(priority, 0)) for priority in self.priority_classifier.columns}
+
+
+def _wall_clock(values):
+    # Periods follow the Jira user's wall clock like JQL dates do, not UTC
+    values = pd.Series(values, dtype=object)
+    return pd.to_datetime(values.str.slice(0, 19), format="%Y-%m-%dT%H:%M:%S", errors='coerce')
+
+
+class MetricsCube:
+    """
+    Issue counts and age sums per dimension value, event and period.
+
+    The cube is a small columnar frame, so any slice is a filtered group-by over it without
+    touching Jira. Multi-valued dimensions count an issue once per value, so only group by or
+    filter such a dimension when it matters for the question asked.
+    """
+
+    # Initialize cube from its aggregated fact frame, periods are stored at the resolution grain and
+    # grouped by grain
+    def __init__(self, facts, dimensions, grain, resolution=None):
+        self.facts = facts
+        self.dimensions = [dimension.name for dimension in dimensions]
+        self.grain = grain
+        self.resolution = resolution or grain
+
+    @staticmethod
+    def required_fields(dimensions):
+        return {"created", "resolutiondate"}.union(*(dimension.fields() for dimension in dimensions))
+
+    @staticmethod
+    def check_grain(grain, resolution):
+        for name in (grain, resolution):
+            if name not in GRAINS:
+                raise ValueError("Unknown grain '{}', expected one of {}".format(name, ", ".join(GRAINS)))
+        if list(GRAINS).index(grain) < list(GRAINS).index(resolution):
+            raise ValueError("Grain '{}' is finer than the cube resolution '{}'".format(grain, resolution))
+
+    @classmethod
+    def build(cls, issues, dimensions, grain=DEFAULT_GRAIN, resolution=None):
+        """
+        Aggregate fetched issues into a cube in one pass.
+
+        :param issues: Iterable of issues holding at least required_fields(dimensions)
+        :param dimensions: List of dimensions
+        :param grain: One of GRAINS, the period slices are grouped by
+        :param resolution: One of GRAINS no coarser than grain, the period the facts are stored at so
+                           windows inside a grain period can be sliced exactly (default is grain)
+        :return: MetricsCube
+        """
+        resolution = resolution or grain
+        cls.check_grain(grain, resolution)
+        names = [dimension.name for dimension in dimensions]
+
+        keys, created, resolved = [], [], []
+        for issue in issues:
+            fields = issue['fields']
+            for combination in itertools.product(*(dimension.values(issue) for dimension in dimensions)):
+                keys.append(combination)
+                created.append(fields.get('created'))
+                resolved.append(fields.get('resolutiondate'))
+
+        frame = pd.DataFrame({name: [key[position] for key in keys] for position, name in enumerate(names)},
+                             index=pd.RangeIndex(len(keys)))
+        created_at = parse_jira_dates(created)
+        resolved_at = parse_jira_dates(resolved)
+        is_open = resolved_at.isna().to_numpy()
+        created_days = (created_at - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy() / SECONDS_PER_DAY
+        ages = (resolved_at - created_at).dt.total_seconds().to_numpy() / SECONDS_PER_DAY
+
+        frequency = GRAINS[resolution]
+        created_events = frame.assign(
+            event="created",
+            period=_wall_clock(created).dt.to_period(frequency),
+            issues=1,
+            resolved=(~is_open).astype(int),
+            age_days=np.nan_to_num(ages),
+            open=is_open.astype(int),
+            open_created_days=np.where(is_open, np.nan_to_num(created_days), 0.0),
+        )
+        resolved_events = frame.assign(
+            event="resolved",
+            period=_wall_clock(resolved).dt.to_period(frequency),
+            issues=1,
+            resolved=1,
+            age_days=np.nan_to_num(ages),
+            open=0,
+            open_created_days=0.0,
+        )[~is_open]
+
+        facts = pd.concat([created_events, resolved_events], ignore_index=True).dropna(subset=["period"])
+        facts = facts.groupby(names + ["event", "period"], sort=True, observed=True)[list(MEASURES)].sum().reset_index()
+        for name in names + ["event"]:
+            facts[name] = facts[name].astype("category")
+        logger.info("Metrics cube of %d cells built from %d issue rows", len(facts), len(frame))
+        return cls(facts, dimensions, grain, resolution)
+
+    def window_period(self, moment):
+        # Period a window bound starts, a bound inside a period cannot be sliced exactly
+        period = pd.Period(moment, GRAINS[self.resolution])
+        if period.start_time != pd.Timestamp(moment):
+            raise ValueError("Window bound {} is inside a {} period of the cube".format(moment, self.resolution))
+        return period
+
+    def slice(self, event="created", by=(), filters=None, start=None, end=None, window=None, now=None, grain=None):
+        """
+        Aggregate the cube over any of its dimensions and periods.
+
+        :param event: "created" places issues by creation period, "resolved" by resolution period
+        :param by: Dimension names, and "period", to group by
+        :param filters: Dictionary of dimension name to a value or list of values to keep
+        :param start: First day to include (YYYY-MM-DD), whole periods of the resolution are kept
+        :param end: Last day to include (YYYY-MM-DD)
+        :param window: Tuple of (start, exclusive end) datetimes, either may be None, on period
+                       boundaries of the resolution
+        :param now: Reference time of the mean open age (default is the current time)
+        :param grain: Grain of the "period" grouping, no finer than the resolution (default is the cube's grain)
+        :return: DataFrame of the measures plus mean_age (of the resolved issues) and mean_open_age
+                 (of the open issues at now) in days, indexed by `by`
+        """
+        if event not in EVENTS:
+            raise ValueError("Unknown event '{}', expected one of {}".format(event, ", ".join(EVENTS)))
+        grain = grain or self.grain
+        self.check_grain(grain, self.resolution)
+        facts = self.facts
+        mask = (facts["event"] == event).to_numpy(copy=True)
+        frequency = GRAINS[self.resolution]
+        if start is not None:
+            mask &= (facts["period"] >= pd.Period(start, "D").asfreq(frequency, how="start")).to_numpy()
+        if end is not None:
+            mask &= (facts["period"] <= pd.Period(end, "D").asfreq(frequency, how="end")).to_numpy()
+        window_start, window_end = window or (None, None)
+        if window_start is not None:
+            mask &= (facts["period"] >= self.window_period(window_start)).to_numpy()
+        if window_end is not None:
+            mask &= (facts["period"] < self.window_period(window_end)).to_numpy()
+        for name, values in (filters or {}).items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            mask &= facts[name].isin(list(values)).to_numpy()
+        facts = facts[mask]
+
+        by = list(by)
+        if "period" in by and grain != self.resolution:
+            facts = facts.assign(period=facts["period"].dt.asfreq(GRAINS[grain]))
+        if by:
+            result = facts.groupby(by, sort=True, observed=True)[list(MEASURES)].sum()
+        else:
+            result = facts[list(MEASURES)].sum().to_frame().T
+
+        now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+        if now.tzinfo is None:
+            now = now.tz_localize('UTC')
+        now_days = (now - pd.Timestamp(0, tz='UTC')).total_seconds() / SECONDS_PER_DAY
+        resolved = result["resolved"].where(result["resolved"] > 0)
+        open_issues = result["open"].where(result["open"] > 0)
+        result["mean_age"] = (result["age_days"] / resolved).fillna(0.0)
+        result["mean_open_age"] = ((open_issues * now_days - result["open_created_days"]) / open_issues).fillna(0.0)
+        return result
+
+    def pivot(self, rows, columns, measure="issues", **slice_args):
+        """
+        Two-way table of one measure, e.g. components by month.
+
+        :param rows: Dimension names for the rows
+        :param columns: Dimension names for the columns
+        :param measure: One of MEASURES, "mean_age" or "mean_open_age"
+        :return: DataFrame with missing cells as 0
+        """
+        rows, columns = list(rows), list(columns)
+        table = self.slice(by=rows + columns, **slice_args)[measure]
+        return table.unstack(columns).fillna(0)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Long-running metrics service for the QMR and defect age reports.
+
+The latest per-month QMR frames and the defect age frame are kept in memory and refreshed on a
+schedule. With an "issue_mirror" config section each refresh only pulls the issues updated since
+the previous one and recomputes the months those issues fall in, provided every query of a month
+was answered from the mirror. Months with a query outside the mirror, and every month without a
+mirror, re-run their report queries against Jira on every refresh.
+
+Endpoints:
+    GET  /status                  refresh state and the query totals of the last refresh
+    GET  /qmr                     every month as JSON
+    GET  /qmr/<YYYY-MM>           one month as JSON
+    GET  /qmr.xlsx                every month in one workbook
+    GET  /qmr/<YYYY-MM>.xlsx      one month as a workbook
+    GET  /defect-age              defect age frame as JSON
+    GET  /defect-age.xlsx         defect age workbook
+    POST /refresh                 start a refresh now
+
+Example:
+    python jira_metrics.py serve --section Option1 --start-date 2024-01-01 --interval 300
+"""
+
+import io
+import json
+import logging
+import re
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pandas as pd
+
+from Report__ import JiraReportGenerator, create_report_generator, DEFAULT_MONTH_FIELDS, DEFAULT_MONTH_FIELD
+from Defect_Age import create_defect_age_report
+from jira_transport import configure_default_transport
+from query_trace import get_default_tracer, configure_default_tracer, export_trace
+from report_config import (ConfigError, load_json_config, validate_date, validate_qmr_config, validate_defect_age_config,
+                           split_defect_age_config, render_defect_age_queries, iter_months)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 300
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_MONTH_PATH = re.compile(r"/qmr/(\d{4}-\d{2})(\.xlsx)?")
+
+
+def frame_to_dict(frame):
+    """
+    JSON-ready form of a report frame, columns are [section, priority] pairs.
+
+    :param frame: Numeric report frame
+    :return: Dictionary with index, columns and data lists
+    """
+    return {
+        "index": [str(label) for label in frame.index],
+        "columns": [list(column) if isinstance(column, tuple) else [column] for column in frame.columns],
+        "data": [[None if pd.isna(value) else float(value) for value in row] for row in frame.to_numpy()],
+    }
+
+
+def frame_to_excel(frame):
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=True)
+    return buffer.getvalue()
+
+
+class MetricsService:
+
+    # Initialize service from the report configs, either config may be omitted,
+    # end_date=None keeps adding months up to the current one
+    def __init__(self, start_date, end_date=None, qmr_config_path=None, defect_age_config_path=None,
+                 interval=DEFAULT_REFRESH_INTERVAL, prometheus_path=None):
+        if qmr_config_path is None and defect_age_config_path is None:
+            raise ConfigError("A QMR or defect age config is required")
+        self.start_date = validate_date(start_date)
+        self.end_date = None if end_date is None else validate_date(end_date)
+        self.interval = interval
+        self.prometheus_path = prometheus_path
+
+        # Results have to follow Jira, so the query cache is never used
+        self.qmr_generator = None
+        self.qmr_month_fields = ()
+        if qmr_config_path is not None:
+            data = load_json_config(qmr_config_path)
+            errors = validate_qmr_config(data)
+            if errors:
+                raise ConfigError("; ".join(errors))
+            self.qmr_generator = create_report_generator(qmr_config_path, data)
+            month_fields = dict(DEFAULT_MONTH_FIELDS, **data.get("month_fields", {}))
+            self.qmr_month_fields = tuple(set(month_fields.values()) | {DEFAULT_MONTH_FIELD, "created"})
+
+        self.defect_age_report = None
+        self.defect_age_queries = None
+        if defect_age_config_path is not None:
+            queries, settings = split_defect_age_config(load_json_config(defect_age_config_path))
+            errors = validate_defect_age_config(queries)
+            if errors:
+                raise ConfigError("; ".join(errors))
+            self.defect_age_queries = queries
+            self.defect_age_report = create_defect_age_report(queries, settings, start_date, self.current_end_date())
+
+        self.mirrors = self._shared_mirrors()
+        if not self.mirrors:
+            logger.warning("No issue_mirror config section, every refresh re-runs the report queries against Jira")
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._httpd = None
+        self.qmr_reports = {}
+        # Months whose last computation was answered from the mirror alone, a mirror sync tells when they change
+        self.qmr_mirror_months = set()
+        self.defect_age = None
+        self.status = {"ticks": 0, "last_refresh": None, "last_duration": None, "last_error": None,
+                       "changed_issues": 0, "refreshed_months": [], "queries": None}
+
+    def _shared_mirrors(self):
+        # Two mirrors on one file would each miss the issues the other synced, share one instead
+        mirrors = []
+        qmr_mirror = self.qmr_generator.issue_mirror if self.qmr_generator is not None else None
+        defect_mirror = self.defect_age_report.issue_mirror if self.defect_age_report is not None else None
+        if qmr_mirror is not None:
+            mirrors.append((qmr_mirror, self.qmr_generator.search_client))
+        if defect_mirror is not None:
+            if qmr_mirror is not None and defect_mirror.path == qmr_mirror.path and defect_mirror.scope_jql == qmr_mirror.scope_jql:
+                defect_mirror.close()
+                self.defect_age_report.issue_mirror = qmr_mirror
+                self.defect_age_report.search_client.mirror = qmr_mirror
+            else:
+                mirrors.append((defect_mirror, self.defect_age_report.search_client))
+        return mirrors
+
+    def current_end_date(self):
+        return self.end_date or date.today().isoformat()
+
+    def sync_mirrors(self):
+        """
+        Pull the issues updated since the last refresh into every mirror.
+
+        :return: Tuple of (number of changed issues, set of YYYY-MM months they fall in)
+        """
+        changed_keys = set()
+        changed_months = set()
+
+        def on_change(previous, issue):
+            # issue is None when the issue left the mirror scope
+            changed_keys.add((issue or previous)['key'])
+            for version in (previous, issue):
+                if version is None:
+                    continue
+                for field in self.qmr_month_fields:
+                    value = version['fields'].get(field)
+                    if value:
+                        changed_months.add(value[:7])
+
+        for mirror, search_client in self.mirrors:
+            try:
+                mirror.sync(search_client, on_change=on_change)
+            except Exception as e:
+                # The mirror keeps its last sync, the frames are served from it until the next tick
+                logger.error("Issue mirror sync failed, keeping the previous data: %s", e)
+        return len(changed_keys), changed_months
+
+    def refresh_qmr(self, changed_months, force=False):
+        """
+        Recompute the QMR months the changed issues fall in, and months not computed yet.
+
+        Only a month every query of which was answered from the mirror is left alone when no
+        changed issue falls in it. A month that needed Jira, e.g. for a query outside the mirror
+        scope, is re-queried on every tick.
+
+        :param changed_months: Set of YYYY-MM months touched since the last refresh
+        :param force: Recompute every month
+        :return: List of recomputed months
+        """
+        generator = self.qmr_generator
+        tracer = get_default_tracer()
+        months = list(iter_months(self.start_date, self.current_end_date()))
+        with self._lock:
+            mirror_months = set(self.qmr_mirror_months)
+        # Without a mirror no month is answered from it, so every month is re-queried
+        stale = {month_start[:7]: (month_start, month_end, report_filename)
+                 for month_start, month_end, report_filename in months
+                 if force or month_start[:7] in changed_months or month_start[:7] not in mirror_months}
+
+        def compute(month_start, month_end, report_filename):
+            with tracer.context(month=month_start[:7]):
+                return generator.compute_report(month_start, month_end, report_filename)
+
+        results = generator.month_executor.run(compute, stale)
+        month_keys = [month_start[:7] for month_start, _, _ in months]
+        month_queries = tracer.summary()["by"].get("month", {})
+        answered_from_mirror = {month for month, frame in results.items() if frame is not None and month in month_queries
+                                and month_queries[month]["mirror"] == month_queries[month]["queries"]}
+        with self._lock:
+            self.qmr_mirror_months = (mirror_months - set(stale)) | answered_from_mirror
+            reports = {month: frame for month, frame in self.qmr_reports.items() if month in month_keys}
+            # A month that failed keeps its previous frame
+            reports.update({month: frame for month, frame in results.items() if frame is not None})
+            self.qmr_reports = {month: reports[month] for month in month_keys if month in reports}
+        return [month for month, frame in results.items() if frame is not None]
+
+    def refresh_defect_age(self):
+        # Unresolved ages grow with time, so the frame is rebuilt on every tick
+        report = self.defect_age_report
+        report.queries = render_defect_age_queries(self.defect_age_queries, self.start_date, self.current_end_date())
+        frame = report.build_report()
+        with self._lock:
+            self.defect_age = frame
+
+    def refresh(self, force=False):
+        """
+        Run one refresh tick: sync the mirrors, then recompute what the changed issues affect.
+
+        Each tick has its own run trace, written to the Prometheus textfile when one is configured.
+
+        :param force: Recompute every QMR month
+        :return: Status dictionary after the tick
+        """
+        with self._refresh_lock:
+            ticks = self.status["ticks"] + 1
+            tracer = configure_default_tracer("service", tick=ticks)
+            started = time.perf_counter()
+            error = None
+            changed_issues = 0
+            refreshed_months = []
+            try:
+                with tracer.span("sync_issue_mirror"):
+                    changed_issues, changed_months = self.sync_mirrors()
+                if self.qmr_generator is not None:
+                    with tracer.span("refresh_qmr"):
+                        refreshed_months = self.refresh_qmr(changed_months, force=force)
+                if self.defect_age_report is not None:
+                    with tracer.span("refresh_defect_age"):
+                        self.refresh_defect_age()
+            except Exception as e:
+                logger.exception("Metrics refresh failed")
+                error = "{}: {}".format(type(e).__name__, e)
+            finally:
+                export_trace(tracer, prometheus_path=self.prometheus_path)
+
+            status = {
+                "ticks": ticks,
+                "last_refresh": datetime.now().isoformat(timespec='seconds'),
+                "last_duration": round(time.perf_counter() - started, 3),
+                "last_error": error,
+                "changed_issues": changed_issues,
+                "refreshed_months": refreshed_months,
+                "queries": tracer.summary()["totals"],
+            }
+            with self._lock:
+                self.status = status
+            logger.info("Refresh %d done in %.1fs, %d changed issues, months %s", ticks, status["last_duration"],
+                        changed_issues, refreshed_months)
+            return status
+
+    def request_refresh(self):
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.status), dict(self.qmr_reports), self.defect_age
+
+    def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Start the refresh loop and the HTTP server, both on daemon threads.
+
+        :return: Base URL of the server
+        """
+        self._httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self._httpd.service = self
+        threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+        self._thread = threading.Thread(target=self._refresh_loop, name="metrics-refresh", daemon=True)
+        self._thread.start()
+        return "http://{}:{}".format(*self._httpd.server_address[:2])
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        base_url = self.start(host, port)
+        print(f"Serving metrics on {base_url}, refreshing every {self.interval}s", flush=True)
+        try:
+            self._stop.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status, body, content_type, filename=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if filename:
+            self.send_header("Content-Disposition", 'attachment; filename="{}"'.format(filename))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send_frame(self, frame, excel_name=None):
+        if excel_name is None:
+            self._send_json(200, frame_to_dict(frame))
+        else:
+            self._send(200, frame_to_excel(frame), XLSX_CONTENT_TYPE, filename=excel_name)
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlparse(self.path).path.rstrip("/") or "/status"
+        status, qmr_reports, defect_age = service.snapshot()
+
+        if path == "/status":
+            self._send_json(200, dict(status, months=list(qmr_reports), defect_age=defect_age is not None))
+            return
+        if status["ticks"] == 0:
+            self._send_json(503, {"error": "The first refresh has not finished yet"})
+            return
+
+        if path in ("/qmr", "/qmr.xlsx"):
+            if not qmr_reports:
+                self._send_json(404, {"error": "No QMR months available"})
+            elif path == "/qmr":
+                self._send_json(200, {"months": {month: frame_to_dict(frame) for month, frame in qmr_reports.items()}})
+            else:
+                combined = pd.concat(list(qmr_reports.values()), axis=0, keys=list(qmr_reports), names=['Report', None])
+                self._send_frame(JiraReportGenerator.format_report(combined), "qmr.xlsx")
+            return
+
+        month_match = _MONTH_PATH.fullmatch(path)
+        if month_match:
+            frame = qmr_reports.get(month_match.group(1))
+            if frame is None:
+                self._send_json(404, {"error": "No QMR report for {}".format(month_match.group(1))})
+            elif month_match.group(2):
+                self._send_frame(JiraReportGenerator.format_report(frame), "qmr_{}.xlsx".format(month_match.group(1)))
+            else:
+                self._send_frame(frame)
+            return
+
+        if path in ("/defect-age", "/defect-age.xlsx"):
+            if defect_age is None:
+                self._send_json(404, {"error": "No defect age report available"})
+            elif path == "/defect-age":
+                self._send_frame(defect_age)
+            else:
+                self._send_frame(defect_age.round(2), "defect_age.xlsx")
+            return
+
+        self._send_json(404, {"error": "Unknown path {}".format(path)})
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") == "/refresh":
+            self.server.service.request_refresh()
+            self._send_json(202, {"refresh": "scheduled"})
+            return
+        self._send_json(404, {"error": "Unknown path {}".format(self.path)})
+
+
+def run_service(start_date, end_date=None, qmr_config_path=None, defect_age_config_path=None, interval=DEFAULT_REFRESH_INTERVAL,
+                host=DEFAULT_HOST, port=DEFAULT_PORT, rate_limit=None, prometheus_path=None):
+    """
+    Run the metrics service until interrupted.
+
+    :param start_date: First report day, YYYY-MM-DD
+    :param end_date: Last report day, None to follow the current date
+    :param interval: Seconds between refreshes
+    :param rate_limit: Maximum Jira requests per second
+    :param prometheus_path: Optional Prometheus textfile rewritten after every refresh
+    """
+    configure_default_transport(rate_limit=rate_limit)
+    service = MetricsService(start_date, end_date, qmr_config_path=qmr_config_path, defect_age_config_path=defect_age_config_path,
+                             interval=interval, prometheus_path=prometheus_path)
+    service.serve(host, port)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Jira search API and the LASSO token endpoint, used by benchmark.py.
+
+Serves a synthetic issue set and evaluates JQL with jql_filter, so report configs written in the
+supported JQL subset return realistic results. Only the standard library is needed.
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from jql_filter import UnsupportedJQL, compile_jql, DATE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PATH = "/rest/api/latest/search"
+TOKEN_PATH = "/rest/user/token"
+STATS_PATH = "/_stats"
+
+# Jira caps maxResults regardless of the requested page size
+DEFAULT_MAX_PAGE_SIZE = 1000
+TOKEN_LIFETIME = 3600
+
+PROJECT_KEY = "BENCH"
+
+# Value -> weight, roughly the shape of a large product backlog
+PRIORITY_WEIGHTS = {'Blocker': 3, 'Critical': 12, 'Major': 45, 'Minor': 32, 'Trivial': 8}
+SECTION_LABEL_WEIGHTS = {'regression': 60, 'exploratory': 40}
+RESOLUTION_WEIGHTS = {'Fixed': 62, 'Duplicate': 12, "Won't Fix": 10, 'Cannot Reproduce': 11, 'Done': 5}
+RESOLVED_SHARE = 0.7
+GERRIT_SHARE = 0.55
+# Median days from created to resolved, the tail follows a log-normal distribution
+MEDIAN_RESOLUTION_DAYS = 9
+RESOLUTION_DAYS_SIGMA = 1.3
+
+JIRA_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.000+0000"
+
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def generate_issues(count, start_date="2023-01-01", end_date="2024-12-31", seed=0):
+    """
+    Build a reproducible synthetic issue set.
+
+    Date fields hold datetime objects, they are serialized only for the issues of a response page.
+    Issues with the same priority, status or resolution share the nested field dictionaries.
+
+    :param count: Number of issues
+    :param start_date: First creation date, YYYY-MM-DD
+    :param end_date: Last creation date, YYYY-MM-DD
+    :param seed: Random seed
+    :return: List of issue dictionaries in key order
+    """
+    rng = random.Random(seed)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    span_seconds = int((datetime.strptime(end_date, "%Y-%m-%d") - start).total_seconds()) + 86399
+    now = datetime.now().replace(microsecond=0)
+
+    priorities = {name: {'name': name} for name in PRIORITY_WEIGHTS}
+    resolutions = {name: {'name': name} for name in RESOLUTION_WEIGHTS}
+    statuses = {name: {'name': name, 'statusCategory': {'key': key, 'name': category}}
+                for name, key, category in (('Open', 'new', 'To Do'), ('Closed', 'done', 'Done'))}
+    label_sets = {}
+
+    issues = []
+    for number in range(1, count + 1):
+        created = start + timedelta(seconds=rng.randrange(span_seconds))
+        labels = [_weighted(rng, SECTION_LABEL_WEIGHTS)]
+        resolution = None
+        resolutiondate = None
+        if rng.random() < RESOLVED_SHARE:
+            resolution = _weighted(rng, RESOLUTION_WEIGHTS)
+            days = rng.lognormvariate(0, RESOLUTION_DAYS_SIGMA) * MEDIAN_RESOLUTION_DAYS
+            resolutiondate = created + timedelta(days=days)
+            if resolutiondate > now:
+                resolution, resolutiondate = None, None
+            elif resolution == 'Fixed' and rng.random() < GERRIT_SHARE:
+                labels.append('gerrit')
+
+        labels = label_sets.setdefault(tuple(labels), labels)
+        issues.append({
+            'key': '{}-{}'.format(PROJECT_KEY, number),
+            'fields': {
+                'project': {'key': PROJECT_KEY},
+                'issuetype': {'name': 'Bug'},
+                'summary': 'Synthetic defect {}'.format(number),
+                'priority': priorities[_weighted(rng, PRIORITY_WEIGHTS)],
+                'labels': labels,
+                'status': statuses['Closed' if resolution else 'Open'],
+                'resolution': resolutions[resolution] if resolution else None,
+                'created': created,
+                'resolutiondate': resolutiondate,
+                'updated': resolutiondate or created,
+            },
+        })
+    return issues
+
+
+def serialize_issue(issue, fields):
+    issue_fields = issue['fields']
+    names = issue_fields if fields is None else [name for name in fields if name in issue_fields]
+    projected = {}
+    for name in names:
+        value = issue_fields[name]
+        if name in DATE_FIELDS and value is not None:
+            value = value.strftime(JIRA_DATE_FORMAT)
+        projected[name] = value
+    return {'key': issue['key'], 'fields': projected}
+
+
+class MockJiraState:
+
+    # Initialize shared server state: issues, simulated latency and traffic counters
+    def __init__(self, issues, latency=0.0, max_page_size=DEFAULT_MAX_PAGE_SIZE):
+        self.issues = issues
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self._matches = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'search_requests': 0, 'token_requests': 0, 'bytes_sent': 0, 'bytes_received': 0}
+
+    def record(self, kind, bytes_received, bytes_sent):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[kind] += 1
+            self.stats['bytes_received'] += bytes_received
+            self.stats['bytes_sent'] += bytes_sent
+
+    def matching_issues(self, jql_query):
+        # Every page of a query filters the same issues, evaluate each JQL once
+        matches = self._matches.get(jql_query)
+        if matches is None:
+            predicate = compile_jql(jql_query)
+            matches = [issue for issue in self.issues if predicate(issue)]
+            self._matches[jql_query] = matches
+        return matches
+
+    def search(self, jql_query, start_at, max_results, fields):
+        matches = self.matching_issues(jql_query)
+        max_results = max(0, min(max_results, self.max_page_size))
+        page = matches[start_at:start_at + max_results]
+        return {
+            'startAt': start_at,
+            'maxResults': max_results,
+            'total': len(matches),
+            'issues': [serialize_issue(issue, fields) for issue in page],
+        }
+
+
+class MockJiraHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _request_size(self, body=b""):
+        return len(self.requestline) + len(str(self.headers)) + len(body)
+
+    # Send a JSON response, kind names the counter of search and token requests,
+    # None for the stats and not found responses which are not counted
+    def _send_json(self, status, payload, kind, body=b""):
+        data = json.dumps(payload).encode()
+        # Counted before the response is sent, so a client reading the stats right after sees it
+        if kind:
+            self.server.state.record(kind, self._request_size(body), len(data))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlparse(self.path)
+        if url.path == STATS_PATH:
+            self._send_json(200, state.stats, None)
+            return
+        if url.path != SEARCH_PATH:
+            self._send_json(404, {'errorMessages': ['Not found']}, None)
+            return
+
+        if state.latency:
+            time.sleep(state.latency)
+        params = parse_qs(url.query)
+        jql_query = params.get('jql', [''])[0]
+        fields = params.get('fields', [''])[0]
+        fields = None if not fields or fields in ('*all', '*navigable') else fields.split(',')
+        try:
+            page = state.search(jql_query, int(params.get('startAt', ['0'])[0]),
+                                int(params.get('maxResults', ['50'])[0]), fields)
+        except UnsupportedJQL as e:
+            self._send_json(400, {'errorMessages': [str(e)]}, 'search_requests')
+            return
+        self._send_json(200, page, 'search_requests')
+
+    def do_POST(self):
+        state = self.server.state
+        body = self._read_body()
+        url = urlparse(self.path)
+        if url.path == STATS_PATH + "/reset":
+            state.reset_stats()
+            self._send_json(200, {}, None)
+            return
+        if url.path != TOKEN_PATH:
+            self._send_json(404, {'errorMessages': ['Not found']}, None, body)
+            return
+
+        if state.latency:
+            time.sleep(state.latency)
+        token = {'access_token': 'mock-token-{}'.format(time.time()), 'expires_in': TOKEN_LIFETIME}
+        self._send_json(200, token, 'token_requests', body)
+
+
+class MockJiraServer:
+
+    # Initialize threaded mock server, port 0 picks a free port
+    def __init__(self, issues, latency=0.0, host="127.0.0.1", port=0, max_page_size=DEFAULT_MAX_PAGE_SIZE):
+        self.httpd = ThreadingHTTPServer((host, port), MockJiraHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = MockJiraState(issues, latency=latency, max_page_size=max_page_size)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def search_url(self):
+        return self.base_url + SEARCH_PATH
+
+    @property
+    def token_url(self):
+        return self.base_url + TOKEN_PATH
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-jira", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Jira search API and LASSO token endpoint.")
+    parser.add_argument("--issues", type=int, default=10000, help="Number of synthetic issues")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every search and token request")
+    parser.add_argument("--start-date", default="2023-01-01", help="First issue creation date (YYYY-MM-DD)")
+    parser.add_argument("--end-date", default="2024-12-31", help="Last issue creation date (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the issue set")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on, 0 picks a free port")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    issues = generate_issues(args.issues, args.start_date, args.end_date, seed=args.seed)
+    server = MockJiraServer(issues, latency=args.latency, host=args.host, port=args.port)
+    # The first line tells a parent process where to connect
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
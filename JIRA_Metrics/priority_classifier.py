@@ -0,0 +1,100 @@
+import logging
+
+from jql_filter import jql_field_name, jql_value
+
+logger = logging.getLogger(__name__)
+
+# Report column -> field values that belong to it, anything else goes to the fallback column
+DEFAULT_PRIORITY_BUCKETS = {
+    'Blocker': ['Blocker'],
+    'Critical': ['Critical'],
+}
+DEFAULT_FALLBACK_BUCKET = 'Others'
+
+
+class PriorityClassifier:
+
+    # Initialize classifier mapping values of an issue field to report columns
+    def __init__(self, field='priority', buckets=None, fallback=DEFAULT_FALLBACK_BUCKET):
+        self.field = field
+        buckets = DEFAULT_PRIORITY_BUCKETS if buckets is None else buckets
+        self.fallback = fallback
+        self.columns = list(buckets) + ([fallback] if fallback not in buckets else [])
+        self.bucket_values = {column: list(values) for column, values in buckets.items()}
+        self._lookup = {}
+        for column, values in buckets.items():
+            for value in values:
+                self._lookup[value.lower()] = column
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a classifier from the optional "priority_buckets" config section.
+
+        :param config: Dictionary with optional "field", "buckets" and "fallback" keys, or None
+        :return: PriorityClassifier instance
+        """
+        config = config or {}
+        return cls(
+            field=config.get('field', 'priority'),
+            buckets=config.get('buckets'),
+            fallback=config.get('fallback', DEFAULT_FALLBACK_BUCKET)
+        )
+
+    def field_value(self, issue):
+        value = issue.get('fields', {}).get(self.field)
+        if isinstance(value, dict):
+            value = value.get('name', value.get('value'))
+        return value
+
+    def classify(self, issue):
+        value = self.field_value(issue)
+        if value is None:
+            return self.fallback
+        return self._lookup.get(str(value).lower(), self.fallback)
+
+    def jql_clauses(self):
+        """
+        JQL clause selecting each report column, used to count buckets server side.
+
+        :return: Dictionary of column to JQL clause, in column order. The clause is empty when
+                 the column matches everything and None when it can never match
+        """
+        field = jql_field_name(self.field)
+        clauses = {}
+        listed_values = []
+        for column, values in self.bucket_values.items():
+            if column != self.fallback and values:
+                clauses[column] = '{} in ({})'.format(field, ', '.join(jql_value(value) for value in values))
+                listed_values.extend(values)
+
+        # The fallback column holds every other value, including issues without one
+        if listed_values:
+            clauses[self.fallback] = '({0} not in ({1}) OR {0} is EMPTY)'.format(field, ', '.join(jql_value(value) for value in listed_values))
+        else:
+            clauses[self.fallback] = ''
+        return {column: clauses.get(column) for column in self.columns}
+
+    def count(self, issues):
+        """
+        Count issues per report column in a single pass.
+
+        :param issues: Iterable of issue dictionaries
+        :return: Dictionary of column to issue count, in column order
+        """
+        counts = dict.fromkeys(self.columns, 0)
+        for issue in issues:
+            counts[self.classify(issue)] += 1
+        return counts
+
+    def split(self, issues):
+        """
+        Group issues per report column in a single pass.
+
+        :param issues: Iterable of issue dictionaries
+        :return: Dictionary of column to list of issues, in column order
+        """
+        groups = {column: [] for column in self.columns}
+        for issue in issues:
+            groups[self.classify(issue)].append(issue)
+        return groups
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from issue_records import to_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "query_cache.sqlite")
+# Seconds a cached result stays valid
+DEFAULT_TTL = 6 * 60 * 60
+# Total compressed payload kept on disk before least recently used entries are evicted
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class QueryCache:
+
+    # Initialize SQLite backed search result cache
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, refresh=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # When refreshing, entries are re-fetched once per run and stored again
+        self.refresh = refresh
+        self._refreshed = set()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache ("
+                " key TEXT PRIMARY KEY,"
+                " jql TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS query_cache_last_access ON query_cache (last_access)")
+
+    @staticmethod
+    def make_key(jql_query, fields):
+        key_source = json.dumps({'jql': jql_query, 'fields': sorted(fields or ())}, sort_keys=True)
+        return hashlib.sha256(key_source.encode()).hexdigest()
+
+    def get(self, jql_query, fields):
+        """
+        Return cached issues for a templated JQL query and field list.
+
+        :param jql_query: Fully templated JQL query string
+        :param fields: Requested fields
+        :return: List of issues, or None on a miss or expired entry
+        """
+        key = self.make_key(jql_query, fields)
+        if self.refresh and key not in self._refreshed:
+            return None
+
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT payload, expires_at FROM query_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, expires_at = row
+            if expires_at <= now:
+                self._connection.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE query_cache SET last_access = ? WHERE key = ?", (now, key))
+
+        return json.loads(zlib.decompress(payload))
+
+    def put(self, jql_query, fields, issues, ttl=None):
+        """
+        Store the issues for a templated JQL query and evict least recently used entries over the size cap.
+
+        :param jql_query: Fully templated JQL query string
+        :param fields: Requested fields
+        :param issues: List of issues to cache
+        :param ttl: Entry lifetime in seconds (default is the cache TTL)
+        """
+        key = self.make_key(jql_query, fields)
+        payload = zlib.compress(json.dumps(issues, separators=(',', ':'), default=to_json).encode())
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO query_cache (key, jql, payload, size, created_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, jql_query, payload, len(payload), now, now + ttl, now)
+            )
+            self._refreshed.add(key)
+            self._evict()
+
+    def _evict(self):
+        self._connection.execute("DELETE FROM query_cache WHERE expires_at <= ?", (time.time(),))
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM query_cache").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        for key, size in self._connection.execute(
+                "SELECT key, size FROM query_cache ORDER BY last_access ASC").fetchall():
+            if total_size <= self.max_bytes:
+                break
+            self._connection.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+            total_size -= size
+            logger.info("Evicted query cache entry %s", key)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_or_fetch(self, jql_query, fields, fetch):
+        """
+        Return cached issues, or fetch and cache them.
+
+        Concurrent callers asking for the same query wait for a single fetch.
+
+        :param jql_query: Fully templated JQL query string
+        :param fields: Requested fields
+        :param fetch: Callable returning the list of issues on a miss
+        :return: List of issues
+        """
+        with self._key_lock(self.make_key(jql_query, fields)):
+            issues = self.get(jql_query, fields)
+            if issues is not None:
+                logger.info("Query cache hit for JQL query: %s", jql_query)
+                return issues
+
+            issues = fetch()
+            self.put(jql_query, fields, issues)
+            return issues
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM query_cache")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,50 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on JQL queries in flight against Jira at once
+DEFAULT_MAX_WORKERS = 8
+
+
+class QueryExecutor:
+
+    # Initialize query executor with a concurrency limit
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1, got {}".format(max_workers))
+        self.max_workers = max_workers
+
+    def run(self, fetch, jobs):
+        """
+        Dispatch every job at once and gather the results in job order.
+
+        :param fetch: Callable invoked once per job
+        :param jobs: Ordered mapping of result key to the argument tuple for fetch
+        :return: Dictionary of result key to fetch result, in the same order as jobs
+        """
+        jobs = dict(jobs)
+        if not jobs:
+            return {}
+
+        if self.max_workers == 1 or len(jobs) == 1:
+            return {key: fetch(*args) for key, args in jobs.items()}
+
+        workers = min(self.max_workers, len(jobs))
+        logger.info("Dispatching %d queries on %d workers", len(jobs), workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jql") as pool:
+            futures = {key: pool.submit(fetch, *args) for key, args in jobs.items()}
+            return {key: future.result() for key, future in futures.items()}
+
+    def run_calls(self, calls):
+        """
+        Dispatch heterogeneous calls at once and gather the results in call order.
+
+        :param calls: Ordered mapping of result key to a (callable, *args) tuple
+        :return: Dictionary of result key to call result, in the same order as calls
+        """
+        return self.run(_call, calls)
+
+
+def _call(function, *args):
+    return function(*args)
@@ -0,0 +1,347 @@
+import logging
+
+from jql_filter import compile_jql, strip_order_by, UnsupportedJQL, Clause, BooleanExpression, NotExpression
+
+logger = logging.getLogger(__name__)
+
+# Count jobs a shared base must cover before they are answered from one fetch of the base
+# instead of one maxResults=0 request each
+DEFAULT_MIN_MERGE = 8
+
+# Operators and fields whose local evaluation can differ from Jira's: ~ is a word search in Jira
+# and compact issue records only keep the status name, not its category
+_REMOTE_OPERATORS = {'~', '!~'}
+_REMOTE_FIELDS = {'statusCategory'}
+
+
+def _conjuncts(predicate):
+    # Top-level AND terms of a compiled query, nested ANDs are flattened
+    if isinstance(predicate, BooleanExpression) and predicate.operator == 'and':
+        terms = []
+        for child in predicate.children:
+            terms.extend(_conjuncts(child))
+        return terms
+    if isinstance(predicate, (Clause, BooleanExpression, NotExpression)):
+        return [predicate]
+    return []
+
+
+def _term_key(term):
+    return term.canonical() if isinstance(term, Clause) else '({})'.format(term.canonical())
+
+
+def locally_exact(term):
+    if isinstance(term, Clause):
+        return term.operator not in _REMOTE_OPERATORS and term.jira_field not in _REMOTE_FIELDS
+    if isinstance(term, BooleanExpression):
+        return all(locally_exact(child) for child in term.children)
+    if isinstance(term, NotExpression):
+        return locally_exact(term.child)
+    return True
+
+
+def query_terms(jql_query):
+    """
+    Canonical top-level AND terms of a JQL query.
+
+    :param jql_query: JQL query string
+    :return: Frozenset of term keys, None when the query cannot be parsed locally
+    """
+    try:
+        return frozenset(_term_key(term) for term in _conjuncts(compile_jql(strip_order_by(jql_query))))
+    except UnsupportedJQL:
+        return None
+
+
+def within_scope(jql_query, scope_jql):
+    """
+    Check that every issue a JQL query matches is also matched by scope_jql.
+
+    Holds when the query's AND terms include every AND term of the scope. Queries narrowing the
+    scope some other way are not recognised, they are reported as outside of it.
+
+    :param jql_query: JQL query string
+    :param scope_jql: JQL query string of the scope
+    :return: True if the query is provably within the scope
+    """
+    query_keys = query_terms(jql_query)
+    scope_keys = query_terms(scope_jql)
+    return query_keys is not None and scope_keys is not None and scope_keys <= query_keys
+
+
+class _QueryGroup:
+
+    # Initialize the jobs sharing one normalised JQL
+    def __init__(self, jql_query):
+        self.jql = jql_query
+        self.terms = None
+        try:
+            self.terms = {_term_key(term): term for term in _conjuncts(compile_jql(strip_order_by(jql_query)))}
+        except UnsupportedJQL:
+            pass
+        self.search = False
+        self.fields = set()
+        self.jobs = []
+        self.source = None
+        self.residual = None
+
+    @property
+    def term_keys(self):
+        return frozenset(self.terms) if self.terms is not None else None
+
+    def residual_from(self, base_keys):
+        """
+        Terms of this group that a fetch of base_keys leaves to be checked locally.
+
+        :param base_keys: Term keys of a broader query
+        :return: List of terms, None when the group cannot be answered from that query
+        """
+        keys = self.term_keys
+        if keys is None or base_keys is None or not base_keys < keys:
+            return None
+        residual = [self.terms[key] for key in sorted(keys - base_keys)]
+        if not all(locally_exact(term) for term in residual):
+            return None
+        return residual
+
+
+def normalise_jql(jql_query):
+    """
+    Normalised form of a JQL query, identical for queries that only differ in clause order,
+    quoting, whitespace, field name case or ordering.
+
+    :param jql_query: JQL query string
+    :return: Canonical string, whitespace-collapsed query when it cannot be parsed locally
+    """
+    base = strip_order_by(jql_query)
+    try:
+        return compile_jql(base).canonical()
+    except UnsupportedJQL:
+        return ' '.join(base.split())
+
+
+class PlannedQuery:
+
+    # Initialize a query the plan sends to Jira, kind is 'search' or 'count'
+    def __init__(self, jql_query, kind, fields, job_keys):
+        self.jql = jql_query
+        self.kind = kind
+        self.fields = tuple(sorted(fields))
+        self.job_keys = job_keys
+
+
+class QueryPlan:
+
+    # Initialize plan, jobs maps each job to (query key, local predicate or None, job kind)
+    def __init__(self, queries, jobs, duplicates, derived):
+        self.queries = queries
+        self.jobs = jobs
+        self.duplicates = duplicates
+        self.derived = derived
+
+    def calls(self, search, count):
+        """
+        One call per planned query, for QueryExecutor.run_calls.
+
+        :param search: Callable (jql_query, fields) returning a list of issues
+        :param count: Callable (jql_query) returning an issue count
+        :return: Ordered mapping of query key to a (callable, *args) tuple
+        """
+        return {query_key: (search, query.jql, query.fields) if query.kind == 'search' else (count, query.jql)
+                for query_key, query in self.queries.items()}
+
+    def resolve(self, results):
+        """
+        Answer every job from the results of the planned queries.
+
+        :param results: Dictionary of query key to call result, a failed query may be None
+        :return: Dictionary of job key to a list of issues (search jobs) or a count (count jobs)
+        """
+        answers = {}
+        for job_key, (query_key, predicate, kind) in self.jobs.items():
+            result = results.get(query_key)
+            if result is None:
+                answers[job_key] = None
+                continue
+            if self.queries[query_key].kind == 'count':
+                answers[job_key] = result
+                continue
+            issues = result if predicate is None else [issue for issue in result if predicate(issue)]
+            answers[job_key] = issues if kind == 'search' else len(issues)
+        return answers
+
+    def summary(self):
+        return {
+            'jobs': len(self.jobs),
+            'queries': len(self.queries),
+            'searches': sum(1 for query in self.queries.values() if query.kind == 'search'),
+            'counts': sum(1 for query in self.queries.values() if query.kind == 'count'),
+            'duplicates': self.duplicates,
+            'derived': self.derived,
+        }
+
+    def describe(self):
+        summary = self.summary()
+        return ("Planned {queries} Jira queries ({searches} searches, {counts} counts) for {jobs} jobs: "
+                "{duplicates} duplicates collapsed, {derived} answered locally from a broader fetch").format(**summary)
+
+
+class QueryPlanner:
+    """
+    Collects the queries of a report run and plans the fewest Jira queries that answer them.
+
+    Jobs with the same normalised JQL share one query. A job whose AND terms include every term
+    of a fetched query is filtered locally from that query's issues. Count jobs registered with a
+    base JQL, such as one priority bucket of a sub-query, are answered from one fetch of the base
+    when at least min_merge of them share it.
+    """
+
+    # Initialize planner, merge=False only collapses duplicates
+    def __init__(self, merge=True, min_merge=DEFAULT_MIN_MERGE):
+        self.merge = merge
+        self.min_merge = min_merge
+        self._groups = {}
+        self._bases = {}
+        self._jobs = []
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a planner from the optional "query_planner" config section.
+
+        :param config: Dictionary with optional "merge" and "min_merge" keys, or None
+        :return: QueryPlanner instance
+        """
+        config = config or {}
+        return cls(merge=config.get('merge', True), min_merge=config.get('min_merge', DEFAULT_MIN_MERGE))
+
+    def _group(self, jql_query):
+        key = normalise_jql(jql_query)
+        if key not in self._groups:
+            self._groups[key] = _QueryGroup(jql_query)
+        return key, self._groups[key]
+
+    def add_search(self, job_key, jql_query, fields):
+        key, group = self._group(jql_query)
+        group.search = True
+        group.fields.update(fields)
+        group.jobs.append(job_key)
+        self._jobs.append((job_key, key, 'search'))
+
+    def add_count(self, job_key, jql_query, base=None):
+        """
+        Register a job that only needs the number of matching issues.
+
+        :param job_key: Result key of the job
+        :param jql_query: JQL query string
+        :param base: Broader JQL the query narrows, e.g. the sub-query a bucket clause was added to
+        """
+        key, group = self._group(jql_query)
+        group.jobs.append(job_key)
+        self._jobs.append((job_key, key, 'count'))
+        if base is not None:
+            self._bases.setdefault(normalise_jql(base), base)
+
+    def _derive(self, group, source_key, source, residual):
+        group.source = source_key
+        group.residual = residual
+        for term in residual:
+            source.fields.update(field for field in term.fields() if field != 'key')
+        source.fields.update(group.fields)
+
+    def _merge(self):
+        groups = self._groups
+        # Narrow queries first, so a query is only ever derived from a root
+        order = sorted(groups, key=lambda key: len(groups[key].terms) if groups[key].terms is not None else 0)
+        roots = []
+
+        def broadest_root(group):
+            best = None
+            for root_key in roots:
+                root = groups[root_key]
+                residual = group.residual_from(root.term_keys)
+                if residual is not None and (best is None or len(root.terms) > len(groups[best[0]].terms)):
+                    best = (root_key, residual)
+            return best
+
+        for key in order:
+            group = groups[key]
+            if not group.search:
+                continue
+            best = broadest_root(group)
+            if best is None:
+                roots.append(key)
+            else:
+                self._derive(group, best[0], groups[best[0]], best[1])
+
+        pending = [key for key in order if not groups[key].search]
+        for key in list(pending):
+            best = broadest_root(groups[key])
+            if best is not None:
+                self._derive(groups[key], best[0], groups[best[0]], best[1])
+                pending.remove(key)
+
+        # Greedily fetch the base covering the most remaining counts, narrower bases win ties
+        while pending:
+            best = None
+            for base_key, base_jql in self._bases.items():
+                base = groups.get(base_key) or _QueryGroup(base_jql)
+                base_keys = base.term_keys
+                if base_keys is None or base.source is not None:
+                    continue
+                covered = [key for key in pending
+                           if key == base_key or groups[key].residual_from(base_keys) is not None]
+                rank = (len(covered), len(base_keys))
+                if len(covered) >= self.min_merge and (best is None or rank > best[0]):
+                    best = (rank, base_key, base, covered)
+            if best is None:
+                break
+
+            _, base_key, base, covered = best
+            groups.setdefault(base_key, base)
+            base.search = True
+            if base_key in pending:
+                pending.remove(base_key)
+            for key in covered:
+                if key != base_key:
+                    self._derive(groups[key], base_key, base, groups[key].residual_from(base.term_keys))
+                    pending.remove(key)
+
+    def plan(self):
+        """
+        Plan the Jira queries for every registered job.
+
+        :return: QueryPlan
+        """
+        if self.merge:
+            self._merge()
+
+        groups = self._groups
+        queries = {}
+        for key, group in groups.items():
+            if group.source is None:
+                queries[key] = PlannedQuery(group.jql, 'search' if group.search else 'count', group.fields, [])
+
+        jobs = {}
+        derived = 0
+        for job_key, key, kind in self._jobs:
+            group = groups[key]
+            predicate = None
+            query_key = key
+            if group.source is not None:
+                query_key = group.source
+                predicate = _and(group.residual)
+                derived += 1
+            queries[query_key].job_keys.append(job_key)
+            jobs[job_key] = (query_key, predicate, kind)
+
+        plan = QueryPlan(queries, jobs, duplicates=sum(len(group.jobs) - 1 for group in groups.values() if group.jobs),
+                         derived=derived)
+        logger.info(plan.describe())
+        return plan
+
+
+def _and(terms):
+    if not terms:
+        return None
+    return terms[0] if len(terms) == 1 else BooleanExpression('and', terms)
@@ -0,0 +1,95 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from query_executor import QueryExecutor, DEFAULT_MAX_WORKERS
+from query_planner import normalise_jql
+
+logger = logging.getLogger(__name__)
+
+
+class QueryScheduler(QueryExecutor):
+    """
+    Query executor shared by every report of a batch run.
+
+    All reports dispatch their queries onto one bounded pool, so the number of queries in flight
+    is capped for the whole batch rather than per report. Search clients attached to the scheduler
+    do not send a query twice at once: a report asking for a JQL another report is fetching waits
+    for that result instead of querying Jira again. Issue lists are released as soon as their fetch
+    is done, so the batch never holds more than the searches in flight; a later request for the
+    same JQL is answered by the query cache when there is one. Counts are small and kept for the
+    whole batch.
+    """
+
+    # Initialize scheduler with the concurrency limit of the whole batch
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        super().__init__(max_workers=max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-jql")
+        self._lock = threading.Lock()
+        self._results = {}
+        self.sent = 0
+        self.deduplicated = 0
+
+    def run(self, fetch, jobs):
+        """
+        Dispatch every job onto the shared pool and gather the results in job order.
+
+        Jobs must not dispatch onto the scheduler themselves, a full pool would wait on itself.
+
+        :param fetch: Callable invoked once per job
+        :param jobs: Ordered mapping of result key to the argument tuple for fetch
+        :return: Dictionary of result key to fetch result, in the same order as jobs
+        """
+        jobs = dict(jobs)
+        futures = {key: self._pool.submit(fetch, *args) for key, args in jobs.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+    @staticmethod
+    def query_key(kind, api_url, jql_query, fields=()):
+        return kind, api_url, normalise_jql(jql_query), tuple(sorted(fields))
+
+    def shared(self, key, fetch, keep=False):
+        """
+        Run fetch once for concurrent callers of a key, they all get the same result.
+
+        A failed fetch is not kept, the next caller tries again.
+
+        :param key: Query key, see query_key
+        :param fetch: Callable returning the result
+        :param keep: Keep the result for later callers for the whole batch, for small results such as counts
+        :return: Tuple of (result, whether this caller ran fetch)
+        """
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._results[key] = future
+                self.sent += 1
+            else:
+                self.deduplicated += 1
+
+        if owner:
+            try:
+                result = fetch()
+            except BaseException as e:
+                with self._lock:
+                    self._results.pop(key, None)
+                future.set_exception(e)
+                raise
+            # Callers already waiting hold the future, later ones fetch again
+            if not keep:
+                with self._lock:
+                    self._results.pop(key, None)
+            future.set_result(result)
+            return result, owner
+        return future.result(), owner
+
+    def summary(self):
+        with self._lock:
+            return {"queries": self.sent, "deduplicated": self.deduplicated}
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            self._results.clear()
@@ -0,0 +1,334 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = "jira_metrics"
+
+
+class QueryRecord:
+
+    # Initialize the measurements of one search or count query
+    def __init__(self, jql_query, kind, fields, labels):
+        self.jql = jql_query
+        self.kind = kind
+        self.fields = list(fields)
+        self.labels = labels
+        self.source = "jira"
+        self.cache = "off"
+        self.started = time.time()
+        self._started = time.perf_counter()
+        self.latency = 0.0
+        self.request_time = 0.0
+        self.parse_time = 0.0
+        self.aggregation_time = 0.0
+        self.pages = 0
+        self.issues = 0
+        self.total = None
+        self.bytes = 0
+        self.retries = 0
+        self.error = None
+        # Changelog syncs fetch the pages of one query on several workers
+        self._lock = threading.Lock()
+
+    def add_page(self, request_time, parse_time, size, retries, total):
+        with self._lock:
+            self.pages += 1
+            self.request_time += request_time
+            self.parse_time += parse_time
+            self.bytes += size
+            self.retries += retries
+            self.total = total
+
+    def finish(self):
+        self.latency = time.perf_counter() - self._started
+
+    def to_dict(self):
+        return {
+            "jql": self.jql,
+            "kind": self.kind,
+            "fields": self.fields,
+            "labels": self.labels,
+            "source": self.source,
+            "cache": self.cache,
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "latency": round(self.latency, 6),
+            "request_time": round(self.request_time, 6),
+            "parse_time": round(self.parse_time, 6),
+            "aggregation_time": round(self.aggregation_time, 6),
+            "pages": self.pages,
+            "issues": self.issues,
+            "total": self.total,
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "error": self.error,
+        }
+
+
+class QueryTracer:
+
+    # Initialize run trace, labels such as the report name are attached to the whole run
+    def __init__(self, report=None, **labels):
+        self.report = report
+        self.labels = labels
+        self.started = time.time()
+        self._started = time.perf_counter()
+        self.finished = None
+        self.duration = None
+        self.records = []
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def current_labels(self):
+        return dict(getattr(self._local, "labels", {}))
+
+    @contextmanager
+    def context(self, **labels):
+        """
+        Attach labels such as month or section to every query issued by this thread inside the block.
+        """
+        previous = getattr(self._local, "labels", {})
+        self._local.labels = dict(previous, **labels)
+        try:
+            yield
+        finally:
+            self._local.labels = previous
+
+    def bind(self, function, **labels):
+        """
+        Wrap a function so that it runs with the current labels plus the given ones, on any thread.
+
+        :param function: Callable dispatched to a worker thread
+        :return: Wrapped callable
+        """
+        bound_labels = dict(self.current_labels(), **labels)
+
+        def labelled(*args, **kwargs):
+            with self.context(**bound_labels):
+                return function(*args, **kwargs)
+        return labelled
+
+    def start_query(self, jql_query, kind, fields=()):
+        return QueryRecord(jql_query, kind, fields, self.current_labels())
+
+    def finish_query(self, record):
+        record.finish()
+        with self._lock:
+            self.records.append(record)
+        logger.info("%s %.3fs pages=%d issues=%d bytes=%d retries=%d cache=%s source=%s labels=%s jql=%s",
+                    record.kind, record.latency, record.pages, record.issues, record.bytes, record.retries,
+                    record.cache, record.source, record.labels, record.jql)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Time a report stage, e.g. building or saving a month, outside of any single query.
+        """
+        labels = dict(self.current_labels(), **labels)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.spans.append({"name": name, "labels": labels, "duration": round(time.perf_counter() - started, 6)})
+
+    def finish(self):
+        self.finished = time.time()
+        self.duration = time.perf_counter() - self._started
+
+    def summary(self):
+        """
+        Aggregate the query records of the run.
+
+        :return: Dictionary of run totals and per-label breakdowns
+        """
+        with self._lock:
+            records = list(self.records)
+            spans = list(self.spans)
+
+        def totals(group):
+            return {
+                "queries": len(group),
+                "latency": round(sum(record.latency for record in group), 6),
+                "request_time": round(sum(record.request_time for record in group), 6),
+                "parse_time": round(sum(record.parse_time for record in group), 6),
+                "aggregation_time": round(sum(record.aggregation_time for record in group), 6),
+                "pages": sum(record.pages for record in group),
+                "issues": sum(record.issues for record in group),
+                "bytes": sum(record.bytes for record in group),
+                "retries": sum(record.retries for record in group),
+                "cache_hits": sum(1 for record in group if record.cache == "hit"),
+                "cache_misses": sum(1 for record in group if record.cache == "miss"),
+                "mirror": sum(1 for record in group if record.source == "mirror"),
+                "batch": sum(1 for record in group if record.source == "batch"),
+                "errors": sum(1 for record in group if record.error),
+            }
+
+        by_label = {}
+        for label in ("config", "month", "section"):
+            groups = defaultdict(list)
+            for record in records:
+                if label in record.labels:
+                    groups[record.labels[label]].append(record)
+            if groups:
+                by_label[label] = {value: totals(group) for value, group in sorted(groups.items())}
+
+        span_totals = defaultdict(float)
+        for span in spans:
+            span_totals[span["name"]] += span["duration"]
+
+        # The slowest queries are usually what a slow run needs to be explained by
+        slowest = sorted(records, key=lambda record: record.latency, reverse=True)[:10]
+        return {
+            "totals": totals(records),
+            "by": by_label,
+            "spans": {name: round(duration, 6) for name, duration in span_totals.items()},
+            "slowest": [{"jql": record.jql, "labels": record.labels, "latency": round(record.latency, 6)} for record in slowest],
+        }
+
+    def to_dict(self):
+        if self.finished is None:
+            self.finish()
+        with self._lock:
+            records = [record.to_dict() for record in self.records]
+            spans = list(self.spans)
+        return {
+            "report": self.report,
+            "labels": self.labels,
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "finished": datetime.fromtimestamp(self.finished, timezone.utc).isoformat(),
+            "duration": round(self.duration, 6),
+            "summary": self.summary(),
+            "queries": records,
+            "spans": spans,
+        }
+
+    def write_json(self, path):
+        """
+        Write the run trace as JSON.
+
+        :param path: Output file
+        """
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2))
+        logger.info("Run trace written to %s", path)
+
+    def write_prometheus(self, path):
+        """
+        Write run metrics in the Prometheus text format, for the node exporter textfile collector.
+
+        Labels are kept to report, kind, cache and stage so the series count stays small.
+
+        :param path: Output file, should end in .prom
+        """
+        if self.finished is None:
+            self.finish()
+        report = _escape_label(self.report or "")
+        with self._lock:
+            records = list(self.records)
+            spans = list(self.spans)
+
+        groups = defaultdict(list)
+        for record in records:
+            groups[(record.kind, record.cache)].append(record)
+
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append("# HELP {}_{} {}".format(PROMETHEUS_PREFIX, name, help_text))
+            lines.append("# TYPE {}_{} {}".format(PROMETHEUS_PREFIX, name, metric_type))
+            for labels, value in samples:
+                label_text = ",".join('{}="{}"'.format(key, _escape_label(value)) for key, value in labels)
+                lines.append("{}_{}{{{}}} {}".format(PROMETHEUS_PREFIX, name, label_text, value))
+
+        def per_group(value):
+            return [((("report", report), ("kind", kind), ("cache", cache)), value(group))
+                    for (kind, cache), group in sorted(groups.items())]
+
+        metric("run_duration_seconds", "gauge", "Wall time of the last run.",
+               [((("report", report),), round(self.duration, 6))])
+        metric("run_timestamp_seconds", "gauge", "Unix time the last run finished.",
+               [((("report", report),), round(self.finished, 3))])
+        metric("queries", "gauge", "Queries sent in the last run.", per_group(len))
+        metric("query_latency_seconds", "gauge", "Summed query latency in the last run.",
+               per_group(lambda group: round(sum(record.latency for record in group), 6)))
+        metric("query_max_latency_seconds", "gauge", "Slowest query latency in the last run.",
+               per_group(lambda group: round(max(record.latency for record in group), 6)))
+        metric("pages", "gauge", "Search pages fetched in the last run.", per_group(lambda group: sum(record.pages for record in group)))
+        metric("issues", "gauge", "Issues returned in the last run.", per_group(lambda group: sum(record.issues for record in group)))
+        metric("bytes", "gauge", "Response bytes received in the last run.", per_group(lambda group: sum(record.bytes for record in group)))
+        metric("retries", "gauge", "Request retries in the last run.", per_group(lambda group: sum(record.retries for record in group)))
+        metric("query_errors", "gauge", "Failed queries in the last run.",
+               per_group(lambda group: sum(1 for record in group if record.error)))
+
+        span_totals = defaultdict(float)
+        for span in spans:
+            span_totals[span["name"]] += span["duration"]
+        if span_totals:
+            metric("stage_duration_seconds", "gauge", "Summed duration of each report stage in the last run.",
+                   [((("report", report), ("stage", name)), round(duration, 6)) for name, duration in sorted(span_totals.items())])
+
+        _write_atomic(path, "\n".join(lines) + "\n")
+        logger.info("Prometheus metrics written to %s", path)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _write_atomic(path, text):
+    # The textfile collector may read at any time, never expose a partial file
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as output_file:
+        output_file.write(text)
+    os.replace(temp_path, path)
+
+
+_default_tracer = QueryTracer()
+_default_tracer_lock = threading.Lock()
+
+
+def get_default_tracer():
+    """
+    Return the process-wide tracer the search clients record into.
+
+    :return: QueryTracer instance
+    """
+    with _default_tracer_lock:
+        return _default_tracer
+
+
+def configure_default_tracer(report=None, **labels):
+    """
+    Start a new process-wide trace, e.g. at the beginning of a report run.
+
+    :return: The new QueryTracer instance
+    """
+    global _default_tracer
+    with _default_tracer_lock:
+        _default_tracer = QueryTracer(report, **labels)
+        return _default_tracer
+
+
+def export_trace(tracer, json_path=None, prometheus_path=None):
+    """
+    Finish a run trace and write it to the requested outputs.
+
+    :param tracer: QueryTracer of the run
+    :param json_path: Optional JSON trace file
+    :param prometheus_path: Optional Prometheus textfile
+    """
+    tracer.finish()
+    if json_path:
+        tracer.write_json(json_path)
+    if prometheus_path:
+        tracer.write_prometheus(prometheus_path)
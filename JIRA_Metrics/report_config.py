@@ -0,0 +1,183 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Directories holding the per-section config files
+QMR_CONFIG_DIRECTORY = "/path/Report_Script/QMR_json/"
+DEFECT_AGE_CONFIG_DIRECTORY = "/path/Report_Script/defect_age_json/"
+
+# Section name -> config file name in either directory
+CONFIG_SECTIONS = {
+    "Option1": "Option1.json",
+    "Option2": "Option2.json",
+}
+
+# Sub-queries every QMR config defines for both sections
+QMR_SECTIONS = ("Regression", "Exploratory")
+QMR_SUB_QUERIES = ["BugsRaised", "Resolved", "Fixed", "GerritFix", "Noise", "Resolution"]
+
+# Metric keys every defect age config defines
+DEFECT_AGE_QUERY_KEYS = [
+    "regression_resolved_queries",
+    "regression_unresolved_queries",
+    "exploratory_resolved_queries",
+    "exploratory_unresolved_queries",
+]
+
+# Defect age config sections that are settings rather than JQL
+DEFECT_AGE_SETTING_KEYS = ("issue_mirror", "priority_buckets", "time_in_status", "query_planner", "metrics_cube",
+                           "age_aggregates")
+
+
+class ConfigError(ValueError):
+    """Raised when a report config file is missing or malformed."""
+
+
+def load_json_config(json_file_path):
+    try:
+        with open(json_file_path, 'r') as json_file:
+            return json.load(json_file)
+    except FileNotFoundError as e:
+        raise ConfigError("JSON file not found: {}".format(e))
+    except ValueError as e:
+        raise ConfigError("JSON file {} is not valid JSON: {}".format(json_file_path, e))
+
+
+def resolve_config_path(directory, section):
+    """
+    Path of the config file for a section.
+
+    :param directory: Config directory, QMR_CONFIG_DIRECTORY or DEFECT_AGE_CONFIG_DIRECTORY
+    :param section: Section name, one of CONFIG_SECTIONS
+    :return: Config file path
+    """
+    if section not in CONFIG_SECTIONS:
+        raise ConfigError("Invalid section '{}', choose from {}".format(section, ", ".join(CONFIG_SECTIONS)))
+    return os.path.join(directory, CONFIG_SECTIONS[section])
+
+
+def require_prompt_free_args(parser, args):
+    """
+    Fail with a usage error for the arguments a script would prompt for when stdin is not a terminal.
+
+    Scheduled and piped runs cannot answer a prompt, input() would block or fail on end of file.
+
+    :param parser: ArgumentParser of the script
+    :param args: Parsed arguments with config, section, start_date and end_date
+    """
+    if sys.stdin is not None and sys.stdin.isatty():
+        return
+    missing = []
+    if args.config is None and args.section not in CONFIG_SECTIONS:
+        missing.append("--config or --section ({})".format(", ".join(CONFIG_SECTIONS)))
+    missing += [option for option, value in (("--start-date", args.start_date), ("--end-date", args.end_date)) if not value]
+    if missing:
+        parser.error("{} required when stdin is not a terminal".format(", ".join(missing)))
+
+
+def render_jql(jql_template, start_date, end_date):
+    return jql_template.replace("{{start_date}}", start_date).replace("{{end_date}}", end_date)
+
+
+def validate_date(value):
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ConfigError("Invalid date '{}', expected YYYY-MM-DD".format(value))
+    return value
+
+
+def iter_months(start_date, end_date):
+    """
+    Calendar months covered by a date range.
+
+    :param start_date: Start date, YYYY-MM-DD
+    :param end_date: End date, YYYY-MM-DD
+    :return: Iterator of (month start, month end, report filename) tuples
+    """
+    start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
+    end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
+
+    while start_datetime <= end_datetime:
+        current_month_start = start_datetime.strftime("%Y-%m-01")
+        current_month_end = (start_datetime + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        current_month_end = current_month_end.strftime("%Y-%m-%d")
+
+        month_name = start_datetime.strftime("%B")
+        report_filename = f"report_{month_name}_{start_datetime.year}.xlsx"
+
+        yield current_month_start, current_month_end, report_filename
+        start_datetime = (start_datetime + timedelta(days=32)).replace(day=1)
+
+
+def validate_qmr_config(data):
+    """
+    Check a QMR config for the credentials and JQL every report needs.
+
+    :param data: Parsed QMR config
+    :return: List of error messages, empty when the config is valid
+    """
+    errors = []
+    api_credentials = data.get("api_credentials")
+    if not isinstance(api_credentials, dict):
+        errors.append("API credentials not found in JSON data.")
+    elif not all(api_credentials.get(key) for key in ("api_username", "api_password", "api_url")):
+        errors.append("API credentials incomplete in JSON data.")
+
+    for section in QMR_SECTIONS:
+        section_queries = data.get(section)
+        if not isinstance(section_queries, dict):
+            errors.append("Section '{}' not found in JSON data.".format(section))
+            continue
+        for sub_query in QMR_SUB_QUERIES:
+            if not isinstance(section_queries.get(sub_query), str):
+                errors.append("JQL query for '{}' not found in section '{}'.".format(sub_query, section))
+    return errors
+
+
+def validate_defect_age_config(queries):
+    """
+    Check a defect age config for the JQL of every metric.
+
+    :param queries: Parsed defect age config
+    :return: List of error messages, empty when the config is valid
+    """
+    errors = []
+    for key in DEFECT_AGE_QUERY_KEYS:
+        value = queries.get(key)
+        if isinstance(value, str):
+            continue
+        if not isinstance(value, list) or not value or not all(isinstance(query, str) for query in value):
+            errors.append("'{}' must be a JQL string or a list of per-priority JQL strings.".format(key))
+    return errors
+
+
+def split_defect_age_config(queries):
+    """
+    Separate the settings sections of a defect age config from its JQL.
+
+    :param queries: Parsed defect age config
+    :return: Tuple of (JQL dictionary, settings dictionary)
+    """
+    queries = dict(queries)
+    settings = {key: queries.pop(key) for key in DEFECT_AGE_SETTING_KEYS if key in queries}
+    return queries, settings
+
+
+def render_defect_age_queries(queries, start_date, end_date):
+    """
+    Template the defect age JQL with a date range.
+
+    A metric is either a list of per-priority JQLs or a single JQL covering every priority.
+
+    :param queries: Defect age JQL dictionary
+    :return: New dictionary with every JQL templated
+    """
+    rendered = {}
+    for key, value in queries.items():
+        if isinstance(value, str):
+            rendered[key] = render_jql(value, start_date, end_date)
+        else:
+            rendered[key] = [render_jql(query, start_date, end_date) for query in value]
+    return rendered
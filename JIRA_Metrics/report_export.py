@@ -0,0 +1,173 @@
+import logging
+import re
+
+try:
+    import xlsxwriter
+except ImportError:
+    # Only needed for the single-workbook export, the per-month workbooks are written by pandas
+    xlsxwriter = None
+
+logger = logging.getLogger(__name__)
+
+# Fields and columns of a drill-down row, one row per issue
+DRILL_DOWN_FIELDS = ("summary", "priority", "status", "created", "resolutiondate")
+DRILL_DOWN_COLUMNS = ("Month", "Sub-query", "Key", "Summary", "Priority", "Status", "Created", "Resolved")
+DRILL_DOWN_WIDTHS = (9, 16, 14, 80, 12, 14, 20, 20)
+
+# Rows of a worksheet, a drill-down sheet continues on a new sheet named "<name> (2)" and so on
+MAX_SHEET_ROWS = 1048576
+MAX_SHEET_NAME = 31
+_INVALID_SHEET_CHARACTERS = re.compile(r"[\[\]:*?/\\]")
+
+# Report rows holding percentages, written with a percent number format
+PERCENTAGE_FORMAT = '0.00"%"'
+COUNT_FORMAT = '0'
+AGE_FORMAT = '0.00'
+
+
+def sheet_name(name):
+    """
+    Worksheet name Excel accepts: at most 31 characters and none of []:*?/\\
+    """
+    return _INVALID_SHEET_CHARACTERS.sub("-", str(name))[:MAX_SHEET_NAME]
+
+
+def browse_url(api_url):
+    """
+    Base issue URL of a Jira instance, e.g. https://jira.example.com/browse/ for its search endpoint.
+    """
+    return api_url.split("/rest/", 1)[0].rstrip("/") + "/browse/"
+
+
+def _formula_text(text):
+    return str(text).replace('"', '""')
+
+
+def _cell_value(value):
+    # Compact issue values are scalars, reduced dictionaries or lists of those
+    if isinstance(value, list):
+        return ", ".join(str(_cell_value(item)) for item in value if item is not None)
+    if isinstance(value, dict):
+        return next((value[name] for name in ('name', 'value', 'key') if value.get(name) is not None), None)
+    return value
+
+
+class WorkbookExporter:
+    """
+    Single-workbook export of report frames and issue drill-downs.
+
+    Rows are written with xlsxwriter in constant memory mode: each row is flushed to disk once
+    the next row of its sheet is started, so a sheet never has to be built in memory. Rows of a
+    sheet must therefore be written top to bottom, sheets themselves may be written interleaved.
+    """
+
+    # Initialize workbook at path, issue keys link to issue_url + key
+    def __init__(self, path, issue_url):
+        if xlsxwriter is None:
+            raise ImportError("xlsxwriter is required to export a workbook, install it with pip install xlsxwriter")
+        self.path = path
+        self.issue_url = issue_url
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_urls': False,
+                                                   'strings_to_numbers': False, 'strings_to_formulas': False})
+        self.header_format = self.workbook.add_format({'bold': True, 'bottom': 1})
+        self.label_format = self.workbook.add_format({'bold': True})
+        self.link_format = self.workbook.add_format({'font_color': 'blue', 'underline': 1})
+        self.number_formats = {number_format: self.workbook.add_format({'num_format': number_format})
+                               for number_format in (PERCENTAGE_FORMAT, COUNT_FORMAT, AGE_FORMAT)}
+        self._names = set()
+        self._drill_downs = {}
+        self.rows = 0
+
+    def add_worksheet(self, name):
+        # Sheet names are unique case-insensitively, a clash gets a numbered suffix
+        base = sheet_name(name)
+        candidate, number = base, 2
+        while candidate.lower() in self._names:
+            suffix = " ({})".format(number)
+            candidate = base[:MAX_SHEET_NAME - len(suffix)] + suffix
+            number += 1
+        self._names.add(candidate.lower())
+        return self.workbook.add_worksheet(candidate)
+
+    def write_frame(self, name, frame, number_format_for=None):
+        """
+        Write a report frame to its own sheet, column levels as header rows and index levels as label columns.
+
+        :param name: Sheet name
+        :param frame: Numeric report frame
+        :param number_format_for: Callable taking the row label and returning an Excel number format
+        """
+        worksheet = self.add_worksheet(name)
+        index_levels = frame.index.nlevels
+        column_levels = frame.columns.nlevels
+        worksheet.set_column(0, index_levels - 1, 18)
+        worksheet.set_column(index_levels, index_levels + len(frame.columns) - 1, 12)
+
+        row = 0
+        for level in range(column_levels):
+            labels = frame.columns.get_level_values(level)
+            for position, label in enumerate(labels):
+                worksheet.write_string(row, index_levels + position, str(label), self.header_format)
+            row += 1
+
+        for label, values in zip(frame.index, frame.to_numpy()):
+            labels = label if isinstance(label, tuple) else (label,)
+            for position, value in enumerate(labels):
+                worksheet.write_string(row, position, str(value), self.label_format)
+            cell_format = self.number_formats.get(number_format_for(labels[-1]) if number_format_for else AGE_FORMAT)
+            for position, value in enumerate(values):
+                if value == value:
+                    worksheet.write_number(row, index_levels + position, float(value), cell_format)
+            row += 1
+        worksheet.freeze_panes(column_levels, index_levels)
+        self.rows += row
+        return worksheet
+
+    def _drill_down_sheet(self, name):
+        # Current sheet of a drill-down and its next row, a full sheet continues on a new one
+        sheet = self._drill_downs.get(name)
+        if sheet is None or sheet[1] >= MAX_SHEET_ROWS:
+            worksheet = self.add_worksheet(name if sheet is None else "{} ({})".format(name, sheet[2] + 1))
+            for column, (title, width) in enumerate(zip(DRILL_DOWN_COLUMNS, DRILL_DOWN_WIDTHS)):
+                worksheet.set_column(column, column, width)
+                worksheet.write_string(0, column, title, self.header_format)
+            worksheet.freeze_panes(1, 0)
+            sheet = [worksheet, 1, 1 if sheet is None else sheet[2] + 1]
+            self._drill_downs[name] = sheet
+        return sheet
+
+    def write_issue(self, name, month, sub_query, issue):
+        """
+        Append one issue to a drill-down sheet, its key links to the issue in Jira.
+
+        :param name: Drill-down name, e.g. "Regression Blocker"
+        :param month: Month label (YYYY-MM)
+        :param sub_query: Report row the issue is counted in
+        :param issue: Issue holding DRILL_DOWN_FIELDS
+        """
+        sheet = self._drill_down_sheet(name)
+        worksheet, row = sheet[0], sheet[1]
+        fields = issue['fields']
+        key = issue['key']
+        worksheet.write_string(row, 0, month or "")
+        worksheet.write_string(row, 1, sub_query)
+        # A HYPERLINK formula is written with its row, cell hyperlinks would be kept in memory until
+        # the sheet is closed and are capped at 65,530 per sheet
+        worksheet.write_formula(row, 2, '=HYPERLINK("{}","{}")'.format(_formula_text(self.issue_url + key), _formula_text(key)),
+                                self.link_format, key)
+        for column, field in enumerate(DRILL_DOWN_FIELDS, start=3):
+            value = _cell_value(fields.get(field))
+            if value is not None:
+                worksheet.write_string(row, column, str(value))
+        sheet[1] = row + 1
+        self.rows += 1
+
+    def close(self):
+        self.workbook.close()
+        logger.info("Exported %d rows to %s", self.rows, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
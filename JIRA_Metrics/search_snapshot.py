@@ -0,0 +1,242 @@
+import io
+import json
+import logging
+import mmap
+import os
+import threading
+import zlib
+from datetime import datetime
+
+import requests
+
+from jira_transport import JiraTransport, configure_default_transport, get_default_transport, set_default_transport
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+# Response bodies, each zlib-compressed on its own and located by the manifest's offsets
+PAGES_FILE = "pages.bin"
+
+
+class SnapshotMiss(requests.exceptions.RequestException):
+    """Raised when a replayed request was not captured in the snapshot."""
+
+
+def request_key(method, url, params=None):
+    return json.dumps([method.upper(), url, sorted((str(name), str(value)) for name, value in (params or {}).items())])
+
+
+class SnapshotResponse:
+    """
+    Response rebuilt from a captured body, with the attributes the search client reads.
+    """
+
+    # Initialize response from the decompressed body, raw serves streamed reads
+    def __init__(self, url, status_code, content, retries=0):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.retries = retries
+        self.headers = {}
+        self.raw = io.BytesIO(content)
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError("{} response for {}".format(self.status_code, self.url), response=self)
+
+    def close(self):
+        self.raw.close()
+
+
+class SnapshotWriter:
+    """
+    Capture side of a snapshot directory, bodies are appended as they arrive and the manifest is written on close.
+    """
+
+    # Initialize capture into directory path, labels (e.g. command, config, dates) are kept in the manifest
+    def __init__(self, path, **labels):
+        self.path = path
+        self.labels = labels
+        os.makedirs(path, exist_ok=True)
+        self._pages = open(os.path.join(path, PAGES_FILE), 'wb')
+        self._entries = {}
+        self._offset = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def add(self, method, url, params, status_code, content):
+        key = request_key(method, url, params)
+        compressed = zlib.compress(content)
+        with self._lock:
+            # A request repeated within the run returns the same body, the first capture is kept
+            if key in self._entries:
+                return
+            self._pages.write(compressed)
+            self._entries[key] = {
+                'method': method.upper(),
+                'url': url,
+                'params': dict(params or {}),
+                'status': status_code,
+                'offset': self._offset,
+                'length': len(compressed),
+                'size': len(content),
+            }
+            self._offset += len(compressed)
+            self._size += len(content)
+
+    def close(self):
+        with self._lock:
+            self._pages.close()
+            manifest = {
+                'version': SNAPSHOT_VERSION,
+                'captured_at': datetime.now().isoformat(timespec='seconds'),
+                'labels': self.labels,
+                'requests': len(self._entries),
+                'bytes': self._size,
+                'compressed_bytes': self._offset,
+                'entries': list(self._entries.values()),
+            }
+            with open(os.path.join(self.path, MANIFEST_FILE), 'w') as manifest_file:
+                json.dump(manifest, manifest_file, indent=1)
+        logger.info("Captured %d requests (%d bytes, %d compressed) to %s", len(self._entries), self._size, self._offset, self.path)
+
+
+class SearchSnapshot:
+    """
+    Replay side of a snapshot directory, the bodies file is memory-mapped and a body is only
+    decompressed when its request is replayed.
+    """
+
+    # Initialize snapshot from the directory a SnapshotWriter captured into
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            raise FileNotFoundError("{} is not a snapshot, {} is missing".format(path, MANIFEST_FILE))
+        if self.manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError("Snapshot {} has version {}, expected {}".format(path, self.manifest.get('version'), SNAPSHOT_VERSION))
+        self._entries = {request_key(entry['method'], entry['url'], entry['params']): entry for entry in self.manifest['entries']}
+
+        self._pages = open(os.path.join(path, PAGES_FILE), 'rb')
+        # An empty file cannot be mapped, a snapshot without requests has nothing to read anyway
+        self._map = mmap.mmap(self._pages.fileno(), 0, access=mmap.ACCESS_READ) if self.manifest['compressed_bytes'] else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def labels(self):
+        return self.manifest.get('labels', {})
+
+    def get(self, method, url, params=None):
+        """
+        Captured response of a request.
+
+        :return: SnapshotResponse, None when the request was not captured
+        """
+        entry = self._entries.get(request_key(method, url, params))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        content = zlib.decompress(self._map[entry['offset']:entry['offset'] + entry['length']])
+        return SnapshotResponse(url, entry['status'], content)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._pages.close()
+        if self.misses:
+            logger.warning("%d requests were not in snapshot %s, their queries failed", self.misses, self.path)
+        logger.info("Replayed %d requests from %s", self.hits, self.path)
+
+
+class CaptureTransport:
+    """
+    Transport recording the body of every GET sent through it into a SnapshotWriter.
+
+    Other methods, e.g. the token request, are sent but not recorded.
+    """
+
+    # Initialize capture around the transport actually sending the requests
+    def __init__(self, transport, writer):
+        self.transport = transport
+        self.writer = writer
+
+    def request(self, method, url, **kwargs):
+        if method.upper() != "GET":
+            return self.transport.request(method, url, **kwargs)
+        # The body is read in full to be recorded, streaming readers get it from memory
+        kwargs.pop("stream", None)
+        response = self.transport.request(method, url, **kwargs)
+        content = response.content
+        self.writer.add(method, url, kwargs.get("params"), response.status_code, content)
+        return SnapshotResponse(url, response.status_code, content, retries=getattr(response, 'retries', 0))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.transport.close()
+        self.writer.close()
+
+
+class ReplayTransport:
+    """
+    Transport answering every request from a SearchSnapshot, nothing is sent to the network.
+    """
+
+    # Initialize replay of a snapshot
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def request(self, method, url, **kwargs):
+        response = self.snapshot.get(method, url, kwargs.get("params"))
+        if response is None:
+            raise SnapshotMiss("{} {} {} is not in snapshot {}".format(method, url, kwargs.get("params"), self.snapshot.path))
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.snapshot.close()
+
+
+def configure_snapshot_transport(capture_path=None, replay_path=None, labels=None, **transport_kwargs):
+    """
+    Replace the process-wide transport for a run, capturing into or replaying from a snapshot directory.
+
+    :param capture_path: Snapshot directory every Jira response of the run is recorded into
+    :param replay_path: Snapshot directory every Jira request of the run is answered from
+    :param labels: Run labels kept in the manifest of a capture
+    :param transport_kwargs: JiraTransport options, unused when replaying
+    :return: The new process-wide transport
+    """
+    if replay_path:
+        snapshot = SearchSnapshot(replay_path)
+        logger.info("Replaying %d requests captured %s with %s", snapshot.manifest['requests'], snapshot.manifest['captured_at'],
+                    snapshot.labels)
+        return set_default_transport(ReplayTransport(snapshot))
+    if capture_path:
+        return set_default_transport(CaptureTransport(JiraTransport(**transport_kwargs), SnapshotWriter(capture_path, **(labels or {}))))
+    return configure_default_transport(**transport_kwargs)
+
+
+def release_snapshot_transport():
+    # Finish the capture or replay of a run, writing the manifest of a capture
+    if isinstance(get_default_transport(), (CaptureTransport, ReplayTransport)):
+        set_default_transport(None)
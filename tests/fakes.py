@@ -0,0 +1,74 @@
+import json
+
+from jql_filter import compile_jql, strip_order_by
+
+
+class FakeSearchClient:
+    """
+    Stand-in for JiraSearchClient.iter_pages, evaluating JQL locally against in-memory issues.
+    """
+
+    # Initialize client over issues, keyed by issue key so tests can update or remove them
+    def __init__(self, issues, page_size=2):
+        self.issues = {item['key']: item for item in issues}
+        self.page_size = page_size
+        self.queries = []
+
+    @staticmethod
+    def project(item, fields, expand=None):
+        issue = {'key': item['key'], 'fields': {field: item['fields'].get(field) for field in fields or ()
+                                                if field in item['fields']}}
+        if expand == 'changelog' and 'changelog' in item:
+            issue['changelog'] = item['changelog']
+        return issue
+
+    def iter_pages(self, jql_query, fields=None, record=None, compact=False, start_at=0, expand=None):
+        self.queries.append(jql_query)
+        predicate = compile_jql(strip_order_by(jql_query))
+        matched = sorted((item for item in self.issues.values() if predicate(item)), key=lambda item: item['key'])
+        for offset in range(start_at, max(len(matched), start_at + 1), self.page_size):
+            page = matched[offset:offset + self.page_size]
+            yield {'startAt': offset, 'total': len(matched), 'issues': [self.project(item, fields, expand) for item in page]}
+
+    def fetch_page(self, jql_query, start_at, fields, max_results=None, record=None, compact=False, expand=None):
+        return next(self.iter_pages(jql_query, fields=fields, start_at=start_at, expand=expand))
+
+    def fetch_issue(self, key, fields, expand=None, record=None):
+        return self.project(self.issues[key], fields, expand)
+
+
+class FakeJiraTransport:
+    """
+    Stand-in for JiraTransport answering search requests from in-memory issues, like MockJiraServer without HTTP.
+    """
+
+    # Initialize transport over issues, before_page may change the issues before a page is served
+    def __init__(self, issues, before_page=None):
+        self.issues = {item['key']: item for item in issues}
+        self.before_page = before_page
+        self.requests = []
+
+    def get(self, url, headers=None, params=None, stream=False):
+        # search_snapshot needs requests, the other fakes do not
+        from search_snapshot import SnapshotResponse
+
+        self.requests.append(dict(params))
+        if self.before_page is not None:
+            self.before_page(self, params)
+        client = FakeSearchClient(self.issues.values(), page_size=max(params['maxResults'], 1))
+        page = client.fetch_page(params['jql'], params['startAt'], params['fields'].split(','))
+        if params['maxResults'] == 0:
+            page['issues'] = []
+        return SnapshotResponse(url, 200, json.dumps(page).encode('utf-8'))
+
+    def request(self, method, url, **kwargs):
+        return self.get(url, **kwargs)
+
+    def close(self):
+        pass
+
+    def count_requests(self):
+        return [params for params in self.requests if params['maxResults'] == 0]
+
+    def search_requests(self):
+        return [params for params in self.requests if params['maxResults'] > 0]
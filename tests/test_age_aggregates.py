@@ -0,0 +1,204 @@
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from age_aggregates import AgeAggregateStore, undated_template
+from changelog_store import parse_timestamp
+from jql_filter import UnsupportedJQL
+from priority_classifier import PriorityClassifier
+from tests.fakes import FakeSearchClient
+
+RESOLVED = 'project = A AND resolutiondate >= "{{start_date}}" AND resolutiondate <= "{{end_date}}"'
+UNRESOLVED = 'project = A AND resolution = Unresolved AND created >= "{{start_date}}" AND created <= "{{end_date}}"'
+CELLS = {('Resolved-Defect', 'Regression'): (RESOLVED, None), ('Unresolved-Defect', 'Regression'): (UNRESOLVED, None)}
+AS_OF = parse_timestamp("2024-03-01T00:00:00.000+0000")
+
+
+def issue(key, priority, created, resolved=None, updated="2024-02-20T00:00:00.000+0000"):
+    return {'key': key, 'fields': {
+        'project': {'key': 'A'},
+        'priority': {'name': priority},
+        'resolution': {'name': 'Fixed'} if resolved else None,
+        'created': created,
+        'resolutiondate': resolved,
+        'updated': updated,
+    }}
+
+
+@pytest.fixture
+def issues():
+    return [
+        issue("A-1", "Blocker", "2024-01-01T00:00:00.000+0000", "2024-01-11T00:00:00.000+0000"),
+        issue("A-2", "Blocker", "2024-01-01T00:00:00.000+0000", "2024-01-21T00:00:00.000+0000"),
+        issue("A-3", "Minor", "2024-01-15T00:00:00.000+0000", "2024-02-14T00:00:00.000+0000"),
+        # Resolved after 00:00 on the last day of January, which "resolutiondate <= 2024-01-31" leaves out
+        issue("A-4", "Critical", "2024-01-30T00:00:00.000+0000", "2024-01-31T15:30:00.000+0000"),
+        issue("A-5", "Critical", "2024-02-10T00:00:00.000+0000"),
+    ]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "age_aggregates.sqlite")
+
+
+@pytest.fixture
+def store(store_path):
+    store = AgeAggregateStore('project = A', CELLS, PriorityClassifier(), path=store_path)
+    yield store
+    store.close()
+
+
+class TestUndatedTemplate:
+
+    def test_window_field_and_undated_predicate(self):
+        window_field, predicate = undated_template(RESOLVED)
+        assert window_field == "resolutiondate"
+        assert predicate.canonical() == undated_template('project = A')[1].canonical()
+
+    def test_template_without_dates(self):
+        assert undated_template('project = A AND priority = Blocker')[0] is None
+
+    def test_one_sided_bound(self):
+        assert undated_template('project = A AND resolution = Unresolved AND created <= "{{end_date}}"')[0] == "created"
+
+    @pytest.mark.parametrize("jql_template", [
+        'project = A AND (resolutiondate >= "{{start_date}}" OR priority = Blocker)',
+        'project = A AND resolutiondate >= "{{start_date}}" AND resolutiondate <= "{{end_date}}" AND updated >= "{{start_date}}"',
+    ])
+    def test_dates_outside_one_window_are_refused(self, jql_template):
+        with pytest.raises(UnsupportedJQL):
+            undated_template(jql_template)
+
+
+class TestCellMeans:
+
+    def test_date_window_is_applied_at_query_time(self, store, issues):
+        store.sync(FakeSearchClient(issues))
+        january = store.cell_means("2024-01-01", "2024-01-31", as_of=AS_OF)
+        resolved = january[('Resolved-Defect', 'Regression')]
+        assert set(resolved) == {"Blocker"}
+        assert resolved["Blocker"]['count'] == 2
+        assert resolved["Blocker"]['resolved_age'] == pytest.approx(15.0)
+
+        february = store.cell_means("2024-02-01", "2024-02-29", as_of=AS_OF)
+        assert february[('Resolved-Defect', 'Regression')]["Others"]['resolved_age'] == pytest.approx(30.0)
+        assert february[('Unresolved-Defect', 'Regression')]["Critical"]['age'] == pytest.approx(20.0)
+
+    def test_whole_range(self, store, issues):
+        store.sync(FakeSearchClient(issues))
+        counts = {bucket: means['count'] for bucket, means in
+                  store.cell_means("2024-01-01", "2024-02-29", as_of=AS_OF)[('Resolved-Defect', 'Regression')].items()}
+        assert counts == {"Blocker": 2, "Critical": 1, "Others": 1}
+
+    def test_one_sided_bound_is_applied(self, store_path, issues):
+        cells = {('Unresolved-Defect', 'Regression'): ('project = A AND resolution = Unresolved AND created <= "{{end_date}}"', None)}
+        store = AgeAggregateStore('project = A', cells, PriorityClassifier(), path=store_path)
+        store.sync(FakeSearchClient(issues))
+        assert store.cell_means("2024-01-01", "2024-01-31", as_of=AS_OF)[('Unresolved-Defect', 'Regression')] == {}
+        assert store.cell_means("2023-01-01", "2024-02-29", as_of=AS_OF)[('Unresolved-Defect', 'Regression')]["Critical"]['count'] == 1
+        store.close()
+
+    def test_other_dates_reuse_the_store(self, store_path, issues):
+        first = AgeAggregateStore('project = A', CELLS, PriorityClassifier(), path=store_path)
+        first.sync(FakeSearchClient(issues))
+        watermark = first.watermark
+        first.close()
+        # A report over other dates opens the same store instead of rebuilding it
+        second = AgeAggregateStore('project = A', CELLS, PriorityClassifier(), path=store_path)
+        assert second.watermark == watermark
+        assert second.cell_means("2024-02-01", "2024-02-29", as_of=AS_OF)[('Resolved-Defect', 'Regression')]
+        second.close()
+
+    def test_changed_template_rebuilds_the_store(self, store_path, issues):
+        first = AgeAggregateStore('project = A', CELLS, PriorityClassifier(), path=store_path)
+        first.sync(FakeSearchClient(issues))
+        first.close()
+        cells = dict(CELLS)
+        cells[('Resolved-Defect', 'Regression')] = (RESOLVED + ' AND priority = Blocker', None)
+        second = AgeAggregateStore('project = A', cells, PriorityClassifier(), path=store_path)
+        assert second.watermark is None
+        assert second.cell_means("2024-01-01", "2024-01-31")[('Resolved-Defect', 'Regression')] == {}
+        second.close()
+
+
+class TestDeltaSync:
+
+    def test_second_sync_reads_only_updated_issues(self, store, issues):
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        assert store.sync(client) == 5
+        assert client.queries[-1] == '(project = A) AND updated >= "2024/02/19 23:58"'
+
+    def test_resync_replaces_the_previous_contribution(self, store, issues):
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        store.sync(client)
+        resolved = store.cell_means("2024-01-01", "2024-01-31", as_of=AS_OF)[('Resolved-Defect', 'Regression')]
+        assert resolved["Blocker"]['count'] == 2
+
+    def test_updated_issue_moves_between_buckets_and_windows(self, store, issues):
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        # A-1 is re-prioritised and A-5 resolved, both move out of the rows they were in
+        client.issues["A-1"] = issue("A-1", "Minor", "2024-01-01T00:00:00.000+0000", "2024-01-11T00:00:00.000+0000",
+                                     updated="2024-02-25T00:00:00.000+0000")
+        client.issues["A-5"] = issue("A-5", "Critical", "2024-02-10T00:00:00.000+0000", "2024-02-15T00:00:00.000+0000",
+                                     updated="2024-02-25T00:00:00.000+0000")
+        store.sync(client)
+
+        january = store.cell_means("2024-01-01", "2024-01-31", as_of=AS_OF)[('Resolved-Defect', 'Regression')]
+        assert january["Blocker"] == {'count': 1, 'resolved_age': pytest.approx(20.0), 'age': pytest.approx(60.0)}
+        assert january["Others"]['count'] == 1
+        february = store.cell_means("2024-02-01", "2024-02-29", as_of=AS_OF)
+        assert february[('Resolved-Defect', 'Regression')]["Critical"]['resolved_age'] == pytest.approx(5.0)
+        assert february[('Unresolved-Defect', 'Regression')] == {}
+
+    def test_reopened_issue_leaves_the_resolved_cell(self, store, issues):
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        client.issues["A-3"] = issue("A-3", "Minor", "2024-01-15T00:00:00.000+0000", updated="2024-02-25T00:00:00.000+0000")
+        store.sync(client)
+        means = store.cell_means("2024-01-01", "2024-02-29", as_of=AS_OF)
+        assert "Others" not in means[('Resolved-Defect', 'Regression')]
+        assert means[('Unresolved-Defect', 'Regression')]["Others"]['age'] == pytest.approx(46.0)
+
+
+class TestReconcile:
+
+    def move_and_delete(self, client):
+        client.issues["A-1"]['fields']['project'] = {'key': 'B'}
+        client.issues["A-1"]['fields']['updated'] = "2024-02-25T00:00:00.000+0000"
+        del client.issues["A-2"]
+
+    def test_issues_that_left_the_scope_are_removed(self, store, issues):
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        self.move_and_delete(client)
+        # A delta sync only reads the scope, neither issue comes back in it
+        store.sync(client)
+        assert store.cell_means("2024-01-01", "2024-01-31", as_of=AS_OF)[('Resolved-Defect', 'Regression')]["Blocker"]['count'] == 2
+
+        assert store.reconcile(client) == 2
+        assert client.queries[-1] == 'project = A'
+        assert store.cell_means("2024-01-01", "2024-01-31", as_of=AS_OF)[('Resolved-Defect', 'Regression')] == {}
+        assert store.reconcile(client) == 0
+
+    def test_reconcile_runs_when_due(self, store_path, issues):
+        store = AgeAggregateStore('project = A', CELLS, PriorityClassifier(), path=store_path, reconcile_interval=timedelta(0))
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        self.move_and_delete(client)
+        store.sync(client)
+        assert store.cell_means("2024-01-01", "2024-01-31", as_of=AS_OF)[('Resolved-Defect', 'Regression')] == {}
+        store.close()
+
+    def test_reconcile_is_skipped_until_due(self, store, issues):
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        self.move_and_delete(client)
+        store.sync(client)
+        assert not store.reconcile_due()
+        assert 'project = A' not in client.queries[1:]
@@ -0,0 +1,171 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from changelog_store import ChangelogStore, parse_timestamp, status_intervals, status_transitions, summarize_time_in_status
+from priority_classifier import PriorityClassifier
+from tests.fakes import FakeSearchClient
+
+DAY = 86400.0
+T0 = parse_timestamp("2024-01-01T00:00:00.000+0000")
+
+
+def at(days):
+    return T0 + days * DAY
+
+
+def history(timestamp, *items):
+    return {'created': timestamp, 'items': list(items)}
+
+
+def status_item(from_status, to_status):
+    return {'field': 'status', 'fromString': from_status, 'toString': to_status}
+
+
+def issue(key, status, histories, priority="Blocker", updated="2024-01-20T00:00:00.000+0000"):
+    return {
+        'key': key,
+        'fields': {
+            'project': {'key': 'A'},
+            'priority': {'name': priority},
+            'status': {'name': status},
+            'created': "2024-01-01T00:00:00.000+0000",
+            'updated': updated,
+        },
+        'changelog': {'total': len(histories), 'histories': histories},
+    }
+
+
+class TestStatusTransitions:
+
+    def test_only_status_items_in_time_order(self):
+        transitions = status_transitions({'changelog': {'histories': [
+            history("2024-01-03T00:00:00.000+0000", status_item("In Progress", "Resolved")),
+            history("2024-01-02T00:00:00.000+0000", {'field': 'assignee', 'fromString': None, 'toString': 'someone'},
+                    status_item("Open", "In Progress")),
+        ]}})
+        assert transitions == [(at(1), "Open", "In Progress"), (at(2), "In Progress", "Resolved")]
+
+    def test_unparsable_history_is_skipped(self):
+        transitions = status_transitions({'changelog': {'histories': [
+            history("not a date", status_item("Open", "Resolved")),
+        ]}})
+        assert transitions == []
+
+    def test_no_changelog(self):
+        assert status_transitions({'key': 'A-1'}) == []
+
+
+class TestStatusIntervals:
+
+    def test_no_transitions_stays_in_current_status(self):
+        durations, status, since, reopens = status_intervals(T0, "Open", [])
+        assert (durations, status, since, reopens) == ({}, "Open", T0, 0)
+
+    def test_completed_intervals_and_current_status(self):
+        transitions = [(at(1), "Open", "In Progress"), (at(3), "In Progress", "Resolved")]
+        durations, status, since, reopens = status_intervals(T0, "Resolved", transitions)
+        assert durations == {"Open": (1 * DAY, 1), "In Progress": (2 * DAY, 1)}
+        assert (status, since, reopens) == ("Resolved", at(3), 0)
+
+    def test_repeated_visits_add_up(self):
+        transitions = [
+            (at(1), "Open", "In Progress"),
+            (at(2), "In Progress", "Resolved"),
+            (at(4), "Resolved", "In Progress"),
+            (at(7), "In Progress", "Closed"),
+        ]
+        durations, status, _, reopens = status_intervals(T0, "Closed", transitions)
+        assert durations["In Progress"] == (4 * DAY, 2)
+        assert durations["Resolved"] == (2 * DAY, 1)
+        assert status == "Closed"
+        assert reopens == 1
+
+    def test_moving_between_done_statuses_is_not_a_reopen(self):
+        transitions = [(at(1), "Open", "Resolved"), (at(2), "Resolved", "Closed")]
+        assert status_intervals(T0, "Closed", transitions)[3] == 0
+
+    def test_custom_done_statuses(self):
+        transitions = [(at(1), "Open", "Verified"), (at(2), "Verified", "Open")]
+        assert status_intervals(T0, "Open", transitions)[3] == 0
+        assert status_intervals(T0, "Open", transitions, done_statuses=("Verified",))[3] == 1
+
+    def test_out_of_order_timestamps_never_count_negative_time(self):
+        durations, _, _, _ = status_intervals(at(5), "Resolved", [(at(1), "Open", "Resolved")])
+        assert durations == {"Open": (0.0, 1)}
+
+
+@pytest.fixture
+def issues():
+    return [
+        issue("A-1", "Resolved", [
+            history("2024-01-02T00:00:00.000+0000", status_item("Open", "In Progress")),
+            history("2024-01-04T00:00:00.000+0000", status_item("In Progress", "Resolved")),
+        ]),
+        issue("A-2", "In Progress", [
+            history("2024-01-03T00:00:00.000+0000", status_item("Open", "Resolved")),
+            history("2024-01-05T00:00:00.000+0000", status_item("Resolved", "In Progress")),
+        ], priority="Minor"),
+        issue("A-3", "Open", []),
+    ]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChangelogStore('project = A', path=str(tmp_path / "changelog.sqlite"), max_workers=2)
+    yield store
+    store.close()
+
+
+class TestChangelogStore:
+
+    def test_issue_durations_add_the_current_status_up_to_now(self, store, issues):
+        store.sync(FakeSearchClient(issues, page_size=1))
+        durations = store.issue_durations(["A-1", "A-2", "A-3", "B-1"], now=at(10))
+        assert durations["A-1"] == ({"Open": 1 * DAY, "In Progress": 2 * DAY, "Resolved": 7 * DAY}, 0)
+        assert durations["A-2"] == ({"Open": 2 * DAY, "Resolved": 2 * DAY, "In Progress": 6 * DAY}, 1)
+        assert durations["A-3"] == ({"Open": 10 * DAY}, 0)
+        assert "B-1" not in durations
+
+    def test_first_sync_reads_the_whole_scope(self, store, issues):
+        client = FakeSearchClient(issues, page_size=1)
+        assert store.sync(client) == 3
+        assert client.queries[0] == '(project = A) ORDER BY key ASC'
+        assert store.watermark == "2024/01/19 23:58"
+
+    def test_resync_replaces_the_transitions_of_an_issue(self, store, issues):
+        client = FakeSearchClient(issues)
+        store.sync(client)
+        client.issues["A-1"] = issue("A-1", "In Progress", client.issues["A-1"]['changelog']['histories'] + [
+            history("2024-01-06T00:00:00.000+0000", status_item("Resolved", "In Progress")),
+        ], updated="2024-01-21T00:00:00.000+0000")
+        store.sync(client)
+        assert client.queries[-1] == '(project = A) AND updated >= "2024/01/19 23:58" ORDER BY key ASC'
+        durations, reopens = store.issue_durations(["A-1"], now=at(10))["A-1"]
+        assert durations == {"Open": 1 * DAY, "In Progress": 2 * DAY + 5 * DAY, "Resolved": 2 * DAY}
+        assert reopens == 1
+
+    def test_truncated_changelog_is_fetched_in_full(self, store, issues):
+        full = issues[0]
+        truncated = dict(full, changelog={'total': 2, 'histories': full['changelog']['histories'][:1]})
+
+        class TruncatingClient(FakeSearchClient):
+            def fetch_page(self, jql_query, start_at, fields, max_results=None, record=None, compact=False, expand=None):
+                page = super().fetch_page(jql_query, start_at, fields, expand=expand)
+                page['issues'] = [self.project(truncated, fields, expand) if item['key'] == "A-1" else item
+                                  for item in page['issues']]
+                return page
+
+        store.sync(TruncatingClient(issues))
+        assert store.issue_durations(["A-1"], now=at(10))["A-1"][0]["Resolved"] == 7 * DAY
+
+    def test_summary_per_section_and_priority(self, store, issues):
+        store.sync(FakeSearchClient(issues))
+        section_issues = {'Regression': [issues[0], issues[1]], 'Exploratory': [issues[2]]}
+        cells = summarize_time_in_status(store, section_issues, PriorityClassifier(), statuses=["Open", "Resolved"], now=at(10))
+        assert cells[('Regression', 'Blocker')]['statuses']["Resolved"]['mean'] == pytest.approx(7.0)
+        assert cells[('Regression', 'Others')]['reopened'] == 1
+        assert cells[('Exploratory', 'Blocker')]['statuses']["Open"]['mean'] == pytest.approx(10.0)
+        overall = cells[('Overall', '')]
+        assert (overall['issues'], overall['reopens'], overall['reopened']) == (3, 1, 1)
+        assert overall['statuses']["Resolved"]['count'] == 2
@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+import pytest
+
+from issue_mirror import IssueMirror
+from tests.fakes import FakeSearchClient
+
+
+def issue(key, project="A", priority="Blocker", created="2024-01-10T09:00:00.000+0000",
+          updated="2024-01-10T09:00:00.000+0000"):
+    return {'key': key, 'fields': {
+        'project': {'key': project},
+        'priority': {'name': priority},
+        'status': {'name': 'Open'},
+        'created': created,
+        'updated': updated,
+        'resolutiondate': None,
+    }}
+
+
+@pytest.fixture
+def issues():
+    return [issue("A-1"), issue("A-2", priority="Minor"), issue("B-1", project="B")]
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    mirror = IssueMirror('project = A', path=str(tmp_path / "mirror.sqlite"))
+    yield mirror
+    mirror.close()
+
+
+def keys(found):
+    return sorted(item['key'] for item in found)
+
+
+def test_nothing_is_answered_before_the_first_sync(mirror):
+    assert not mirror.can_answer('project = A AND priority = Blocker')
+
+
+def test_first_sync_copies_the_scope(mirror, issues):
+    client = FakeSearchClient(issues)
+    assert mirror.sync(client) == 2
+    assert client.queries == ['project = A']
+    assert keys(mirror.search('project = A')) == ["A-1", "A-2"]
+
+
+def test_queries_within_the_scope_are_answered(mirror, issues):
+    mirror.sync(FakeSearchClient(issues))
+    assert mirror.can_answer('project = A AND priority = Blocker', ('priority',))
+    assert mirror.can_answer('priority = Blocker AND Project = "A"')
+    assert keys(mirror.search('project = A AND priority = Blocker')) == ["A-1"]
+
+
+@pytest.mark.parametrize("jql_query", [
+    # Outside the scope, the mirror would answer B issues with an empty result
+    'project = B AND priority = Blocker',
+    # Broader than the scope
+    'priority = Blocker',
+    'project = A OR priority = Blocker',
+    # Word search and status categories are evaluated differently by Jira
+    'project = A AND summary ~ crash',
+    'project = A AND statusCategory = Done',
+    # Not evaluable locally
+    'project = A AND assignee = currentUser()',
+    'project = A AND status WAS Open',
+    # Field the mirror does not keep
+    'project = A AND reporter = alice',
+])
+def test_queries_the_mirror_cannot_answer_exactly_go_to_jira(mirror, issues, jql_query):
+    mirror.sync(FakeSearchClient(issues))
+    assert not mirror.can_answer(jql_query)
+
+
+def test_fields_outside_the_mirror_go_to_jira(mirror, issues):
+    mirror.sync(FakeSearchClient(issues))
+    assert not mirror.can_answer('project = A', ('customfield_10010',))
+
+
+def test_delta_sync_only_reads_updated_issues(mirror, issues):
+    client = FakeSearchClient(issues)
+    mirror.sync(client)
+    client.issues["A-2"] = issue("A-2", priority="Blocker", updated="2024-01-12T10:00:00.000+0000")
+
+    changes = []
+    mirror.sync(client, on_change=lambda previous, current: changes.append((previous['fields']['priority']['name'],
+                                                                           current['fields']['priority']['name'])))
+    assert client.queries[-1] == '(project = A) AND updated >= "2024/01/10 08:58"'
+    assert changes == [("Minor", "Blocker")]
+    assert keys(mirror.search('project = A AND priority = Blocker')) == ["A-1", "A-2"]
+
+
+def test_reconcile_removes_issues_that_left_the_scope(mirror, issues):
+    client = FakeSearchClient(issues)
+    mirror.sync(client)
+    # Loaded into memory so the in-memory copy has to be updated as well
+    assert keys(mirror.search('project = A')) == ["A-1", "A-2"]
+
+    client.issues["A-2"] = issue("A-2", project="B", updated="2024-01-12T10:00:00.000+0000")
+    del client.issues["A-1"]
+    removed = []
+    assert mirror.reconcile(client, on_change=lambda previous, current: removed.append((previous['key'], current))) == 2
+    assert sorted(removed) == [("A-1", None), ("A-2", None)]
+    assert keys(mirror.search('project = A')) == []
+
+
+def test_reconcile_runs_when_due(tmp_path, issues):
+    mirror = IssueMirror('project = A', path=str(tmp_path / "mirror.sqlite"), reconcile_interval=timedelta(0))
+    client = FakeSearchClient(issues)
+    mirror.sync(client)
+    del client.issues["A-1"]
+    mirror.sync(client)
+    assert keys(mirror.search('project = A')) == ["A-2"]
+    mirror.close()
+
+
+def test_reconcile_is_skipped_until_due(mirror, issues):
+    client = FakeSearchClient(issues)
+    mirror.sync(client)
+    del client.issues["A-1"]
+    mirror.sync(client)
+    assert not mirror.reconcile_due()
+    assert keys(mirror.search('project = A')) == ["A-1", "A-2"]
+
+
+def test_changing_the_scope_discards_the_mirror(tmp_path, issues):
+    path = str(tmp_path / "mirror.sqlite")
+    first = IssueMirror('project = A', path=path)
+    first.sync(FakeSearchClient(issues))
+    first.close()
+
+    second = IssueMirror('project = B', path=path)
+    assert second.watermark is None
+    assert keys(second.search('project = B')) == []
+    second.close()
@@ -0,0 +1,61 @@
+import pytest
+
+from issue_records import IssueRecord, compact_issues, compact_value
+from jql_filter import compile_jql
+from query_planner import QueryPlanner
+
+RAW = {'key': "ABC-1", 'fields': {
+    'project': {'self': "https://jira.example/rest/api/2/project/10000", 'id': "10000", 'key': "ABC", 'name': "Alpha Project"},
+    'priority': {'id': "1", 'name': "Blocker"},
+    'components': [{'id': "1", 'name': "ui"}, {'id': "2", 'name': "api"}],
+    'resolution': None,
+    'labels': ["gerrit"],
+    'summary': "Crash on start",
+}}
+
+
+class TestCompactValue:
+
+    def test_object_with_one_identifier_becomes_a_scalar(self):
+        assert compact_value({'id': "1", 'name': "Blocker"}) == "Blocker"
+        assert compact_value({'id': "1", 'value': "Yes"}) == "Yes"
+        assert compact_value({'id': "1"}) is None
+
+    def test_project_keeps_its_key_and_name(self):
+        assert compact_value(RAW['fields']['project']) == {'key': "ABC", 'name': "Alpha Project"}
+
+    def test_lists_are_reduced_item_by_item(self):
+        assert compact_value(RAW['fields']['components']) == ["ui", "api"]
+        assert compact_value(["gerrit"]) == ["gerrit"]
+
+
+@pytest.mark.parametrize("jql_query", [
+    'project = ABC',
+    'project = "Alpha Project"',
+    'project in (XYZ, ABC) AND priority = Blocker',
+    'component = api AND labels = gerrit',
+    'resolution is EMPTY',
+    'project != XYZ',
+])
+def test_jql_matches_the_record_like_the_raw_issue(jql_query):
+    record = IssueRecord.from_issue(RAW)
+    predicate = compile_jql(jql_query)
+    assert predicate(RAW)
+    assert predicate(record)
+
+
+def test_record_round_trips_through_its_dictionary():
+    record = IssueRecord.from_issue(RAW)
+    assert IssueRecord.from_issue(record.to_dict()).to_dict() == record.to_dict()
+
+
+def test_planner_answers_project_terms_on_compact_issues():
+    base = 'priority = Blocker'
+    planner = QueryPlanner()
+    planner.add_search('all', base, ('project', 'priority'))
+    planner.add_search('abc', base + ' AND project = ABC', ('project', 'priority'))
+    plan = planner.plan()
+    assert plan.derived == 1
+    (query_key,) = plan.queries
+    answers = plan.resolve({query_key: compact_issues([RAW])})
+    assert [issue['key'] for issue in answers['abc']] == ["ABC-1"]
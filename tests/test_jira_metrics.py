@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+JIRA_METRICS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "JIRA_Metrics")
+
+# Runs the CLI in a fresh interpreter, the test process has pandas loaded already
+CHECK_IMPORTS = """
+import sys
+import jira_metrics
+status = jira_metrics.main(sys.argv[1:])
+print("loaded:" + ",".join(module for module in ("pandas", "numpy", "requests", "Report__", "Defect_Age") if module in sys.modules))
+sys.exit(status)
+"""
+
+
+def run_cli(*argv):
+    return subprocess.run([sys.executable, "-c", CHECK_IMPORTS] + list(argv), cwd=JIRA_METRICS_DIRECTORY,
+                          capture_output=True, text=True, timeout=60)
+
+
+@pytest.fixture
+def qmr_config(tmp_path):
+    data = {'api_credentials': {'api_username': "user", 'api_password': "password",
+                                'api_url': "https://jira.example/rest/api/latest/search"}}
+    for section in ("Regression", "Exploratory"):
+        data[section] = {sub_query: 'project = A AND resolutiondate >= "{{start_date}}" AND resolutiondate <= "{{end_date}}"'
+                         for sub_query in ("BugsRaised", "Resolved", "Fixed", "GerritFix", "Noise", "Resolution")}
+    path = tmp_path / "qmr.json"
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def test_dry_run_loads_no_report_module(qmr_config):
+    result = run_cli("qmr", "--config", qmr_config, "--start-date", "2024-01-01", "--end-date", "2024-02-29", "--dry-run")
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert 'Regression.Resolved: project = A AND resolutiondate >= "2024-02-01" AND resolutiondate <= "2024-02-29"' in lines
+    assert lines[-1] == "loaded:"
+
+
+def test_invalid_config_is_reported_without_the_report_modules(tmp_path):
+    path = tmp_path / "qmr.json"
+    path.write_text(json.dumps({'Regression': {}}))
+    result = run_cli("qmr", "--config", str(path), "--start-date", "2024-01-01", "--end-date", "2024-01-31")
+    assert result.returncode == 1
+    assert "API credentials not found in JSON data." in result.stderr
+    assert result.stdout.splitlines()[-1] == "loaded:"
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("requests")
+
+from jira_search import JiraSearchClient, MIN_SHARD_WINDOW
+from jql_filter import date_window
+from tests.fakes import FakeJiraTransport
+
+JANUARY = 'project = A AND created >= "2024-01-01" AND created < "2024-02-01"'
+
+
+def issue(key, created):
+    return {'key': key, 'fields': {'project': {'key': 'A'}, 'priority': {'name': 'Minor'}, 'created': created}}
+
+
+def daily_issues(days, per_day=1):
+    return [issue("A-{}".format(day * per_day + index), "2024-01-{:02d}T12:00:00.000+0000".format(day + 1))
+            for day in range(days) for index in range(per_day)]
+
+
+def client(transport, shard_threshold=4):
+    return JiraSearchClient("https://jira.example/rest/api/latest/search", {}, page_size=3, prefetch=0,
+                            transport=transport, shard_threshold=shard_threshold, shard_workers=1)
+
+
+class TestPlanShards:
+
+    def test_shards_hold_at_most_the_threshold_and_cover_the_window(self):
+        transport = FakeJiraTransport(daily_issues(31))
+        window = date_window(JANUARY)
+        shards = client(transport)._plan_shards(JANUARY, window, 31, None)
+
+        assert shards[0][0] == window[1]
+        assert shards[-1][1] == window[2]
+        # Dropped empty parts aside, shards are contiguous and never overlap
+        for (_, end), (start, _) in zip(shards, shards[1:]):
+            assert end <= start
+        for start, end in shards:
+            inside = [key for key, item in transport.issues.items()
+                      if start <= datetime.strptime(item['fields']['created'][:16], "%Y-%m-%dT%H:%M") < end]
+            assert 0 < len(inside) <= 4
+
+    def test_boundaries_have_minute_precision(self):
+        transport = FakeJiraTransport(daily_issues(31))
+        for start, end in client(transport)._plan_shards(JANUARY, date_window(JANUARY), 31, None):
+            assert start.second == start.microsecond == end.second == end.microsecond == 0
+
+    def test_empty_parts_are_dropped(self):
+        # Every issue is created on the first two days, the rest of the month needs no shard
+        transport = FakeJiraTransport(daily_issues(2, per_day=3))
+        shards = client(transport)._plan_shards(JANUARY, date_window(JANUARY), 6, None)
+        assert len(shards) == 2
+        assert all(end <= datetime(2024, 1, 3) for _, end in shards)
+
+    def test_window_is_not_split_below_the_minimum(self):
+        same_minute = [issue("A-{}".format(index), "2024-01-10T12:00:00.000+0000") for index in range(10)]
+        transport = FakeJiraTransport(same_minute)
+        shards = client(transport)._plan_shards(JANUARY, date_window(JANUARY), 10, None)
+        assert len(shards) == 1
+        start, end = shards[0]
+        assert end - start <= MIN_SHARD_WINDOW
+
+
+class TestShardedSearch:
+
+    def test_large_search_is_sharded_and_returns_every_issue_once(self):
+        transport = FakeJiraTransport(daily_issues(31))
+        keys = [item['key'] for item in client(transport).search(JANUARY, fields=("created",))]
+        assert sorted(keys) == sorted(transport.issues)
+        assert len(transport.count_requests()) > 0
+        assert all(' AND created >= "' in params['jql'] for params in transport.search_requests()[1:])
+
+    def test_small_search_is_paged_through(self):
+        transport = FakeJiraTransport(daily_issues(4))
+        keys = [item['key'] for item in client(transport).search(JANUARY, fields=("created",))]
+        assert len(keys) == 4
+        assert transport.count_requests() == []
+
+    def test_query_without_date_range_is_paged_through(self):
+        transport = FakeJiraTransport(daily_issues(31))
+        keys = [item['key'] for item in client(transport).search('project = A', fields=("created",))]
+        assert sorted(keys) == sorted(transport.issues)
+        assert transport.count_requests() == []
+
+    def test_issue_moving_between_shards_is_returned_once(self):
+        moved = {}
+
+        def move_after_first_shard(transport, params):
+            # Once the first shard was fetched, A-0 is edited so that the last shard matches it too
+            if params['maxResults'] and ' AND created >= "' in params['jql'] and 'first' not in moved:
+                moved['first'] = params['jql']
+            elif moved and 'done' not in moved:
+                transport.issues['A-0']['fields']['created'] = "2024-01-31T12:00:00.000+0000"
+                moved['done'] = True
+
+        transport = FakeJiraTransport(daily_issues(31), before_page=move_after_first_shard)
+        keys = [item['key'] for item in client(transport).search(JANUARY, fields=("created",))]
+        assert moved.get('done')
+        assert len(keys) == len(set(keys)) == 31
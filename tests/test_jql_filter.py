@@ -0,0 +1,165 @@
+from datetime import datetime
+
+import pytest
+
+from jql_filter import (compile_jql, date_bounds, date_window, strip_order_by, and_clause, compile_undated_jql, field_values,
+                        UnsupportedJQL)
+
+
+def issue(key="PROJ-1", **fields):
+    return {'key': key, 'fields': fields}
+
+
+BLOCKER = issue(
+    "PROJ-1",
+    project={'key': 'PROJ'},
+    priority={'name': 'Blocker'},
+    status={'name': 'Open', 'statusCategory': {'key': 'new', 'name': 'To Do'}},
+    resolution=None,
+    labels=['regression', 'gerrit'],
+    created="2024-01-31T10:15:00.000+0000",
+    resolutiondate=None,
+)
+MINOR = issue(
+    "PROJ-2",
+    project={'key': 'PROJ'},
+    priority={'name': 'Minor'},
+    status={'name': 'Closed', 'statusCategory': {'key': 'done', 'name': 'Done'}},
+    resolution={'name': 'Fixed'},
+    labels=[],
+    created="2024-01-15T08:00:00.000+0000",
+    resolutiondate="2024-02-01T00:00:00.000+0000",
+)
+
+
+def matches(jql_query, *issues):
+    predicate = compile_jql(jql_query)
+    return [item['key'] for item in issues if predicate(item)]
+
+
+class TestTokenizer:
+
+    def test_quoted_values_keep_spaces_and_escapes(self):
+        named = issue(summary="x", priority={'name': 'Very "High"'})
+        assert matches('priority = "Very \\"High\\""', named) == ["PROJ-1"]
+
+    def test_single_quotes_and_unquoted_values(self):
+        assert matches("priority = 'Blocker'", BLOCKER, MINOR) == ["PROJ-1"]
+        assert matches("priority = Blocker", BLOCKER, MINOR) == ["PROJ-1"]
+
+    def test_keywords_and_field_names_are_case_insensitive(self):
+        assert matches('PRIORITY IN (blocker, MINOR) and Project = proj', BLOCKER, MINOR) == ["PROJ-1", "PROJ-2"]
+
+    def test_unbalanced_query_is_rejected(self):
+        with pytest.raises(UnsupportedJQL):
+            compile_jql('priority in (Blocker')
+
+
+class TestParser:
+
+    def test_and_binds_tighter_than_or(self):
+        # Blocker OR (Minor AND Open), MINOR is Closed so only BLOCKER matches
+        assert matches('priority = Blocker OR priority = Minor AND status = Open', BLOCKER, MINOR) == ["PROJ-1"]
+        assert matches('(priority = Blocker OR priority = Minor) AND status = Closed', BLOCKER, MINOR) == ["PROJ-2"]
+
+    def test_not(self):
+        assert matches('NOT priority = Blocker', BLOCKER, MINOR) == ["PROJ-2"]
+
+    def test_order_by_does_not_change_matches(self):
+        assert matches('priority = Minor ORDER BY created DESC', BLOCKER, MINOR) == ["PROJ-2"]
+        assert strip_order_by('project = PROJ order by created') == 'project = PROJ'
+
+    def test_empty_query_matches_everything(self):
+        assert matches('', BLOCKER, MINOR) == ["PROJ-1", "PROJ-2"]
+
+    @pytest.mark.parametrize("jql_query", [
+        'assignee = currentUser()',
+        'status WAS Open',
+        'status CHANGED',
+        'created >= -7d',
+        'created >= startOfMonth()',
+        'priority > Minor',
+        'sprint = 12',
+    ])
+    def test_syntax_jira_evaluates_differently_is_rejected(self, jql_query):
+        with pytest.raises(UnsupportedJQL):
+            compile_jql(jql_query)
+
+    def test_canonical_form_ignores_clause_order_quoting_and_case(self):
+        first = compile_jql('project = PROJ AND priority in (Minor, Blocker)')
+        second = compile_jql('Priority IN ("Blocker", "Minor") and project = "PROJ"')
+        assert first.canonical() == second.canonical()
+
+
+class TestEvaluation:
+
+    def test_in_and_not_in(self):
+        assert matches('priority in (Blocker, Critical)', BLOCKER, MINOR) == ["PROJ-1"]
+        assert matches('priority not in (Blocker, Critical)', BLOCKER, MINOR) == ["PROJ-2"]
+
+    def test_negative_operators_never_match_empty_fields(self):
+        # Jira leaves issues without a resolution out of "resolution != Fixed"
+        assert matches('resolution != Fixed', BLOCKER, MINOR) == []
+        assert matches('resolution not in (Duplicate)', BLOCKER, MINOR) == ["PROJ-2"]
+
+    def test_empty_and_unresolved(self):
+        assert matches('resolution is EMPTY', BLOCKER, MINOR) == ["PROJ-1"]
+        assert matches('resolution = Unresolved', BLOCKER, MINOR) == ["PROJ-1"]
+        assert matches('resolution != Unresolved', BLOCKER, MINOR) == ["PROJ-2"]
+        assert matches('resolutiondate is not EMPTY', BLOCKER, MINOR) == ["PROJ-2"]
+        assert matches('labels = EMPTY', BLOCKER, MINOR) == ["PROJ-2"]
+
+    def test_multi_value_fields_match_any_value(self):
+        assert matches('labels = gerrit', BLOCKER, MINOR) == ["PROJ-1"]
+        assert matches('labels in (regression, exploratory)', BLOCKER, MINOR) == ["PROJ-1"]
+
+    def test_status_category_is_read_from_status(self):
+        assert matches('statusCategory = Done', BLOCKER, MINOR) == ["PROJ-2"]
+        assert compile_jql('statusCategory = Done').fields() == {'status'}
+
+    def test_date_only_upper_bound_is_the_start_of_that_day(self):
+        # Jira reads "2024-01-31" as 2024-01-31 00:00, an issue created later that day is excluded
+        jql_query = 'created >= "2024-01-01" AND created <= "2024-01-31"'
+        assert matches(jql_query, BLOCKER, MINOR) == ["PROJ-2"]
+        assert matches('created < "2024-02-01"', BLOCKER, MINOR) == ["PROJ-1", "PROJ-2"]
+
+    def test_minute_bounds(self):
+        assert matches('created >= "2024/01/31 10:15"', BLOCKER, MINOR) == ["PROJ-1"]
+        assert matches('created > "2024/01/31 10:16"', BLOCKER, MINOR) == []
+
+    def test_custom_fields(self):
+        custom = issue(customfield_10010={'value': 'Team A'})
+        assert matches('cf[10010] = "team a"', custom) == ["PROJ-1"]
+        assert compile_jql('cf[10010] = x').fields() == {'customfield_10010'}
+
+    def test_field_values(self):
+        assert field_values(BLOCKER, 'priority') == ['Blocker']
+        assert field_values(BLOCKER, 'created') == [datetime(2024, 1, 31, 10, 15)]
+        assert field_values(MINOR, 'labels') == []
+
+
+class TestDateHelpers:
+
+    def test_date_window_widens_inclusive_bound_by_a_minute(self):
+        field, start, end = date_window('project = PROJ AND created >= "2024-01-01" AND created <= "2024-01-31"')
+        assert field == 'created'
+        assert start == datetime(2024, 1, 1)
+        assert end == datetime(2024, 1, 31, 0, 1)
+
+    def test_date_window_needs_both_bounds_at_the_top_level(self):
+        assert date_window('created >= "2024-01-01"') is None
+        assert date_window('created >= "2024-01-01" OR created <= "2024-01-31"') is None
+
+    def test_date_bounds_keep_one_sided_bounds(self):
+        assert date_bounds('project = PROJ AND created <= "2024-01-31" AND updated >= "2024-01-01"') == {
+            'created': (None, datetime(2024, 1, 31, 0, 1)),
+            'updated': (datetime(2024, 1, 1), None),
+        }
+        assert date_bounds('project = PROJ') == {}
+
+    def test_and_clause_drops_ordering(self):
+        assert and_clause('project = PROJ ORDER BY key', 'priority = Blocker') == '(project = PROJ) AND priority = Blocker'
+
+    def test_undated_predicate_keeps_other_terms(self):
+        predicate = compile_undated_jql('priority = Minor AND created >= "2030-01-01" AND created <= "2030-02-01"', 'created')
+        assert [item['key'] for item in (BLOCKER, MINOR) if predicate(item)] == ["PROJ-2"]
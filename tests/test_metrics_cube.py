@@ -0,0 +1,128 @@
+from datetime import datetime
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from metrics_cube import CellCube, FieldDimension, JqlDimension, MetricsCube, NO_VALUE, cube_member
+from priority_classifier import PriorityClassifier
+
+NOW = "2024-03-01T00:00:00+00:00"
+
+
+def issue(key, priority, created, resolved=None, components=()):
+    return {'key': key, 'fields': {
+        'project': {'key': 'A'},
+        'priority': {'name': priority},
+        'created': created,
+        'resolutiondate': resolved,
+        'components': [{'name': component} for component in components],
+    }}
+
+
+ISSUES = [
+    issue("A-1", "Blocker", "2024-01-05T10:00:00.000+0000", "2024-01-07T10:00:00.000+0000", components=["ui"]),
+    issue("A-2", "Minor", "2024-01-20T10:00:00.000+0000", "2024-02-04T10:00:00.000+0000", components=["ui", "api"]),
+    issue("A-3", "Blocker", "2024-02-10T10:00:00.000+0000"),
+    # Resolved on the last day of January after 00:00, which "resolutiondate <= 2024-01-31" leaves out
+    issue("A-4", "Critical", "2024-01-30T10:00:00.000+0000", "2024-01-31T15:30:00.000+0000"),
+]
+
+
+@pytest.fixture
+def cube():
+    return MetricsCube.build(ISSUES, [FieldDimension("component", "components")], grain="month")
+
+
+class TestSlice:
+
+    def test_created_per_month(self, cube):
+        result = cube.slice("created", by=("period",))
+        assert result["issues"].astype(int).to_dict() == {
+            pd.Period("2024-01", "M"): 4,
+            pd.Period("2024-02", "M"): 1,
+        }
+
+    def test_multi_valued_dimension_counts_an_issue_per_value(self, cube):
+        counts = cube.slice("created", by=("component",))["issues"].astype(int).to_dict()
+        assert counts == {"ui": 2, "api": 1, NO_VALUE: 2}
+
+    def test_filters_and_day_bounds(self, cube):
+        result = cube.slice("resolved", filters={"component": ["ui", "api"]}, start="2024-02-01", end="2024-02-29")
+        # Whole months of a month cube are kept
+        assert int(result["issues"].iloc[0]) == 2
+
+    def test_mean_ages(self, cube):
+        resolved = cube.slice("resolved", filters={"component": "ui"}, by=("period",), grain="month")
+        assert resolved["mean_age"].round(6).tolist() == [2.0, 15.0]
+        open_age = cube.slice("created", filters={"component": NO_VALUE}, now=NOW)
+        # A-3 is open since 2024-02-10 10:00, A-4 is resolved
+        assert open_age["mean_open_age"].iloc[0] == pytest.approx(19 + 14 / 24)
+
+    def test_unknown_event_or_grain(self, cube):
+        with pytest.raises(ValueError):
+            cube.slice("updated")
+        with pytest.raises(ValueError):
+            cube.slice(grain="day")
+
+    def test_window_inside_a_period_is_refused(self, cube):
+        with pytest.raises(ValueError):
+            cube.slice("resolved", window=(datetime(2024, 1, 1), datetime(2024, 1, 31, 0, 1)))
+
+
+class TestPivot:
+
+    def test_components_by_month(self, cube):
+        table = cube.pivot(["component"], ["period"], event="resolved")
+        assert table.loc["ui", pd.Period("2024-01", "M")] == 1
+        assert table.loc["api", pd.Period("2024-02", "M")] == 1
+        assert table.loc["api", pd.Period("2024-01", "M")] == 0
+
+    def test_pivot_measure(self, cube):
+        table = cube.pivot(["component"], ["event"], measure="open", event="created")
+        assert table.loc[NO_VALUE, "created"] == 1
+
+
+class TestCubeMember:
+
+    def test_date_only_upper_bound_keeps_the_minute(self):
+        event, start, end, predicate = cube_member(
+            'project = A AND resolutiondate >= "2024-01-01" AND resolutiondate <= "2024-01-31"')
+        assert (event, start, end) == ("resolved", datetime(2024, 1, 1), datetime(2024, 1, 31, 0, 1))
+        assert predicate(ISSUES[0])
+
+    def test_query_without_window_uses_the_default_event(self):
+        event, start, end, _ = cube_member('project = A AND priority = Blocker', default_event="resolved")
+        assert (event, start, end) == ("resolved", None, None)
+
+
+class TestCellCube:
+
+    JANUARY = 'project = A AND resolutiondate >= "2024-01-01" AND resolutiondate <= "2024-01-31"'
+    JANUARY_BLOCKERS = JANUARY + ' AND priority = Blocker'
+
+    def cell_cube(self, grain="day"):
+        cell_cube = CellCube({'resolved': (self.JANUARY, "created"), 'blockers': (self.JANUARY_BLOCKERS, "created")},
+                             PriorityClassifier(), grain=grain)
+        cell_cube.build(ISSUES)
+        return cell_cube
+
+    def test_cells_count_what_their_jql_matches(self):
+        cell_cube = self.cell_cube()
+        # A-4 resolved at 15:30 on the last day is outside "<= 2024-01-31", like in Jira
+        assert cell_cube.priority_counts('resolved') == {"Blocker": 1, "Critical": 0, "Others": 0}
+        assert cell_cube.priority_counts('blockers')["Blocker"] == 1
+
+    def test_window_narrows_the_cell(self):
+        cell_cube = self.cell_cube()
+        counts = cell_cube.priority_counts('resolved', window=(datetime(2024, 1, 8), datetime(2024, 2, 1)))
+        assert sum(counts.values()) == 0
+
+    def test_ad_hoc_slices_use_the_grain(self):
+        cube = self.cell_cube(grain="month").cube
+        assert cube.resolution == "minute"
+        assert list(cube.slice("created", by=("period",)).index) == [pd.Period("2024-01", "M"), pd.Period("2024-02", "M")]
+
+    def test_inexact_jql_is_refused(self):
+        with pytest.raises(ValueError):
+            JqlDimension("member", {'text': 'summary ~ crash'})
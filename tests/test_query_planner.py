@@ -0,0 +1,177 @@
+import pytest
+
+from jql_filter import compile_jql, strip_order_by
+from query_planner import QueryPlanner, normalise_jql, query_terms, within_scope
+
+BASE = 'project = A AND resolutiondate >= "2024-01-01" AND resolutiondate <= "2024-01-31"'
+BUCKETS = ['priority = Blocker', 'priority = Critical', 'priority not in (Blocker, Critical)']
+
+
+def issue(key, priority, resolution=None, labels=()):
+    return {'key': key, 'fields': {
+        'project': {'key': 'A'},
+        'priority': {'name': priority},
+        'resolution': {'name': resolution} if resolution else None,
+        'labels': list(labels),
+        'resolutiondate': "2024-01-10T09:00:00.000+0000",
+    }}
+
+
+ISSUES = [
+    issue("A-1", "Blocker", "Fixed", labels=["gerrit"]),
+    issue("A-2", "Critical", "Duplicate"),
+    issue("A-3", "Minor", "Fixed"),
+    issue("A-4", "Blocker"),
+]
+
+
+def run(plan, issues=ISSUES):
+    """
+    Answer a plan with search results filtered from issues, the way QueryExecutor.run_calls would.
+    """
+    results = {}
+    for query_key, (function, *args) in plan.calls("search", "count").items():
+        matched = [item for item in issues if compile_jql(strip_order_by(args[0]))(item)]
+        results[query_key] = matched if function == "search" else len(matched)
+    return plan.resolve(results)
+
+
+class TestNormalise:
+
+    def test_clause_order_quoting_and_order_by(self):
+        assert normalise_jql('project = "A" AND priority = Blocker ORDER BY key') == \
+            normalise_jql('PRIORITY = Blocker and project = A')
+
+    def test_unparsable_query_is_whitespace_collapsed(self):
+        assert normalise_jql('assignee  = currentUser()') == 'assignee = currentUser()'
+
+    def test_query_terms_flatten_nested_and(self):
+        assert query_terms('(project = A AND priority = Blocker) AND labels = x') == \
+            query_terms('labels = x AND priority = Blocker AND project = A')
+        assert query_terms('assignee = currentUser()') is None
+
+    def test_within_scope(self):
+        assert within_scope(BASE, 'project = A')
+        assert not within_scope('resolutiondate >= "2024-01-01"', 'project = A')
+        assert not within_scope('project = A OR project = B', 'project = A')
+
+
+class TestDuplicates:
+
+    def test_identical_jql_is_fetched_once(self):
+        planner = QueryPlanner()
+        planner.add_search('first', BASE, ('priority',))
+        planner.add_search('second', BASE.replace('project = A', 'project = "A"'), ('labels',))
+        plan = planner.plan()
+        assert plan.summary()['queries'] == 1
+        assert plan.duplicates == 1
+        (query,) = plan.queries.values()
+        assert query.fields == ('labels', 'priority')
+        answers = run(plan)
+        assert answers['first'] == answers['second']
+
+    def test_merge_disabled_only_collapses_duplicates(self):
+        planner = QueryPlanner.from_config({'merge': False})
+        planner.add_search('base', BASE, ('priority',))
+        planner.add_search('base again', BASE, ('priority',))
+        planner.add_search('fixed', BASE + ' AND resolution = Fixed', ('priority',))
+        plan = planner.plan()
+        assert plan.summary()['searches'] == 2
+        assert plan.derived == 0
+
+
+class TestLocalAnswers:
+
+    def test_narrower_search_is_filtered_from_the_broader_fetch(self):
+        planner = QueryPlanner()
+        planner.add_search('resolved', BASE, ('priority',))
+        planner.add_search('fixed', BASE + ' AND resolution = Fixed', ('priority',))
+        planner.add_search('gerrit', BASE + ' AND resolution = Fixed AND labels = gerrit', ('priority',))
+        plan = planner.plan()
+        assert plan.summary()['searches'] == 1
+        assert plan.derived == 2
+        # The broad fetch carries the fields the local filters read
+        (query,) = plan.queries.values()
+        assert {'priority', 'resolution', 'labels'} <= set(query.fields)
+
+        answers = run(plan)
+        assert [item['key'] for item in answers['resolved']] == ["A-1", "A-2", "A-3", "A-4"]
+        assert [item['key'] for item in answers['fixed']] == ["A-1", "A-3"]
+        assert [item['key'] for item in answers['gerrit']] == ["A-1"]
+
+    def test_word_search_is_never_answered_locally(self):
+        planner = QueryPlanner()
+        planner.add_search('resolved', BASE, ())
+        planner.add_search('text', BASE + ' AND summary ~ crash', ())
+        plan = planner.plan()
+        assert plan.summary()['searches'] == 2
+        assert plan.derived == 0
+
+    def test_unrelated_queries_are_not_merged(self):
+        planner = QueryPlanner()
+        planner.add_search('a', 'project = A', ())
+        planner.add_search('b', 'project = B AND priority = Blocker', ())
+        assert planner.plan().summary()['searches'] == 2
+
+    def test_counts_covered_by_a_search_are_counted_locally(self):
+        planner = QueryPlanner()
+        planner.add_search('resolved', BASE, ('priority',))
+        for bucket in BUCKETS:
+            planner.add_count(('count', bucket), '{} AND {}'.format(BASE, bucket), base=BASE)
+        plan = planner.plan()
+        assert (plan.summary()['searches'], plan.summary()['counts']) == (1, 0)
+        answers = run(plan)
+        assert [answers[('count', bucket)] for bucket in BUCKETS] == [2, 1, 1]
+
+
+class TestCountMerge:
+
+    def add_counts(self, planner, bases):
+        for base in bases:
+            for bucket in BUCKETS:
+                planner.add_count((base, bucket), '{} AND {}'.format(base, bucket), base=base)
+
+    def test_counts_below_min_merge_stay_count_requests(self):
+        planner = QueryPlanner()
+        self.add_counts(planner, [BASE])
+        plan = planner.plan()
+        assert plan.summary()['counts'] == len(BUCKETS)
+        assert plan.summary()['searches'] == 0
+
+    def test_counts_sharing_a_base_are_answered_from_one_fetch(self):
+        planner = QueryPlanner(min_merge=3)
+        self.add_counts(planner, [BASE])
+        plan = planner.plan()
+        assert plan.summary()['searches'] == 1
+        assert plan.summary()['counts'] == 0
+        answers = run(plan)
+        assert [answers[(BASE, bucket)] for bucket in BUCKETS] == [2, 1, 1]
+
+    def test_broadest_base_covering_most_counts_wins(self):
+        fixed = BASE + ' AND resolution = Fixed'
+        planner = QueryPlanner(min_merge=4)
+        self.add_counts(planner, [BASE, fixed])
+        plan = planner.plan()
+        assert plan.summary()['searches'] == 1
+        (query,) = plan.queries.values()
+        assert normalise_jql(query.jql) == normalise_jql(BASE)
+        answers = run(plan)
+        assert [answers[(fixed, bucket)] for bucket in BUCKETS] == [1, 0, 1]
+
+    @pytest.mark.parametrize("min_merge", [3, 100])
+    def test_answers_do_not_depend_on_the_plan(self, min_merge):
+        fixed = BASE + ' AND resolution = Fixed'
+        merged = QueryPlanner(min_merge=min_merge)
+        separate = QueryPlanner(merge=False)
+        for planner in (merged, separate):
+            self.add_counts(planner, [BASE, fixed])
+        assert run(merged.plan()) == run(separate.plan())
+
+
+def test_failed_query_answers_its_jobs_with_none():
+    planner = QueryPlanner()
+    planner.add_search('resolved', BASE, ())
+    planner.add_search('fixed', BASE + ' AND resolution = Fixed', ())
+    plan = planner.plan()
+    answers = plan.resolve({query_key: None for query_key in plan.queries})
+    assert answers == {'resolved': None, 'fixed': None}
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from jira_search import JiraSearchClient
+from query_scheduler import QueryScheduler
+from tests.fakes import FakeJiraTransport
+
+API_URL = "https://jira.example/rest/api/latest/search"
+JQL = 'project = A AND priority = Minor'
+
+
+def issue(key):
+    return {'key': key, 'fields': {'project': {'key': 'A'}, 'priority': {'name': 'Minor'},
+                                   'created': "2024-01-10T12:00:00.000+0000"}}
+
+
+def config_client(transport, scheduler):
+    # One search client per config, as load_batch_jobs builds them
+    return JiraSearchClient(API_URL, {}, page_size=2, prefetch=0, transport=transport, scheduler=scheduler)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = QueryScheduler(max_workers=4)
+    yield scheduler
+    scheduler.close()
+
+
+class TestSharedSearch:
+
+    def test_duplicate_query_of_two_configs_reaches_the_transport_once(self, scheduler):
+        # The first page is held until the second config has joined the fetch in flight
+        transport = FakeJiraTransport([issue("A-{}".format(index)) for index in range(5)],
+                                      before_page=lambda transport, params: wait_for(lambda: scheduler.deduplicated))
+        results = {}
+
+        def run(name):
+            results[name] = [item['key'] for item in config_client(transport, scheduler).search(JQL, fields=("priority",))]
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in ("first", "second")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        assert results["first"] == results["second"]
+        assert len(results["first"]) == 5
+        assert [params['startAt'] for params in transport.search_requests()] == [0, 2, 4]
+        assert (scheduler.sent, scheduler.deduplicated) == (1, 1)
+
+    def test_finished_search_is_released(self, scheduler):
+        transport = FakeJiraTransport([issue("A-1")])
+        list(config_client(transport, scheduler).search(JQL, fields=("priority",)))
+        assert scheduler._results == {}
+        list(config_client(transport, scheduler).search(JQL, fields=("priority",)))
+        assert len(transport.search_requests()) == 2
+
+
+class TestShared:
+
+    def test_kept_result_is_reused(self, scheduler):
+        calls = []
+        key = scheduler.query_key('count', API_URL, JQL)
+        assert scheduler.shared(key, lambda: calls.append(1) or 7, keep=True) == (7, True)
+        assert scheduler.shared(key, lambda: calls.append(1) or 8, keep=True) == (7, False)
+        assert len(calls) == 1
+
+    def test_failed_fetch_is_retried(self, scheduler):
+        key = scheduler.query_key('search', API_URL, JQL)
+
+        def fail():
+            raise RuntimeError("timeout")
+
+        with pytest.raises(RuntimeError):
+            scheduler.shared(key, fail, keep=True)
+        assert scheduler.shared(key, lambda: ["A-1"], keep=True) == (["A-1"], True)
+
+
+class TestRun:
+
+    def test_results_keep_the_job_order(self, scheduler):
+        jobs = {name: (delay,) for name, delay in (("slow", 0.05), ("fast", 0.0))}
+        results = scheduler.run(lambda delay: time.sleep(delay) or delay, jobs)
+        assert list(results.items()) == [("slow", 0.05), ("fast", 0.0)]
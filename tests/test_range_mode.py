@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("requests")
+
+from report_config import iter_months
+from Report__ import JiraReportGenerator
+
+RESOLVED = 'project = A AND resolutiondate >= "{{start_date}}" AND resolutiondate <= "{{end_date}}"'
+
+
+def windows(jql_template, start_date="2024-01-01", end_date="2024-03-31"):
+    months = list(iter_months(start_date, end_date))
+    return JiraReportGenerator.month_windows(jql_template, months, months[0][0], months[-1][1])
+
+
+def test_windows_follow_each_month_query():
+    field, month_windows = windows(RESOLVED)
+    assert field == "resolutiondate"
+    assert list(month_windows) == ["2024-01", "2024-02", "2024-03"]
+    assert month_windows["2024-02"] == (datetime(2024, 2, 1), datetime(2024, 2, 29, 0, 1))
+
+
+def test_date_only_upper_bound_ends_at_midnight():
+    _, month_windows = windows(RESOLVED)
+    start, end = month_windows["2024-01"]
+    # Jira reads <= "2024-01-31" as 00:00 of that day, the rest of the day is in no monthly report
+    assert start <= datetime(2024, 1, 31, 0, 0) < end
+    assert not start <= datetime(2024, 1, 31, 15, 30) < end
+    assert not any(start <= datetime(2024, 1, 31, 15, 30) < end for start, end in month_windows.values())
+
+
+def test_single_month_range():
+    _, month_windows = windows(RESOLVED, "2024-01-01", "2024-01-31")
+    assert month_windows == {"2024-01": (datetime(2024, 1, 1), datetime(2024, 1, 31, 0, 1))}
+
+
+@pytest.mark.parametrize("jql_template", [
+    'project = A',
+    'project = A AND resolutiondate >= "{{start_date}}"',
+    'project = A AND created >= "{{start_date}}" AND resolutiondate <= "{{end_date}}"',
+    'project = A AND resolutiondate >= "{{start_date}}" AND resolutiondate <= "{{end_date}}" AND updated >= "{{start_date}}"',
+    'project = A AND resolutiondate >= startOfMonth()',
+])
+def test_unbounded_or_other_date_uses_fall_back(jql_template):
+    assert windows(jql_template) is None
+
+
+def drill_down_issue(key, resolved):
+    return {'key': key, 'fields': {'project': {'key': key[0]}, 'priority': {'name': 'Blocker'}, 'summary': key,
+                                   'created': "2024-01-02T00:00:00.000+0000", 'resolutiondate': resolved}}
+
+
+@pytest.mark.parametrize("jql_template, expected", [
+    (RESOLVED, {("2024-01", "A-1"), ("2024-02", "A-3")}),
+    # Without an upper bound every month query matches every later issue, as its count does
+    ('project = A AND resolutiondate >= "{{start_date}}"',
+     {("2024-01", "A-1"), ("2024-01", "A-2"), ("2024-01", "A-3"), ("2024-02", "A-3")}),
+])
+def test_drill_down_months_follow_the_month_queries(jql_template, expected):
+    from jira_search import JiraSearchClient
+    from tests.fakes import FakeJiraTransport
+
+    api_url = "https://jira.example/rest/api/latest/search"
+    issues = [
+        drill_down_issue("A-1", "2024-01-15T10:00:00.000+0000"),
+        # After 00:00 on the last day of January, counted in no month
+        drill_down_issue("A-2", "2024-01-31T15:30:00.000+0000"),
+        drill_down_issue("A-3", "2024-02-01T00:30:00.000+0000"),
+    ]
+    generator = JiraReportGenerator(api_url, "config.json", "user", "password")
+    generator.search_client = JiraSearchClient(api_url, {}, prefetch=0, transport=FakeJiraTransport(issues))
+    data = {section: {sub_query: jql_template for sub_query in JiraReportGenerator.common_sub_queries}
+            for section in ('Regression', 'Exploratory')}
+
+    months = list(iter_months("2024-01-01", "2024-02-29"))
+    drill_down = {(month, issue['key']) for month, section, sub_query, issue in generator.iter_drill_down(data, months)
+                  if (section, sub_query) == ('Regression', 'Resolved')}
+    assert drill_down == expected
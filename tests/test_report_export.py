@@ -0,0 +1,79 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("xlsxwriter")
+openpyxl = pytest.importorskip("openpyxl")
+
+import report_export
+from report_export import WorkbookExporter, browse_url, sheet_name, COUNT_FORMAT
+
+ISSUE_URL = browse_url("https://jira.example/rest/api/latest/search")
+
+
+def issue(key, summary='Crash on "save"'):
+    return {'key': key, 'fields': {
+        'summary': summary,
+        'priority': 'Blocker',
+        'status': {'name': 'Open', 'id': '1'},
+        'created': "2024-01-05T10:00:00.000+0000",
+        'resolutiondate': None,
+    }}
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    return str(tmp_path / "export.xlsx")
+
+
+def test_browse_url():
+    assert ISSUE_URL == "https://jira.example/browse/"
+
+
+def test_sheet_name_is_cut_and_cleaned():
+    assert sheet_name("Regression: Blocker/Critical [all] issues of the year") == "Regression- Blocker-Critical -a"
+
+
+def test_frames_and_drill_downs_get_their_own_sheets(workbook_path):
+    frame = pd.DataFrame({'Blocker': [3.0, 1.0]}, index=['BugsRaised', 'Resolved'])
+    with WorkbookExporter(workbook_path, ISSUE_URL) as exporter:
+        exporter.write_frame("Summary", frame, lambda row: COUNT_FORMAT)
+        exporter.write_frame("summary", frame)
+        exporter.write_issue("Regression Blocker", "2024-01", "BugsRaised", issue("A-1"))
+
+    workbook = openpyxl.load_workbook(workbook_path)
+    # Sheet names are unique case-insensitively
+    assert workbook.sheetnames == ["Summary", "summary (2)", "Regression Blocker"]
+    summary = workbook["Summary"]
+    assert [summary.cell(row, 1).value for row in (2, 3)] == ["BugsRaised", "Resolved"]
+    assert summary.cell(2, 2).value == 3
+
+
+def test_issue_keys_link_to_jira(workbook_path):
+    with WorkbookExporter(workbook_path, ISSUE_URL) as exporter:
+        exporter.write_issue("Regression Blocker", "2024-01", "BugsRaised", issue("A-1"))
+
+    sheet = openpyxl.load_workbook(workbook_path)["Regression Blocker"]
+    assert [cell.value for cell in sheet[1]] == list(report_export.DRILL_DOWN_COLUMNS)
+    row = [cell.value for cell in sheet[2]]
+    assert row[:2] == ["2024-01", "BugsRaised"]
+    assert row[2] == '=HYPERLINK("https://jira.example/browse/A-1","A-1")'
+    # Quotes are escaped in formulas only, plain cells keep the text
+    assert row[3:6] == ['Crash on "save"', "Blocker", "Open"]
+
+
+def test_full_drill_down_sheet_continues_on_a_new_sheet(workbook_path, monkeypatch):
+    # A header row and two issues per sheet
+    monkeypatch.setattr(report_export, "MAX_SHEET_ROWS", 3)
+    with WorkbookExporter(workbook_path, ISSUE_URL) as exporter:
+        for index in range(5):
+            exporter.write_issue("Regression Blocker", "2024-01", "BugsRaised", issue("A-{}".format(index)))
+        exporter.write_issue("Exploratory Minor", "2024-01", "Resolved", issue("B-1"))
+        assert exporter.rows == 6
+
+    workbook = openpyxl.load_workbook(workbook_path)
+    assert workbook.sheetnames == ["Regression Blocker", "Regression Blocker (2)", "Regression Blocker (3)",
+                                   "Exploratory Minor"]
+    keys = [row[2].value for name in ("Regression Blocker", "Regression Blocker (2)", "Regression Blocker (3)")
+            for row in workbook[name].iter_rows(min_row=2)]
+    assert keys == ['=HYPERLINK("https://jira.example/browse/A-{0}","A-{0}")'.format(index) for index in range(5)]
+    assert workbook["Regression Blocker (3)"].cell(1, 1).value == "Month"
@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("requests")
+
+from jira_search import JiraSearchClient
+from search_snapshot import (CaptureTransport, MANIFEST_FILE, ReplayTransport, SearchSnapshot, SNAPSHOT_VERSION, SnapshotMiss,
+                             SnapshotWriter)
+from tests.fakes import FakeJiraTransport
+
+SEARCH_URL = "https://jira.example/rest/api/latest/search"
+
+
+def issue(key, day):
+    return {'key': key, 'fields': {'project': {'key': 'A'}, 'created': "2024-01-{:02d}T12:00:00.000+0000".format(day)}}
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / "snapshot")
+
+
+def capture(snapshot_path, *requests, **labels):
+    writer = SnapshotWriter(snapshot_path, **labels)
+    for method, url, params, status_code, content in requests:
+        writer.add(method, url, params, status_code, content)
+    writer.close()
+    return SearchSnapshot(snapshot_path)
+
+
+class TestRoundTrip:
+
+    def test_bodies_and_status_are_replayed(self, snapshot_path):
+        snapshot = capture(snapshot_path,
+                           ("GET", SEARCH_URL, {'jql': 'project = A', 'startAt': 0}, 200, b'{"total": 1}'),
+                           ("get", SEARCH_URL, {'jql': 'project = B', 'startAt': 0}, 400, b'{"errorMessages": ["bad"]}'))
+        response = snapshot.get("GET", SEARCH_URL, {'startAt': 0, 'jql': 'project = A'})
+        assert (response.status_code, response.json()) == (200, {'total': 1})
+        assert response.raw.read() == b'{"total": 1}'
+        assert snapshot.get("GET", SEARCH_URL, {'jql': 'project = B', 'startAt': '0'}).status_code == 400
+        assert snapshot.manifest['requests'] == 2
+        snapshot.close()
+
+    def test_hits_and_misses_are_counted(self, snapshot_path):
+        snapshot = capture(snapshot_path, ("GET", SEARCH_URL, {'jql': 'project = A'}, 200, b'{}'))
+        assert snapshot.get("GET", SEARCH_URL, {'jql': 'project = A'}) is not None
+        assert snapshot.get("GET", SEARCH_URL, {'jql': 'project = C'}) is None
+        assert snapshot.get("POST", SEARCH_URL, {'jql': 'project = A'}) is None
+        assert (snapshot.hits, snapshot.misses) == (1, 2)
+        snapshot.close()
+
+    def test_first_capture_of_a_repeated_request_is_kept(self, snapshot_path):
+        snapshot = capture(snapshot_path,
+                           ("GET", SEARCH_URL, {'jql': 'project = A'}, 200, b'{"total": 1}'),
+                           ("GET", SEARCH_URL, {'jql': 'project = A'}, 200, b'{"total": 2}'))
+        assert snapshot.get("GET", SEARCH_URL, {'jql': 'project = A'}).json() == {'total': 1}
+        assert snapshot.manifest['requests'] == 1
+        snapshot.close()
+
+    def test_labels_and_sizes_are_kept_in_the_manifest(self, snapshot_path):
+        content = b'{"issues": []}' * 100
+        snapshot = capture(snapshot_path, ("GET", SEARCH_URL, {}, 200, content), command="qmr", start_date="2024-01-01")
+        assert snapshot.labels == {'command': "qmr", 'start_date': "2024-01-01"}
+        assert snapshot.manifest['bytes'] == len(content)
+        assert snapshot.manifest['compressed_bytes'] < len(content)
+        snapshot.close()
+
+    def test_empty_snapshot(self, snapshot_path):
+        snapshot = capture(snapshot_path)
+        assert snapshot.get("GET", SEARCH_URL, {}) is None
+        snapshot.close()
+
+
+class TestInvalidSnapshot:
+
+    def test_missing_manifest(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            SearchSnapshot(str(tmp_path))
+
+    def test_other_version_is_refused(self, snapshot_path):
+        capture(snapshot_path).close()
+        manifest_path = os.path.join(snapshot_path, MANIFEST_FILE)
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        manifest['version'] = SNAPSHOT_VERSION + 1
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        with pytest.raises(ValueError):
+            SearchSnapshot(snapshot_path)
+
+
+class TestTransports:
+
+    def search(self, transport, jql_query='project = A'):
+        client = JiraSearchClient(SEARCH_URL, {}, page_size=2, prefetch=0, transport=transport)
+        return [item['key'] for item in client.search(jql_query, fields=("created",))]
+
+    def test_captured_search_is_replayed_without_jira(self, snapshot_path):
+        jira = FakeJiraTransport([issue("A-{}".format(day), day) for day in range(1, 6)])
+        capture_transport = CaptureTransport(jira, SnapshotWriter(snapshot_path, command="test"))
+        captured = self.search(capture_transport)
+        capture_transport.close()
+        sent = len(jira.requests)
+
+        replay_transport = ReplayTransport(SearchSnapshot(snapshot_path))
+        assert self.search(replay_transport) == captured == ["A-1", "A-2", "A-3", "A-4", "A-5"]
+        assert len(jira.requests) == sent
+        assert replay_transport.snapshot.hits == sent
+        replay_transport.close()
+
+    def test_uncaptured_request_raises_snapshot_miss(self, snapshot_path):
+        replay_transport = ReplayTransport(capture(snapshot_path))
+        with pytest.raises(SnapshotMiss):
+            self.search(replay_transport)
+        replay_transport.close()